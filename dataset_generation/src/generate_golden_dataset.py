@@ -7,11 +7,12 @@ from typing import List, Dict, Any
 
 import pandas as pd
 from aiohttp import ClientError
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.chat_models import BedrockChat
 
+from ingestion_pipeline.src import chunking
+
 # --- Configuration ---
 # In a real project, this would come from a config file or environment variables.
 CONFIG = {
@@ -55,13 +56,8 @@ def load_product_documents(filepath: str) -> pd.DataFrame:
         return pd.DataFrame()
 
 def chunk_document(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
-    """Splits a document's text into smaller chunks."""
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len
-    )
-    return splitter.split_text(text)
+    """Splits a document's text into smaller chunks, exactly as the ingestion pipeline does."""
+    return chunking.get_chunker(chunk_size, chunk_overlap).split(text)
 
 async def generate_queries_for_chunk(
     llm: BedrockChat,
@@ -168,6 +164,8 @@ async def main():
     logger.info(f"Dataset generation complete. Output saved to {CONFIG['OUTPUT_PATH']}")
 
 if __name__ == "__main__":
+    # Run from the repository root so the shared chunker can be imported:
+    #   python -m dataset_generation.src.generate_golden_dataset
     # Ensure AWS credentials and LangSmith env variables are set before running
     # e.g., export LANGCHAIN_TRACING_V2=true; export LANGCHAIN_API_KEY=...
     asyncio.run(main())
\ No newline at end of file
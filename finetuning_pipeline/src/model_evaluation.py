@@ -0,0 +1,239 @@
+"""
+Offline retrieval evaluation over the golden dataset written by
+dataset_generation (one {"query", "relevant_product_id", "source_chunk_id"}
+record per line).
+
+Every golden query goes through a pluggable retriever in batches. The ranked
+product IDs become a boolean hits matrix (queries x rank), and recall@k, MRR and
+NDCG@k are computed on that matrix with NumPy. Query encoding for one batch
+overlaps with the similarity search of the previous ones, which runs on a
+thread pool (the matrix products release the GIL), so all cores are busy.
+
+Run by the fine-tuning DAG's evaluation step; the summary it writes is what
+`check_evaluation_result` reads:
+    python -m src.model_evaluation --golden golden_evaluation_dataset.jsonl --products products.jsonl \\
+        --candidate-model /opt/ml/processing/model --baseline-model intfloat/multilingual-e5-large \\
+        --output /opt/ml/processing/evaluation/evaluation.json
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Protocol, Sequence
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_KS = (1, 5, 10, 20)
+
+
+@dataclass
+class GoldenDataset:
+    queries: List[str]
+    relevant_product_ids: List[str]
+
+
+def load_golden_dataset(path: str) -> GoldenDataset:
+    queries, relevant = [], []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                queries.append(record["query"])
+                relevant.append(str(record["relevant_product_id"]))
+    return GoldenDataset(queries, relevant)
+
+
+class Retriever(Protocol):
+    def retrieve_batch(self, queries: Sequence[str], k: int) -> List[List[str]]:
+        """Ranked product IDs (best first, at most k) for each query."""
+        ...
+
+
+@dataclass
+class StageTimings:
+    """Wall-clock seconds spent per stage, summed over batches."""
+    seconds: Dict[str, float] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, stage: str, elapsed_s: float):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed_s
+
+
+class EmbeddingRetriever:
+    """
+    Exact top-k search of query embeddings against a corpus of document
+    embeddings (one row per product or per chunk; chunks of the same product
+    collapse into one result). `encode_fn` maps a list of texts to a 2-D array,
+    e.g. SentenceTransformer.encode.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], doc_embeddings: np.ndarray,
+                 doc_product_ids: Sequence[str], batch_size: int = 256, workers: Optional[int] = None,
+                 query_prefix: str = ""):
+        self.encode_fn = encode_fn
+        self.doc_embeddings = _normalize(np.asarray(doc_embeddings, dtype=np.float32))
+        self.doc_product_ids = np.asarray(doc_product_ids)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.query_prefix = query_prefix
+        self.timings = StageTimings()
+        # Enough extra rows that k distinct products survive chunk de-duplication.
+        _, counts = np.unique(self.doc_product_ids, return_counts=True)
+        self._overfetch = int(counts.max()) if len(counts) else 1
+
+    def _search(self, query_embeddings: np.ndarray, k: int) -> List[List[str]]:
+        started = time.perf_counter()
+        scores = _normalize(query_embeddings.astype(np.float32, copy=False)) @ self.doc_embeddings.T
+        n = min(k * self._overfetch, scores.shape[1])
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        order = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+        results = []
+        for row in self.doc_product_ids[order]:
+            seen = dict.fromkeys(row.tolist())  # keeps first (best) occurrence of each product
+            results.append(list(seen)[:k])
+        self.timings.add("search", time.perf_counter() - started)
+        return results
+
+    def retrieve_batch(self, queries: Sequence[str], k: int) -> List[List[str]]:
+        futures = []
+        with ThreadPoolExecutor(self.workers) as pool:
+            for start in range(0, len(queries), self.batch_size):
+                started = time.perf_counter()
+                batch = [self.query_prefix + query for query in queries[start:start + self.batch_size]]
+                embeddings = np.asarray(self.encode_fn(batch))
+                self.timings.add("embed_queries", time.perf_counter() - started)
+                futures.append(pool.submit(self._search, embeddings, k))
+            return [ids for future in futures for ids in future.result()]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def hits_matrix(retrieved: Sequence[Sequence[str]], relevant: Sequence[str], k: int) -> np.ndarray:
+    """Boolean (n_queries, k) matrix: hits[i, r] is True if rank r of query i is its relevant product."""
+    padded = np.full((len(retrieved), k), "", dtype=object)
+    for i, ids in enumerate(retrieved):
+        padded[i, :min(k, len(ids))] = ids[:k]
+    return padded == np.asarray(relevant, dtype=object)[:, None]
+
+
+def retrieval_metrics(hits: np.ndarray, ks: Sequence[int] = DEFAULT_KS) -> Dict[str, float]:
+    """recall@k, NDCG@k (binary relevance, one relevant product per query) and MRR from a hits matrix."""
+    if hits.shape[0] == 0:
+        return {}
+    discounts = 1.0 / np.log2(np.arange(2, hits.shape[1] + 2))
+    found = hits.any(axis=1)
+    first_rank = np.where(found, hits.argmax(axis=1) + 1, np.inf)
+    metrics = {"mrr": float(np.mean(1.0 / first_rank))}
+    for k in ks:
+        k = min(k, hits.shape[1])
+        metrics[f"recall@{k}"] = float(hits[:, :k].any(axis=1).mean())
+        # With a single relevant item the ideal DCG is 1.
+        metrics[f"ndcg@{k}"] = float((hits[:, :k] * discounts[:k]).sum(axis=1).mean())
+    return metrics
+
+
+def evaluate_retriever(retriever: Retriever, dataset: GoldenDataset, ks: Sequence[int] = DEFAULT_KS) -> Dict:
+    """Runs every golden query through `retriever`; returns the metrics and per-stage latency."""
+    k = max(ks)
+    started = time.perf_counter()
+    retrieved = retriever.retrieve_batch(dataset.queries, k)
+    retrieval_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    metrics = retrieval_metrics(hits_matrix(retrieved, dataset.relevant_product_ids, k), ks)
+    metrics_s = time.perf_counter() - started
+
+    n = max(len(dataset.queries), 1)
+    stages = dict(getattr(getattr(retriever, "timings", None), "seconds", {}))
+    stages.update({"retrieval_total": retrieval_s, "metrics": metrics_s})
+    return {
+        "queries": len(dataset.queries),
+        "metrics": metrics,
+        "stage_seconds": stages,
+        "ms_per_query": {stage: seconds / n * 1000 for stage, seconds in stages.items()},
+        "queries_per_second": len(dataset.queries) / retrieval_s if retrieval_s else 0.0,
+    }
+
+
+def evaluation_summary(candidate: Dict, baseline: Optional[Dict] = None, primary_metric: str = "ndcg@10",
+                       min_improvement: float = 0.0) -> Dict:
+    """
+    Quality gate for the fine-tuning DAG: 'pass' when the candidate beats the
+    baseline on `primary_metric` by at least `min_improvement` (or, without a
+    baseline, whenever it was evaluated).
+    """
+    candidate_score = candidate["metrics"].get(primary_metric, 0.0)
+    baseline_score = baseline["metrics"].get(primary_metric, 0.0) if baseline else None
+    passed = baseline_score is None or candidate_score >= baseline_score + min_improvement
+    return {
+        "status": "pass" if passed else "fail",
+        "primary_metric": primary_metric,
+        "candidate": candidate_score,
+        "baseline": baseline_score,
+        "candidate_metrics": candidate["metrics"],
+        "baseline_metrics": baseline["metrics"] if baseline else None,
+        "candidate_ms_per_query": candidate["ms_per_query"],
+    }
+
+
+def _model_retriever(model_name: str, product_ids: List[str], descriptions: List[str], batch_size: int):
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    # e5 models expect "query: " / "passage: " prefixes.
+    e5 = "e5" in model_name.lower()
+    passages = [("passage: " if e5 else "") + text for text in descriptions]
+    started = time.perf_counter()
+    doc_embeddings = model.encode(passages, batch_size=batch_size, normalize_embeddings=True)
+    logger.info(f"Encoded {len(passages)} products with {model_name} in {time.perf_counter() - started:.1f}s.")
+    retriever = EmbeddingRetriever(lambda texts: model.encode(texts, batch_size=batch_size, normalize_embeddings=True),
+                                   doc_embeddings, product_ids, batch_size=batch_size,
+                                   query_prefix="query: " if e5 else "")
+    return retriever
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality on the golden dataset.")
+    parser.add_argument("--golden", required=True)
+    parser.add_argument("--products", required=True, help="JSONL with product_id and description")
+    parser.add_argument("--candidate-model", required=True)
+    parser.add_argument("--baseline-model")
+    parser.add_argument("--primary-metric", default="ndcg@10")
+    parser.add_argument("--min-improvement", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--output", default="evaluation.json")
+    args = parser.parse_args()
+
+    dataset = load_golden_dataset(args.golden)
+    with open(args.products) as f:
+        products = [json.loads(line) for line in f if line.strip()]
+    product_ids = [str(p["product_id"]) for p in products]
+    descriptions = [p["description"] for p in products]
+
+    results = {}
+    for role, model_name in (("candidate", args.candidate_model), ("baseline", args.baseline_model)):
+        if model_name:
+            retriever = _model_retriever(model_name, product_ids, descriptions, args.batch_size)
+            results[role] = evaluate_retriever(retriever, dataset)
+            logger.info(f"{role} ({model_name}): {json.dumps(results[role]['metrics'])}")
+
+    summary = evaluation_summary(results["candidate"], results.get("baseline"), args.primary_metric,
+                                 args.min_improvement)
+    with open(args.output, "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Evaluation {summary['status']}: {args.primary_metric} {summary['candidate']:.4f} "
+                f"vs baseline {summary['baseline']}.")
+
+
+if __name__ == "__main__":
+    main()
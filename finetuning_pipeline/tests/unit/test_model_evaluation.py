@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from src import model_evaluation
+from src.model_evaluation import EmbeddingRetriever, GoldenDataset, evaluation_summary, hits_matrix, retrieval_metrics
+
+def test_metrics_from_hits_matrix():
+    retrieved = [["a", "b", "c"], ["x", "a", "b"], ["c", "x", "y"]]
+    hits = hits_matrix(retrieved, ["a", "a", "a"], k=3)
+    metrics = retrieval_metrics(hits, ks=(1, 3))
+
+    assert metrics["recall@1"] == pytest.approx(1 / 3)
+    assert metrics["recall@3"] == pytest.approx(2 / 3)
+    assert metrics["mrr"] == pytest.approx((1 + 1 / 2 + 0) / 3)
+    assert metrics["ndcg@3"] == pytest.approx((1 + 1 / np.log2(3)) / 3)
+
+def test_embedding_retriever_collapses_chunks_and_batches_queries():
+    doc_embeddings = np.array([[1, 0, 0], [0.9, 0.1, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32)
+    doc_product_ids = ["p1", "p1", "p2", "p3"]  # two chunks of p1
+    vectors = {"shoes": [1, 0.05, 0], "jacket": [0, 1, 0.2], "scarf": [0.1, 0, 1]}
+    batches = []
+
+    def encode(texts):
+        batches.append(len(texts))
+        return np.array([vectors[text] for text in texts])
+
+    retriever = EmbeddingRetriever(encode, doc_embeddings, doc_product_ids, batch_size=2, workers=2)
+    dataset = GoldenDataset(["shoes", "jacket", "scarf"], ["p1", "p2", "p1"])
+    report = model_evaluation.evaluate_retriever(retriever, dataset, ks=(1, 2))
+
+    assert batches == [2, 1]
+    assert retriever.retrieve_batch(["shoes"], 3) == [["p1", "p2", "p3"]]
+    assert report["metrics"]["recall@1"] == pytest.approx(2 / 3)
+    assert {"embed_queries", "search", "metrics"} <= set(report["stage_seconds"])
+
+def test_evaluation_summary_gates_on_the_primary_metric():
+    candidate = {"metrics": {"ndcg@10": 0.62}, "ms_per_query": {}}
+    baseline = {"metrics": {"ndcg@10": 0.60}, "ms_per_query": {}}
+    assert evaluation_summary(candidate, baseline)["status"] == "pass"
+    assert evaluation_summary(candidate, baseline, min_improvement=0.05)["status"] == "fail"
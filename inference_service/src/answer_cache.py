@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Awaitable, Callable, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .query_keys import normalize_query, query_digest
+
+logger = logging.getLogger(__name__)
+
+# Redis key layout. The ingestion pipeline's cache_invalidation module relies on
+# the same layout to drop answers that cite a reindexed product.
+KEY_PREFIX = "answer-cache"
+
+
+def answer_key(query: str, bucket: Optional[str] = None) -> str:
+    return _key_for_digest(query_digest(query), bucket)
+
+
+def _key_for_digest(digest: str, bucket: Optional[str] = None) -> str:
+    return f"{KEY_PREFIX}:q:{digest}" if bucket is None else f"{KEY_PREFIX}:q:{bucket}:{digest}"
+
+
+def product_key(product_id: str) -> str:
+    return f"{KEY_PREFIX}:product:{product_id}"
+
+
+@dataclass
+class CachedAnswer:
+    tokens: List[str]
+    product_ids: List[str] = field(default_factory=list)
+
+    def to_json(self) -> str:
+        return json.dumps({"tokens": self.tokens, "product_ids": self.product_ids})
+
+    @classmethod
+    def from_json(cls, raw) -> "CachedAnswer":
+        data = json.loads(raw)
+        return cls(tokens=data["tokens"], product_ids=data.get("product_ids", []))
+
+
+class LRUTier:
+    """In-process tier. Kept small and short-lived, since other tasks cannot invalidate it."""
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedAnswer]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, answer = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def set(self, key: str, answer: CachedAnswer):
+        self._entries[key] = (time.monotonic() + self.ttl_s, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_products(self, product_ids: Iterable[str]) -> List[str]:
+        product_ids = set(product_ids)
+        stale = [key for key, (_, answer) in self._entries.items() if product_ids.intersection(answer.product_ids)]
+        for key in stale:
+            del self._entries[key]
+        return stale
+
+
+class RedisTier:
+    """Shared tier across all tasks. Each product keeps a set of the answer keys that cite it."""
+
+    def __init__(self, client, ttl_s: int = 3600):
+        self.client = client
+        self.ttl_s = int(ttl_s)
+
+    async def get(self, key: str) -> Optional[CachedAnswer]:
+        raw = await self.client.get(key)
+        return CachedAnswer.from_json(raw) if raw is not None else None
+
+    async def set(self, key: str, answer: CachedAnswer):
+        await self.client.set(key, answer.to_json(), ex=self.ttl_s)
+        for product_id in answer.product_ids:
+            await self.client.sadd(product_key(product_id), key)
+            await self.client.expire(product_key(product_id), self.ttl_s)
+
+    async def invalidate_products(self, product_ids: Iterable[str]) -> List[str]:
+        stale = []
+        for product_id in product_ids:
+            members = await self.client.smembers(product_key(product_id))
+            stale.extend(m.decode("utf-8") if isinstance(m, bytes) else m for m in members)
+            await self.client.delete(product_key(product_id))
+        if stale:
+            await self.client.delete(*stale)
+        return stale
+
+
+class SemanticIndex:
+    """
+    Finds a cached query whose embedding is within `threshold` cosine similarity of
+    a new one. Entries are query digests, so one index serves every personalization bucket.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 10000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._keys: List[Optional[str]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._next_slot = 0
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, key: str, embedding: Sequence[float]):
+        vector = self._unit(embedding)
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._keys = [None] * self.max_entries
+        # Ring buffer: once full, the oldest entry is overwritten.
+        slot = self._next_slot % self.max_entries
+        self._matrix[slot] = vector
+        self._keys[slot] = key
+        self._next_slot += 1
+
+    def nearest(self, embedding: Sequence[float]) -> Optional[str]:
+        if self._matrix is None:
+            return None
+        filled = min(self._next_slot, self.max_entries)
+        similarities = self._matrix[:filled] @ self._unit(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold and self._keys[best] is not None:
+            return self._keys[best]
+        return None
+
+    def remove(self, keys: Iterable[str]):
+        keys = set(keys)
+        for slot, key in enumerate(self._keys):
+            if key in keys:
+                self._keys[slot] = None
+                self._matrix[slot] = 0.0
+
+
+class AnswerCache:
+    """
+    Multi-tier cache of generated answers, keyed by normalized query.
+    Lookups go local LRU -> Redis -> (optionally) semantic nearest neighbour.
+
+    Answers are keyed by query alone unless a personalization `bucket` is given,
+    so by default a cached answer is served to every user who asks the same
+    question; pass the caller's bucket to keep personalised answers apart.
+    The semantic tier embeds the raw query, which takes a model call, so it is
+    looked up separately (`get_similar`) and can be given its own time budget.
+    """
+
+    def __init__(self, redis_client=None, ttl_s: int = 3600, local_max_entries: int = 1024,
+                 local_ttl_s: float = 60.0, embed_fn: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+                 semantic_threshold: float = 0.95, semantic_max_entries: int = 10000):
+        self.local = LRUTier(local_max_entries, local_ttl_s)
+        self.redis = RedisTier(redis_client, ttl_s) if redis_client is not None else None
+        self.embed_fn = embed_fn
+        self.semantic = SemanticIndex(semantic_threshold, semantic_max_entries) if embed_fn else None
+        # Embeddings computed on a miss, reused when the answer is stored moments later.
+        self._recent_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.hits = {"local": 0, "redis": 0, "semantic": 0}
+        self.misses = 0
+
+    async def _lookup(self, key: str) -> Optional[CachedAnswer]:
+        answer = self.local.get(key)
+        if answer is not None:
+            self.hits["local"] += 1
+            return answer
+        if self.redis is not None:
+            answer = await self.redis.get(key)
+            if answer is not None:
+                self.hits["redis"] += 1
+                self.local.set(key, answer)
+                return answer
+        return None
+
+    async def _embed(self, query: str) -> List[float]:
+        normalized = normalize_query(query)
+        embedding = self._recent_embeddings.pop(normalized, None)
+        if embedding is None:
+            embedding = await self.embed_fn(normalized)
+        self._recent_embeddings[normalized] = embedding
+        if len(self._recent_embeddings) > 256:
+            self._recent_embeddings.popitem(last=False)
+        return embedding
+
+    async def get(self, query: str, bucket: Optional[str] = None, semantic: bool = True) -> Optional[List[str]]:
+        """Returns the cached answer tokens for `query`, or None on a miss."""
+        answer = await self._lookup(answer_key(query, bucket))
+        if answer is None and semantic:
+            return await self.get_similar(query, bucket)
+        if answer is None:
+            self.misses += 1
+            return None
+        return answer.tokens
+
+    async def get_similar(self, query: str, bucket: Optional[str] = None) -> Optional[List[str]]:
+        """Semantic tier only: the answer to a cached query close enough to `query`."""
+        answer = None
+        if self.semantic is not None:
+            similar_digest = self.semantic.nearest(await self._embed(query))
+            if similar_digest is not None:
+                answer = await self._lookup(_key_for_digest(similar_digest, bucket))
+                if answer is not None:
+                    self.hits["semantic"] += 1
+        if answer is None:
+            self.misses += 1
+            return None
+        return answer.tokens
+
+    async def set(self, query: str, tokens: List[str], product_ids: Iterable[str] = (), bucket: Optional[str] = None):
+        key = answer_key(query, bucket)
+        answer = CachedAnswer(tokens=list(tokens), product_ids=sorted(set(product_ids)))
+        self.local.set(key, answer)
+        if self.redis is not None:
+            await self.redis.set(key, answer)
+        if self.semantic is not None:
+            self.semantic.add(query_digest(query), await self._embed(query))
+
+    async def invalidate_products(self, product_ids: Iterable[str]) -> int:
+        """Drops every cached answer that cites one of `product_ids`."""
+        product_ids = list(product_ids)
+        stale = set(self.local.invalidate_products(product_ids))
+        if self.redis is not None:
+            stale.update(await self.redis.invalidate_products(product_ids))
+        if self.semantic is not None:
+            self.semantic.remove(key.rsplit(":", 1)[-1] for key in stale)
+        logger.info(f"Invalidated {len(stale)} cached answers for {len(product_ids)} products.")
+        return len(stale)
+
+
+async def replay(tokens: List[str]) -> AsyncGenerator[str, None]:
+    """Streams a cached answer token by token, yielding to the event loop between tokens."""
+    for token in tokens:
+        yield token
+        await asyncio.sleep(0)
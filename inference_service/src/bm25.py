@@ -0,0 +1,52 @@
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .vector_index import top_k_indices
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25. Each term's postings hold the per-document BM25 weight
+    precomputed at build time, so a query is a handful of scatter-adds.
+    """
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.n_docs = len(texts)
+        tokenized = [tokenize(text) for text in texts]
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+        avg_length = float(lengths.mean()) if self.n_docs else 0.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, tokens in enumerate(tokenized):
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc_id, tf))
+
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, entries in postings.items():
+            doc_ids = np.array([doc_id for doc_id, _ in entries], dtype=np.int64)
+            tf = np.array([tf for _, tf in entries], dtype=np.float32)
+            idf = np.log(1.0 + (self.n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = k1 * (1.0 - b + b * lengths[doc_ids] / max(avg_length, 1e-9))
+            self._postings[term] = (doc_ids, (idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32))
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (doc ids, BM25 scores) of the top-k matching documents, best first."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self._postings:
+                doc_ids, weights = self._postings[term]
+                scores[doc_ids] += weights
+        matched = np.flatnonzero(scores)
+        if matched.shape[0] == 0:
+            return matched, scores[matched]
+        top = matched[top_k_indices(scores[matched], k)]
+        return top, scores[top]
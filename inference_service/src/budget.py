@@ -0,0 +1,120 @@
+import asyncio
+import inspect
+import logging
+import time
+from dataclasses import dataclass, fields
+from typing import Any, Awaitable, Dict, Optional
+
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Sentinel meaning "re-raise on timeout" for StageTimer.run
+_RAISE = object()
+
+# Stages whose fallback does not change the answer itself
+_NON_DEGRADING_STAGES = {"answer_cache", "semantic_cache"}
+
+
+@dataclass(frozen=True)
+class LatencyBudget:
+    """Per-stage deadlines (in seconds) for the RAG pipeline.
+
+    `total_budget_s` is the overall SLA for everything up to the first generated
+    token; each stage is bounded by the smaller of its own timeout and whatever is
+    left of the total. A value of None disables that limit.
+    """
+    answer_cache_timeout_s: Optional[float] = 0.05
+    # The semantic tier embeds the query, so it gets its own, longer deadline and
+    # races the pipeline rather than running in front of it.
+    semantic_cache_timeout_s: Optional[float] = 0.3
+    guardrails_timeout_s: Optional[float] = None
+    query_transform_timeout_s: Optional[float] = 0.8
+    retrieval_timeout_s: Optional[float] = 1.0
+    rerank_timeout_s: Optional[float] = 0.6
+    total_budget_s: Optional[float] = 2.5
+    fallback_top_k: int = 5
+
+    @classmethod
+    def from_settings(cls, settings) -> "LatencyBudget":
+        """Builds a budget from Settings, keeping the defaults for unset fields."""
+        defaults = cls()
+        return cls(**{
+            f.name: getattr(settings, f.name, getattr(defaults, f.name))
+            for f in fields(cls)
+        })
+
+
+class StageTimer:
+    """Runs pipeline stages under a LatencyBudget and records what each one spent."""
+
+    def __init__(self, budget: LatencyBudget):
+        self.budget = budget
+        self.started_at = time.perf_counter()
+        self.spend_ms: Dict[str, float] = {}
+        self.outcomes: Dict[str, str] = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left in the overall budget, or None if it is unbounded."""
+        if self.budget.total_budget_s is None:
+            return None
+        return self.budget.total_budget_s - self.elapsed()
+
+    def record(self, stage: str, started_at: float, outcome: str = "ok"):
+        self.spend_ms[stage] = round((time.perf_counter() - started_at) * 1000, 2)
+        self.outcomes[stage] = outcome
+
+    async def run(self, stage: str, aw: Awaitable, timeout: Optional[float] = None, fallback: Any = _RAISE):
+        """
+        Awaits `aw` within min(timeout, remaining budget).
+        On timeout the stage is cancelled and `fallback` is returned; if no
+        fallback was given, asyncio.TimeoutError is raised instead.
+        """
+        limits = [t for t in (timeout, self.remaining()) if t is not None]
+        limit = min(limits) if limits else None
+        started_at = time.perf_counter()
+
+        if limit is not None and limit <= 0:
+            # The budget is already gone; don't start work we would throw away.
+            if inspect.iscoroutine(aw):
+                aw.close()
+            elif isinstance(aw, asyncio.Future):
+                aw.cancel()
+            return self._timed_out(stage, started_at, fallback, outcome="skipped")
+
+        with span(stage) as stage_span:
+            try:
+                result = await asyncio.wait_for(aw, timeout=limit)
+            except asyncio.TimeoutError:
+                stage_span.set("outcome", "timeout")
+                return self._timed_out(stage, started_at, fallback, outcome="timeout")
+        self.record(stage, started_at)
+        return result
+
+    def _timed_out(self, stage: str, started_at: float, fallback: Any, outcome: str):
+        if fallback is _RAISE:
+            self.record(stage, started_at, outcome)
+            raise asyncio.TimeoutError(f"Stage '{stage}' exceeded its latency budget.")
+        self.record(stage, started_at, f"{outcome}_fallback")
+        logger.warning(f"Stage '{stage}' {outcome} after {self.spend_ms[stage]}ms; using degraded fallback.")
+        return fallback
+
+    @property
+    def degraded(self) -> bool:
+        """True if any stage that shapes the answer timed out or was skipped."""
+        return any(
+            outcome != "ok" for stage, outcome in self.outcomes.items()
+            if stage not in _NON_DEGRADING_STAGES
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "total_ms": round(self.elapsed() * 1000, 2),
+            "stages": {
+                stage: {"ms": ms, "outcome": self.outcomes[stage]}
+                for stage, ms in self.spend_ms.items()
+            },
+        }
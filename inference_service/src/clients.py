@@ -0,0 +1,174 @@
+"""
+Process-wide clients for the API.
+
+Blocking clients (boto3) are shared by every thread and created once under a
+lock. Asyncio clients (Redis) hold connections bound to the event loop that
+opened them, so they are shared per loop instead. That matters for tests and
+anything else that runs more than one loop in a process. Redis and OpenSearch
+clients are created without awaiting, so no coroutine can observe a half-built
+client; aiobotocore clients (optional dependency) are entered under a per-loop
+asyncio lock. `warm_up()` runs from the FastAPI startup event so the first
+request does not pay for endpoint resolution, credential lookup or connection
+setup, and `close_async_clients()` from the shutdown event.
+"""
+import asyncio
+import contextlib
+import logging
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import boto3
+import redis.asyncio as aioredis
+from botocore.config import Config
+from opensearchpy import AWSV4SignerAsyncAuth, AsyncHttpConnection, AsyncOpenSearch
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session as get_aio_session
+except ImportError:
+    AioConfig = get_aio_session = None
+
+HAS_AIOBOTOCORE = get_aio_session is not None
+
+logger = logging.getLogger(__name__)
+
+BOTO_CONFIG = Config(
+    max_pool_connections=100,
+    connect_timeout=1,
+    read_timeout=30,
+    tcp_keepalive=True,
+    # Request paths have their own latency budgets; don't stack long SDK retries on top.
+    retries={"max_attempts": 2, "mode": "standard"},
+)
+
+_lock = threading.RLock()
+_clients: Dict[Tuple, Any] = {}
+_session: Optional[boto3.Session] = None
+
+
+class _LoopClients:
+    """Async clients of one event loop, plus the exit stack that closes them."""
+
+    def __init__(self):
+        self.clients: Dict[Tuple, Any] = {}
+        self.lock = asyncio.Lock()
+        self.exit_stack = contextlib.AsyncExitStack()
+
+
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClients]" = weakref.WeakKeyDictionary()
+
+
+def get_session() -> boto3.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.Session()
+        return _session
+
+
+def _get_or_create(key: Tuple, factory: Callable[[], Any]):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = factory()
+    return client
+
+
+def get_boto3_client(service: str, region_name: Optional[str] = None):
+    return _get_or_create(("boto3", service, region_name),
+                          lambda: get_session().client(service, region_name=region_name, config=BOTO_CONFIG))
+
+
+def get_bedrock_runtime_client():
+    return get_boto3_client("bedrock-runtime")
+
+
+def get_sagemaker_runtime_client():
+    return get_boto3_client("sagemaker-runtime")
+
+
+def _for_running_loop() -> _LoopClients:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        return _loop_clients.setdefault(loop, _LoopClients())
+
+
+def get_async_redis(host: str, port: int = 6379, max_connections: int = 200) -> aioredis.Redis:
+    """Redis client for the running event loop (one connection pool per loop)."""
+    state = _for_running_loop()
+    key = ("redis", host, port)
+    client = state.clients.get(key)
+    if client is None:
+        client = state.clients[key] = aioredis.Redis(
+            host=host, port=port, max_connections=max_connections, socket_connect_timeout=1,
+            socket_timeout=1, socket_keepalive=True, health_check_interval=30,
+        )
+        state.exit_stack.push_async_callback(client.aclose)
+    return client
+
+
+def get_async_opensearch_client(host: str, region: str, pool_maxsize: int = 100) -> AsyncOpenSearch:
+    """Signed AsyncOpenSearch client for the running event loop."""
+    state = _for_running_loop()
+    key = ("opensearch", host, region, pool_maxsize)
+    client = state.clients.get(key)
+    if client is None:
+        auth = AWSV4SignerAsyncAuth(get_session().get_credentials(), region, "aoss")
+        client = state.clients[key] = AsyncOpenSearch(
+            hosts=[{"host": host, "port": 443}], http_auth=auth, use_ssl=True, verify_certs=True,
+            connection_class=AsyncHttpConnection, pool_maxsize=pool_maxsize, timeout=5,
+        )
+        state.exit_stack.push_async_callback(client.close)
+    return client
+
+
+async def get_async_boto3_client(service: str):
+    """aiobotocore client for the running event loop (requires aiobotocore)."""
+    if not HAS_AIOBOTOCORE:
+        raise ImportError("Async AWS clients need aiobotocore: pip install aiobotocore")
+    state = _for_running_loop()
+    key = ("aiobotocore", service)
+    if key not in state.clients:
+        async with state.lock:
+            if key not in state.clients:
+                config = AioConfig(max_pool_connections=100, connect_timeout=1, read_timeout=30, tcp_keepalive=True,
+                                   retries={"max_attempts": 2, "mode": "standard"})
+                state.clients[key] = await state.exit_stack.enter_async_context(
+                    get_aio_session().create_client(service, config=config))
+    return state.clients[key]
+
+
+async def close_async_clients():
+    """Closes the running loop's async clients."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        state = _loop_clients.pop(loop, None)
+    if state is not None:
+        await state.exit_stack.aclose()
+
+
+async def warm_up(settings):
+    """Creates the shared clients and opens a Redis connection. Never raises: failures are retried on first use."""
+    try:
+        await asyncio.to_thread(lambda: get_session().get_credentials())
+        await asyncio.to_thread(get_bedrock_runtime_client)
+        await asyncio.to_thread(get_sagemaker_runtime_client)
+        if HAS_AIOBOTOCORE and getattr(settings, "retriever_backend", None) == "opensearch_async":
+            await get_async_boto3_client("bedrock-runtime")
+        redis_host = getattr(settings, "redis_host", None)
+        if redis_host:
+            await asyncio.wait_for(get_async_redis(redis_host).ping(), timeout=2)
+    except Exception as e:
+        logger.warning(f"Client warm-up failed: {e}")
+
+
+def reset():
+    """Drops all cached clients (tests)."""
+    global _session
+    with _lock:
+        _clients.clear()
+        _loop_clients.clear()
+        _session = None
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One in-progress upstream stream and the tokens it has produced so far."""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    def publish(self, token: Optional[str] = None):
+        if token is not None:
+            self.tokens.append(token)
+        # Wake everyone waiting on the current event and start a fresh one.
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """Replays the tokens produced so far, then follows the live stream."""
+        index = 0
+        while True:
+            updated = self._updated
+            while index < len(self.tokens):
+                yield self.tokens[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await updated.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical streams: the first caller for a key starts the
+    upstream stream, later callers join it and receive every token, including the
+    ones emitted before they joined. The upstream is cancelled once no one listens.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.joined = 0
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def stream(self, key: Hashable, stream_factory: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._pump(key, flight, stream_factory()))
+            self.started += 1
+        else:
+            self.joined += 1
+        flight.subscribers += 1
+        try:
+            async for token in flight.subscribe():
+                yield token
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                logger.info(f"All subscribers left; cancelling upstream stream for {key!r}.")
+                # Unregister first: a request arriving before the cancellation lands
+                # must start a fresh flight, not join one that is about to fail.
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    async def _pump(self, key: Hashable, flight: _Flight, upstream: AsyncIterator[str]):
+        try:
+            async for token in upstream:
+                flight.publish(token)
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            # New requests for this key start a fresh flight from here on.
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.done = True
+            flight.publish()
+            if hasattr(upstream, "aclose"):
+                await upstream.aclose()
@@ -0,0 +1,188 @@
+"""Deterministic in-process stand-ins for the service's external dependencies, used in tests."""
+import asyncio
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Set, Tuple
+
+
+class LatencyDistribution:
+    """
+    Log-normal latency with the given median and p99, drawn from a seeded RNG so
+    benchmark runs are repeatable. p99 == median (or None) gives a constant.
+    """
+
+    def __init__(self, median_s: float, p99_s: Optional[float] = None, seed: int = 0):
+        self.median_s = median_s
+        p99_s = p99_s if p99_s is not None else median_s
+        # z(0.99) = 2.326
+        self.sigma = math.log(p99_s / median_s) / 2.326 if median_s > 0 and p99_s > median_s else 0.0
+        self._rng = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.median_s <= 0:
+            return 0.0
+        return self.median_s * math.exp(self._rng.gauss(0.0, self.sigma)) if self.sigma else self.median_s
+
+    async def wait(self):
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_NO_LATENCY = LatencyDistribution(0.0)
+
+
+class FakeRedis:
+    """Implements the subset of the `redis.asyncio.Redis` API used by the service, with TTL support."""
+
+    def __init__(self, latency: Optional[LatencyDistribution] = None):
+        self._values: Dict[str, Tuple[object, Optional[float]]] = {}
+        self.latency = latency or _NO_LATENCY
+
+    def _live(self, name: str):
+        entry = self._values.get(name)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._values[name]
+            return None
+        return value
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+    async def get(self, name: str) -> Optional[bytes]:
+        await self.latency.wait()
+        return self._live(name)
+
+    async def set(self, name: str, value, ex: Optional[float] = None) -> bool:
+        await self.latency.wait()
+        expires_at = time.monotonic() + ex if ex else None
+        self._values[name] = (self._encode(value), expires_at)
+        return True
+
+    async def delete(self, *names: str) -> int:
+        await self.latency.wait()
+        removed = 0
+        for name in names:
+            if self._live(name) is not None:
+                removed += 1
+            self._values.pop(name, None)
+        return removed
+
+    async def expire(self, name: str, seconds: float) -> bool:
+        await self.latency.wait()
+        value = self._live(name)
+        if value is None:
+            return False
+        self._values[name] = (value, time.monotonic() + seconds)
+        return True
+
+    async def sadd(self, name: str, *values) -> int:
+        await self.latency.wait()
+        members: Set[bytes] = self._live(name) or set()
+        before = len(members)
+        members.update(self._encode(v) for v in values)
+        expires_at = self._values[name][1] if name in self._values else None
+        self._values[name] = (members, expires_at)
+        return len(members) - before
+
+    async def smembers(self, name: str) -> Set[bytes]:
+        await self.latency.wait()
+        return set(self._live(name) or set())
+
+
+class FakeRerankerEndpoint:
+    """
+    Stands in for a `sagemaker-runtime` client serving a cross-encoder. Scores are
+    the fraction of query words found in the passage. Each call costs a fixed
+    overhead plus a per-pair cost, like a GPU endpoint, and is recorded.
+    """
+
+    def __init__(self, overhead_s: float = 0.0, per_pair_s: float = 0.0):
+        self.overhead_s = overhead_s
+        self.per_pair_s = per_pair_s
+        self.batch_sizes: List[int] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def score_pair(query: str, passage: str) -> float:
+        words = set(re.findall(r"\w+", query.lower()))
+        return len(words & set(re.findall(r"\w+", passage.lower()))) / len(words) if words else 0.0
+
+    def invoke_endpoint(self, EndpointName: str, Body, ContentType: str = "application/json", **kwargs) -> dict:
+        inputs = json.loads(Body)["inputs"]
+        with self._lock:
+            self.batch_sizes.append(len(inputs))
+        time.sleep(self.overhead_s + self.per_pair_s * len(inputs))
+        predictions = [{"label": "LABEL_0", "score": self.score_pair(p["text"], p["text_pair"])} for p in inputs]
+        return {"Body": io.BytesIO(json.dumps(predictions).encode("utf-8"))}
+
+
+class FakeRetriever:
+    """Returns `top_k` of a fixed catalogue, in an order that depends on the query, after a sampled delay."""
+
+    def __init__(self, documents: List[dict], latency: Optional[LatencyDistribution] = None, dim: int = 8):
+        self.documents = documents
+        self.latency = latency or _NO_LATENCY
+        self.dim = dim
+
+    async def retrieve(self, query: str, top_k: int = 50) -> List[dict]:
+        await self.latency.wait()
+        offset = int(hashlib.sha1(query.encode("utf-8")).hexdigest(), 16) % max(len(self.documents), 1)
+        ranked = self.documents[offset:] + self.documents[:offset]
+        return [{**doc, "score": 1.0 / (rank + 1)} for rank, doc in enumerate(ranked[:top_k])]
+
+    async def embed_query(self, query: str) -> List[float]:
+        await self.latency.wait()
+        digest = hashlib.sha1(query.encode("utf-8")).digest()
+        return [byte / 255 for byte in digest[:self.dim]]
+
+
+class FakeReranker:
+    """Keeps the retriever's order; the delay stands in for a cross-encoder call."""
+
+    def __init__(self, latency: Optional[LatencyDistribution] = None):
+        self.latency = latency or _NO_LATENCY
+
+    async def rerank(self, query: str, docs: List[dict], user_id: Optional[str] = None, top_k: int = 5) -> List[dict]:
+        await self.latency.wait()
+        return docs[:top_k]
+
+
+class FakeQueryTransformer:
+    def __init__(self, latency: Optional[LatencyDistribution] = None):
+        self.latency = latency or _NO_LATENCY
+
+    async def transform_query(self, query: str) -> str:
+        await self.latency.wait()
+        return f"{query} (hypothetical product description)"
+
+
+class FakeGenerator:
+    """Streams `tokens` tokens: the first after `first_token` latency, the rest `inter_token` apart."""
+
+    def __init__(self, first_token: Optional[LatencyDistribution] = None,
+                 inter_token: Optional[LatencyDistribution] = None, tokens: int = 60):
+        self.first_token = first_token or _NO_LATENCY
+        self.inter_token = inter_token or _NO_LATENCY
+        self.tokens = tokens
+
+    def construct_prompt(self, query: str, docs: List[dict]) -> str:
+        context = "\n".join(doc.get("page_content", "") for doc in docs)
+        return f"Context:\n{context}\n\nQuestion: {query}"
+
+    async def stream_response(self, prompt: str) -> AsyncGenerator[str, None]:
+        await self.first_token.wait()
+        for i in range(self.tokens):
+            if i:
+                await self.inter_token.wait()
+            yield f" token{i}"
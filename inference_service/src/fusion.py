@@ -0,0 +1,30 @@
+from typing import Dict, Hashable, List, Optional, Sequence
+
+# Standard RRF damping constant (Cormack et al., 2009)
+RRF_K = 60
+
+
+def doc_key(doc: dict) -> Hashable:
+    """Stable identity for a retrieved document, used to merge candidate lists."""
+    metadata = doc.get("metadata") or {}
+    return doc.get("id") or metadata.get("chunk_id") or doc.get("page_content")
+
+
+def reciprocal_rank_fusion(candidate_lists: Sequence[List[dict]], k: int = RRF_K, top_n: Optional[int] = None) -> List[dict]:
+    """
+    Merges several ranked candidate lists with reciprocal-rank fusion.
+    Each document scores sum(1 / (k + rank)) over the lists it appears in; the first
+    occurrence of a document is kept and annotated with its fused `rrf_score`.
+    """
+    scores: Dict[Hashable, float] = {}
+    docs: Dict[Hashable, dict] = {}
+    for candidates in candidate_lists:
+        for rank, doc in enumerate(candidates, start=1):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    if top_n is not None:
+        ranked = ranked[:top_n]
+    return [{**docs[key], "rrf_score": scores[key]} for key in ranked]
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Protocol, Sequence
+
+import numpy as np
+
+from .bm25 import BM25Index
+from .vector_index import IVFIndex, read_embedding_file, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+
+class RetrieverBackend(Protocol):
+    """What the orchestrator needs from a retriever: OpenSearch's HybridRetriever or LocalHybridRetriever."""
+
+    async def retrieve(self, query: str, top_k: int = 50) -> List[dict]:
+        ...
+
+    async def embed_query(self, query: str) -> List[float]:
+        ...
+
+
+def _min_max(scores: Dict[int, float]) -> Dict[int, float]:
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    span = high - low
+    return {doc_id: (score - low) / span if span else 1.0 for doc_id, score in scores.items()}
+
+
+class LocalHybridRetriever:
+    """
+    In-process hybrid retriever for hot catalogue segments: IVF vector search plus
+    BM25, each min-max normalised and blended with weight `alpha` on the vector side.
+    Documents use the same {"page_content", "metadata"} shape as the OpenSearch retriever.
+    """
+
+    def __init__(self, documents: List[dict], vector_index: IVFIndex, bm25_index: BM25Index,
+                 embed_fn: Callable[[str], Awaitable[List[float]]], alpha: float = 0.7,
+                 candidate_multiplier: int = 2):
+        self.documents = documents
+        self.vector_index = vector_index
+        self.bm25_index = bm25_index
+        self.embed_fn = embed_fn
+        self.alpha = alpha
+        self.candidate_multiplier = candidate_multiplier
+
+    @classmethod
+    def build(cls, documents: List[dict], embeddings: np.ndarray, embed_fn, dtype: str = "float32", **kwargs):
+        vector_index = IVFIndex.build(embeddings, dtype=dtype)
+        bm25_index = BM25Index([doc["page_content"] for doc in documents])
+        return cls(documents, vector_index, bm25_index, embed_fn, **kwargs)
+
+    def save(self, path: str):
+        self.vector_index.save(path)
+        with open(os.path.join(path, "documents.jsonl"), "w") as f:
+            for doc in self.documents:
+                f.write(json.dumps(doc) + "\n")
+
+    @classmethod
+    def load(cls, path: str, embed_fn, **kwargs) -> "LocalHybridRetriever":
+        """
+        Loads a saved index; vectors are memory-mapped and BM25 is rebuilt from the
+        documents. A directory holding the ingestion pipeline's output instead
+        (`embeddings.remb` plus `documents.jsonl` whose records carry the chunk "id")
+        is indexed on load.
+        """
+        with open(os.path.join(path, "documents.jsonl")) as f:
+            documents = [json.loads(line) for line in f]
+        if not os.path.exists(os.path.join(path, "ivf.json")):
+            return cls.from_embedding_file(os.path.join(path, "embeddings.remb"), documents, embed_fn, **kwargs)
+        vector_index = IVFIndex.load(path, mmap=True)
+        bm25_index = BM25Index([doc["page_content"] for doc in documents])
+        logger.info(f"Loaded local index with {len(documents)} documents from {path}.")
+        return cls(documents, vector_index, bm25_index, embed_fn, **kwargs)
+
+    @classmethod
+    def from_embedding_file(cls, remb_path: str, documents: List[dict], embed_fn, dtype: str = "float32",
+                            **kwargs) -> "LocalHybridRetriever":
+        """Builds the index from a .remb file; documents are matched to its rows by their "id"."""
+        ids, vectors = read_embedding_file(remb_path)
+        by_id = {doc["id"]: doc for doc in documents}
+        missing = [chunk_id for chunk_id in ids if chunk_id not in by_id]
+        if missing:
+            raise ValueError(f"{len(missing)} embedded chunks have no document, e.g. {missing[0]!r}.")
+        logger.info(f"Indexing {len(ids)} embedded chunks from {remb_path}.")
+        return cls.build([by_id[chunk_id] for chunk_id in ids], vectors, embed_fn, dtype=dtype, **kwargs)
+
+    async def embed_query(self, query: str) -> List[float]:
+        return await self.embed_fn(query)
+
+    def search(self, query: str, query_embedding: Sequence[float], top_k: int) -> List[dict]:
+        """Synchronous hybrid search given a precomputed query embedding."""
+        n_candidates = top_k * self.candidate_multiplier
+        vector_ids, vector_scores = self.vector_index.search(np.asarray(query_embedding), n_candidates)
+        keyword_ids, keyword_scores = self.bm25_index.search(query, n_candidates)
+
+        vector = _min_max(dict(zip(vector_ids.tolist(), vector_scores.tolist())))
+        keyword = _min_max(dict(zip(keyword_ids.tolist(), keyword_scores.tolist())))
+        doc_ids = np.array(sorted(vector.keys() | keyword.keys()), dtype=np.int64)
+        hybrid = np.array([
+            self.alpha * vector.get(doc_id, 0.0) + (1.0 - self.alpha) * keyword.get(doc_id, 0.0)
+            for doc_id in doc_ids.tolist()
+        ], dtype=np.float32)
+
+        results = []
+        for i in top_k_indices(hybrid, top_k):
+            results.append({**self.documents[doc_ids[i]], "score": float(hybrid[i])})
+        return results
+
+    async def retrieve(self, query: str, top_k: int = 50) -> List[dict]:
+        query_embedding = await self.embed_fn(query)
+        # Scoring is CPU-bound, so it runs on a worker thread rather than the event loop.
+        return await asyncio.to_thread(self.search, query, query_embedding, top_k)
@@ -5,18 +5,23 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 
-from . import orchestrator
+from . import clients, orchestrator, tracing
 from .config import settings
-from .instrumentation import configure_logging
+from .instrumentation import configure_logging, get_trace_id
 
 # Configure logging and LangSmith tracing on startup
 configure_logging()
+# Log lines written while a request is being served carry its trace_id.
+tracing.install_log_filter()
 # NOTE: LangSmith tracing is configured via environment variables like
 # LANGCHAIN_TRACING_V2, LANGCHAIN_API_KEY, etc.
 
 logger = logging.getLogger(__name__)
 app = FastAPI()
 
+# Streamed chunks between client-disconnect checks
+DISCONNECT_CHECK_INTERVAL = 16
+
 class SearchRequest(BaseModel):
     query: str
     user_id: Optional[str] = None
@@ -25,11 +30,17 @@ class SearchRequest(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """Initialize resources on startup."""
-    # This is a good place to initialize clients that can be reused,
-    # like the OpenSearch and Bedrock clients, to leverage connection pooling.
+    # Shared, pooled clients are created (and connections opened) before the first request.
+    await clients.warm_up(settings)
+    tracing.configure(tracing.Tracer.from_settings(settings))
     app.state.orchestrator = await orchestrator.RAGOrchestrator.create(settings)
     logger.info("Application startup complete. RAG Orchestrator initialized.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled async connections before the event loop stops."""
+    await clients.close_async_clients()
+
 @app.post("/search")
 async def search(request: SearchRequest, http_request: Request):
     """
@@ -41,12 +52,27 @@ async def search(request: SearchRequest, http_request: Request):
             raise HTTPException(status_code=400, detail="Query cannot be empty.")
         
         rag_orchestrator = http_request.app.state.orchestrator
+        # Propagate the caller's trace ID if it sent one.
+        trace_id = http_request.headers.get("X-Trace-Id") or get_trace_id()
         
         async def stream_generator():
-            async for chunk in rag_orchestrator.stream_rag_response(request.query, request.user_id):
-                yield chunk
+            with tracing.start_trace("search", trace_id=trace_id, user_id=request.user_id):
+                rag_stream = rag_orchestrator.stream_rag_response(request.query, request.user_id)
+                try:
+                    chunks_sent = 0
+                    async for chunk in rag_stream:
+                        # Polling the connection costs a receive() per call, so only every few chunks;
+                        # StreamingResponse also cancels the stream itself when the client goes away.
+                        if chunks_sent % DISCONNECT_CHECK_INTERVAL == 0 and await http_request.is_disconnected():
+                            logger.info(f"Client disconnected; cancelling search for query: '{request.query}'")
+                            break
+                        yield chunk
+                        chunks_sent += 1
+                finally:
+                    # Closing the pipeline generator cancels any stage still in flight.
+                    await rag_stream.aclose()
         
-        return StreamingResponse(stream_generator(), media_type="text/plain")
+        return StreamingResponse(stream_generator(), media_type="text/plain", headers={"X-Trace-Id": trace_id})
 
     except Exception as e:
         logger.exception(f"An error occurred during search for query: '{request.query}'")
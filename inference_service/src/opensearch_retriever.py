@@ -0,0 +1,113 @@
+"""
+Async-native hybrid retriever over the OpenSearch index built by the ingestion
+pipeline (documents with "text", "embedding" and "metadata" fields).
+
+Requests go through AsyncOpenSearch and, for the query embedding, an aiobotocore
+Bedrock client. Waiting on them costs no threads, so one event loop keeps many
+searches in flight on the single-vCPU task. The keyword query is sent as soon as
+the request arrives and runs while the query is being embedded; the k-NN query
+follows, and the two lists are merged with reciprocal-rank fusion.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+
+from . import clients, tracing
+from .fusion import reciprocal_rank_fusion
+
+logger = logging.getLogger(__name__)
+
+
+class BedrockQueryEmbedder:
+    """Titan query embeddings; awaited on the event loop when aiobotocore is installed, else on a thread."""
+
+    def __init__(self, model_id: str = "amazon.titan-embed-text-v2:0", dimensions: int = 1024):
+        self.model_id = model_id
+        self.dimensions = dimensions
+
+    def _body(self, query: str) -> str:
+        return json.dumps({"inputText": query, "dimensions": self.dimensions, "normalize": True})
+
+    def _embed_sync(self, query: str) -> List[float]:
+        response = clients.get_bedrock_runtime_client().invoke_model(modelId=self.model_id, body=self._body(query))
+        return json.loads(response["body"].read())["embedding"]
+
+    async def __call__(self, query: str) -> List[float]:
+        if not clients.HAS_AIOBOTOCORE:
+            return await asyncio.to_thread(self._embed_sync, query)
+        client = await clients.get_async_boto3_client("bedrock-runtime")
+        response = await client.invoke_model(modelId=self.model_id, body=self._body(query))
+        async with response["body"] as stream:
+            return json.loads(await stream.read())["embedding"]
+
+
+def _to_documents(response: dict) -> List[dict]:
+    return [
+        {"id": hit["_id"], "page_content": hit["_source"].get("text", ""),
+         "metadata": hit["_source"].get("metadata", {}), "score": hit["_score"]}
+        for hit in response["hits"]["hits"]
+    ]
+
+
+class AsyncOpenSearchRetriever:
+    """
+    RetrieverBackend over an AsyncOpenSearch client. Returns the same
+    {"page_content", "metadata", "score"} documents as the other retrievers.
+    """
+
+    def __init__(self, client, index_name: str, embed_fn: Callable[[str], Awaitable[List[float]]],
+                 candidate_multiplier: int = 2, vector_field: str = "embedding", text_field: str = "text"):
+        self.client = client
+        self.index_name = index_name
+        self.embed_fn = embed_fn
+        self.candidate_multiplier = candidate_multiplier
+        self.vector_field = vector_field
+        self.text_field = text_field
+
+    @classmethod
+    def from_settings(cls, settings) -> "AsyncOpenSearchRetriever":
+        """Builds the retriever on the running loop's shared clients."""
+        region = getattr(settings, "aws_region", None) or os.environ.get("AWS_REGION", "us-east-1")
+        client = clients.get_async_opensearch_client(settings.opensearch_host, region)
+        embedder = BedrockQueryEmbedder(getattr(settings, "embedding_model_id", "amazon.titan-embed-text-v2:0"))
+        return cls(client, getattr(settings, "opensearch_index", "products"), embedder)
+
+    async def embed_query(self, query: str) -> List[float]:
+        return await self.embed_fn(query)
+
+    async def _search(self, leg: str, body: dict) -> List[dict]:
+        with tracing.span(f"opensearch.{leg}") as search_span:
+            response = await self.client.search(index=self.index_name, body=body)
+            search_span.set("hits", len(response["hits"]["hits"]))
+        return _to_documents(response)
+
+    async def retrieve(self, query: str, top_k: int = 50, query_embedding: Optional[List[float]] = None) -> List[dict]:
+        n_candidates = top_k * self.candidate_multiplier
+        excludes = {"excludes": [self.vector_field]}
+        lexical = asyncio.create_task(self._search("keyword", {
+            "size": n_candidates, "_source": excludes,
+            "query": {"match": {self.text_field: query}},
+        }))
+        try:
+            if query_embedding is None:
+                with tracing.span("embed_query"):
+                    query_embedding = await self.embed_fn(query)
+            semantic = await self._search("knn", {
+                "size": n_candidates, "_source": excludes,
+                "query": {"knn": {self.vector_field: {"vector": list(query_embedding), "k": n_candidates}}},
+            })
+        except BaseException:
+            lexical.cancel()
+            raise
+        try:
+            keyword = await lexical
+        except Exception as e:
+            # A failed keyword leg degrades to vector-only results rather than failing the request.
+            logger.warning(f"Keyword search failed, using vector results only: {e}")
+            keyword = []
+        fused = reciprocal_rank_fusion([semantic, keyword], top_n=top_k)
+        for doc in fused:
+            doc["score"] = doc.pop("rrf_score")
+        return fused
@@ -1,55 +1,337 @@
 import asyncio
+import json
 import logging
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, List, Optional, Tuple
+from langchain_community.embeddings import BedrockEmbeddings
 from langsmith import traceable
 
-from . import retriever, reranker, generator, guardrails, query_transformer
+from . import clients, retriever, reranker, generator, guardrails, query_transformer, tracing
+from .answer_cache import AnswerCache, replay
+from .budget import LatencyBudget, StageTimer
+from .coalescing import SingleFlight
 from .config import Settings
+from .fusion import reciprocal_rank_fusion
+from .local_retriever import LocalHybridRetriever
+from .opensearch_retriever import AsyncOpenSearchRetriever
+from .query_keys import normalize_query, personalization_bucket
+from .rerank_batcher import RerankBatcher, SageMakerPairScorer
+from .rerank_cache import CachingReranker, CandidateCutoff, RerankScoreCache
 
 logger = logging.getLogger(__name__)
 
 class RAGOrchestrator:
     """Orchestrates the end-to-end RAG pipeline asynchronously."""
 
-    def __init__(self, settings: Settings, retriever_client, reranker_client, generator_client, transformer_client):
+    def __init__(self, settings: Settings, retriever_client, reranker_client, generator_client, transformer_client,
+                 budget: Optional[LatencyBudget] = None, answer_cache=None, speculative_retrieval: bool = False,
+                 coalescer: Optional[SingleFlight] = None, personalization_buckets: Optional[int] = None,
+                 variant: str = "unknown"):
         self.settings = settings
         self.retriever = retriever_client
         self.reranker = reranker_client
         self.generator = generator_client
         self.transformer = transformer_client
+        self.budget = budget or LatencyBudget()
+        # Optional answer cache, checked before the pipeline runs and used as the
+        # last-resort fallback when retrieval cannot finish within the budget.
+        # Answers are re-ranked per user, so each personalization bucket (by
+        # default, each user) has its own entries.
+        self.answer_cache = answer_cache
+        # When enabled, the raw query is retrieved while HyDE is still running
+        # instead of waiting for the transformed query.
+        self.speculative_retrieval = speculative_retrieval
+        # Optional single-flight layer: concurrent requests with the same normalized
+        # query and personalization bucket share one pipeline run. Unless a bucket
+        # count is configured, the bucket is the user, since re-ranking is personalised.
+        self.coalescer = coalescer
+        self.personalization_buckets = personalization_buckets
+        # Deployment variant (e.g. control / challenger), logged with every response.
+        self.variant = variant
 
     @classmethod
     async def create(cls, settings: Settings):
         """Asynchronously create an instance of the orchestrator."""
+        rerank_batching = getattr(settings, "rerank_batching", False)
+        rerank_score_cache = getattr(settings, "rerank_score_cache", False)
+        rerank_cutoff = getattr(settings, "rerank_adaptive_cutoff", False)
+        if (rerank_batching or rerank_score_cache or rerank_cutoff) and getattr(settings, "personalized_rerank", True):
+            # Pair scoring sees only (query, passage), so these would quietly drop the user's personalisation.
+            raise ValueError("rerank_batching, rerank_score_cache and rerank_adaptive_cutoff rerank without the "
+                             "user; set personalized_rerank=False to use them.")
         # Initialize clients for dependencies
-        retriever_client = retriever.HybridRetriever(settings.opensearch_host)
-        reranker_client = reranker.SageMakerReranker(settings.reranker_endpoint_name)
+        backend = getattr(settings, "retriever_backend", "opensearch")
+        if backend == "local":
+            # Hot catalogue segments served from an in-process index, no network hop.
+            embeddings = BedrockEmbeddings(model_id=getattr(settings, "embedding_model_id", "amazon.titan-embed-text-v2:0"),
+                                           client=clients.get_bedrock_runtime_client())
+            retriever_client = LocalHybridRetriever.load(settings.local_index_path, embed_fn=embeddings.aembed_query)
+        elif backend == "opensearch_async":
+            # Non-blocking OpenSearch and Bedrock clients on this event loop.
+            retriever_client = AsyncOpenSearchRetriever.from_settings(settings)
+        else:
+            retriever_client = retriever.HybridRetriever(settings.opensearch_host)
+        if rerank_batching or rerank_score_cache or rerank_cutoff:
+            # The endpoint must accept batched {"inputs": [{"text", "text_pair"}, ...]} payloads.
+            scorer = SageMakerPairScorer(settings.reranker_endpoint_name)
+            if rerank_batching:
+                # Pairs from concurrent requests share cross-encoder calls.
+                scorer = RerankBatcher(
+                    scorer,
+                    max_batch_pairs=getattr(settings, "rerank_max_batch_pairs", 256),
+                    max_wait_ms=getattr(settings, "rerank_batch_window_ms", 5.0),
+                )
+            reranker_client = CachingReranker(
+                scorer,
+                model_version=getattr(settings, "reranker_model_version", settings.reranker_endpoint_name),
+                cache=(RerankScoreCache(ttl_s=getattr(settings, "rerank_score_cache_ttl_s", 3600))
+                       if rerank_score_cache else None),
+                cutoff=CandidateCutoff.from_settings(settings) if rerank_cutoff else None,
+            )
+        else:
+            reranker_client = reranker.SageMakerReranker(settings.reranker_endpoint_name)
         generator_client = generator.BedrockGenerator(settings.generator_model_id)
         transformer_client = query_transformer.QueryTransformer(settings.hyde_model_id, settings.redis_host)
-        return cls(settings, retriever_client, reranker_client, generator_client, transformer_client)
+        answer_cache = None
+        if getattr(settings, "answer_cache_enabled", True):
+            semantic_threshold = getattr(settings, "semantic_cache_threshold", None)
+            answer_cache = AnswerCache(
+                redis_client=clients.get_async_redis(settings.redis_host),
+                ttl_s=getattr(settings, "answer_cache_ttl_s", 3600),
+                # The semantic tier reuses the retriever's query embedder.
+                embed_fn=retriever_client.embed_query if semantic_threshold else None,
+                semantic_threshold=semantic_threshold or 0.95,
+            )
+        return cls(settings, retriever_client, reranker_client, generator_client, transformer_client,
+                   budget=LatencyBudget.from_settings(settings), answer_cache=answer_cache,
+                   speculative_retrieval=getattr(settings, "speculative_retrieval", False),
+                   coalescer=SingleFlight() if getattr(settings, "request_coalescing", False) else None,
+                   personalization_buckets=getattr(settings, "personalization_buckets", None),
+                   variant=getattr(settings, "variant_version", "unknown"))
 
     @traceable(name="stream_rag_response")
     async def stream_rag_response(self, query: str, user_id: str) -> AsyncGenerator[str, None]:
         """Full asynchronous RAG pipeline with streaming."""
-        
-        # 1. Input Guardrails & Transformation (can be run concurrently)
-        guarded_query_task = guardrails.apply_input_guardrails(query)
-        transformed_query_task = self.transformer.transform_query(query)
-        
-        guarded_query, transformed_query = await asyncio.gather(
-            guarded_query_task, transformed_query_task
+        if self.coalescer is None:
+            async for token in self._stream_pipeline(query, user_id):
+                yield token
+            return
+
+        # The first request for a key drives the pipeline (with its own user_id);
+        # identical requests that arrive meanwhile replay and follow its stream.
+        key = (normalize_query(query), personalization_bucket(user_id, self.personalization_buckets))
+        async for token in self.coalescer.stream(key, lambda: self._stream_pipeline(query, user_id)):
+            yield token
+
+    async def _stream_pipeline(self, query: str, user_id: str) -> AsyncGenerator[str, None]:
+        timer = StageTimer(self.budget)
+        tasks: List[asyncio.Task] = []
+        # Set once a response has been streamed in full: where it came from, and
+        # for generated answers the answer and the documents it was grounded in.
+        answered_from: Optional[str] = None
+        answer_tokens: Optional[List[str]] = None
+        reranked_docs: Optional[List[dict]] = None
+        try:
+            # 0. Answer cache: popular queries skip the pipeline entirely.
+            cache_bucket = self._cache_bucket(user_id)
+            if self.answer_cache is not None:
+                cached_answer = await timer.run(
+                    "answer_cache", self._get_cached_answer(query, cache_bucket, semantic=False),
+                    timeout=self.budget.answer_cache_timeout_s, fallback=None,
+                )
+                if cached_answer is not None:
+                    async for token in replay(cached_answer):
+                        yield token
+                    answered_from = "answer_cache"
+                    return
+
+            # 1-3. Guardrails, HyDE, retrieval and re-ranking.
+            candidates_task = asyncio.create_task(self._retrieve_and_rerank(query, user_id, timer, tasks))
+            tasks.append(candidates_task)
+
+            # The semantic tier embeds the query, so it races the pipeline instead of
+            # holding it up: a hit cancels the pipeline, a miss costs nothing.
+            if self.answer_cache is not None and self.answer_cache.semantic is not None:
+                semantic_task = asyncio.create_task(timer.run(
+                    "semantic_cache", self._get_similar_answer(query, cache_bucket),
+                    timeout=self.budget.semantic_cache_timeout_s, fallback=None,
+                ))
+                tasks.append(semantic_task)
+                await asyncio.wait([semantic_task, candidates_task], return_when=asyncio.FIRST_COMPLETED)
+                if semantic_task.done() and semantic_task.result() is not None:
+                    candidates_task.cancel()
+                    async for token in replay(semantic_task.result()):
+                        yield token
+                    answered_from = "semantic_cache"
+                    return
+                # A miss, or candidates ready first: generation doesn't wait for the lookup.
+                semantic_task.cancel()
+
+            # Nothing downstream works without candidates, so a retrieval timeout
+            # is answered from the cache if possible.
+            try:
+                guarded_query, reranked_docs = await candidates_task
+            except asyncio.TimeoutError:
+                # The budget is already spent; only the exact tiers are consulted.
+                cached_answer = await self._get_cached_answer(query, cache_bucket, semantic=False)
+                if cached_answer is None:
+                    raise
+                timer.outcomes["retrieval"] = "timeout_cached_answer"
+                async for token in replay(cached_answer):
+                    yield token
+                answered_from = "answer_cache_fallback"
+                return
+
+            # 4. Prompt Construction and Generation
+            final_prompt = self.generator.construct_prompt(guarded_query, reranked_docs)
+
+            # 5. Streaming Generation and Output Guardrails
+            generation_started_at = time.perf_counter()
+            answer_tokens = []
+            with tracing.span("generation") as generation_span:
+                token_gaps: List[float] = []
+                last_token_at = generation_started_at
+                token_stream = self.generator.stream_response(final_prompt)
+                async for token in guardrails.apply_output_guardrails(token_stream):
+                    now = time.perf_counter()
+                    if not answer_tokens:
+                        timer.record("first_token", generation_started_at)
+                    elif generation_span.recording:
+                        token_gaps.append(now - last_token_at)
+                    last_token_at = now
+                    answer_tokens.append(token)
+                    yield token
+                timer.record("generation", generation_started_at)
+                if generation_span.recording:
+                    generation_span.set("ttft_ms", timer.spend_ms.get("first_token"))
+                    generation_span.set("tokens", len(answer_tokens))
+                    generation_span.set("inter_token_ms", tracing.latency_summary(token_gaps))
+            answered_from = "pipeline"
+
+            # Only complete, non-degraded answers are worth serving again.
+            if self.answer_cache is not None and not timer.degraded:
+                await self._store_answer(query, answer_tokens, reranked_docs, cache_bucket)
+        finally:
+            # Runs on completion, on error and when the client disconnects
+            # (the generator is closed), so no stage keeps running unobserved.
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            logger.info(f"RAG stage spend: {json.dumps(timer.summary())}")
+            if answered_from is not None:
+                self._log_response(query, user_id, timer, answered_from, answer_tokens, reranked_docs)
+
+    async def _retrieve_and_rerank(self, query: str, user_id: str, timer: StageTimer,
+                                   tasks: List[asyncio.Task]) -> Tuple[str, List[dict]]:
+        """Steps 1-3: the guarded query and the re-ranked candidates for the prompt."""
+        # 1. Input Guardrails & Transformation (run concurrently).
+        #    HyDE is an optimisation, so on timeout we fall back to the raw query.
+        guarded_query_task = asyncio.create_task(timer.run(
+            "guardrails", guardrails.apply_input_guardrails(query),
+            timeout=self.budget.guardrails_timeout_s,
+        ))
+        transformed_query_task = asyncio.create_task(timer.run(
+            "query_transform", self.transformer.transform_query(query),
+            timeout=self.budget.query_transform_timeout_s, fallback=query,
+        ))
+        tasks += [guarded_query_task, transformed_query_task]
+
+        # 2. Hybrid Retrieval; a timeout here is raised to the caller.
+        if self.speculative_retrieval:
+            retrieved_docs = await self._speculative_retrieve(query, transformed_query_task, timer, tasks)
+            guarded_query = await guarded_query_task
+        else:
+            guarded_query, transformed_query = await asyncio.gather(
+                guarded_query_task, transformed_query_task
+            )
+            retrieved_docs = await timer.run(
+                "retrieval", self.retriever.retrieve(transformed_query, top_k=50),
+                timeout=self.budget.retrieval_timeout_s,
+            )
+
+        # 3. Contextual Re-ranking, degrading to the retriever's own ordering.
+        reranked_docs = await timer.run(
+            "rerank", self.reranker.rerank(guarded_query, retrieved_docs, user_id, top_k=5),
+            timeout=self.budget.rerank_timeout_s,
+            fallback=retrieved_docs[:self.budget.fallback_top_k],
         )
-        
-        # 2. Hybrid Retrieval
-        retrieved_docs = await self.retriever.retrieve(transformed_query, top_k=50)
-        
-        # 3. Contextual Re-ranking
-        reranked_docs = await self.reranker.rerank(guarded_query, retrieved_docs, user_id, top_k=5)
-        
-        # 4. Prompt Construction and Generation
-        final_prompt = self.generator.construct_prompt(guarded_query, reranked_docs)
-        
-        # 5. Streaming Generation and Output Guardrails
-        token_stream = self.generator.stream_response(final_prompt)
-        async for token in guardrails.apply_output_guardrails(token_stream):
-            yield token
\ No newline at end of file
+        return guarded_query, reranked_docs
+
+    async def _speculative_retrieve(self, query: str, transformed_query_task: asyncio.Task,
+                                    timer: StageTimer, tasks: List[asyncio.Task]) -> List[dict]:
+        """
+        Retrieves for the raw query while HyDE is still running. If the transformed
+        query arrives within its budget it is retrieved as well, concurrently with
+        the raw retrieval, and the two candidate lists are merged with RRF.
+        """
+        raw_retrieval_task = asyncio.create_task(timer.run(
+            "retrieval", self.retriever.retrieve(query, top_k=50),
+            timeout=self.budget.retrieval_timeout_s, fallback=None,
+        ))
+        tasks.append(raw_retrieval_task)
+
+        hyde_docs = None
+        transformed_query = await transformed_query_task
+        if transformed_query != query:
+            hyde_docs = await timer.run(
+                "retrieval_hyde", self.retriever.retrieve(transformed_query, top_k=50),
+                timeout=self.budget.retrieval_timeout_s, fallback=None,
+            )
+        raw_docs = await raw_retrieval_task
+
+        if raw_docs is None and hyde_docs is None:
+            raise asyncio.TimeoutError("Neither raw nor HyDE retrieval finished within the latency budget.")
+        if raw_docs is None or hyde_docs is None:
+            return raw_docs if hyde_docs is None else hyde_docs
+        return reciprocal_rank_fusion([hyde_docs, raw_docs], top_n=50)
+
+    def _cache_bucket(self, user_id: str) -> str:
+        # Same grouping as coalescing: per user unless bucket counts are configured.
+        return personalization_bucket(user_id, self.personalization_buckets)
+
+    def _log_response(self, query: str, user_id: str, timer: StageTimer, answered_from: str,
+                      answer_tokens: Optional[List[str]], source_docs: Optional[List[dict]]):
+        """
+        One structured record per response, which the log processor turns into
+        per-variant latency and (for generated answers) groundedness signals.
+        """
+        record = {
+            "query": query,
+            "user_id": user_id,
+            "variant": self.variant,
+            "total_ms": round(timer.elapsed() * 1000, 2),
+            "answer_source": answered_from,
+        }
+        if answered_from == "pipeline":
+            # Replayed answers are not judged: their context is not at hand.
+            record["answer"] = "".join(answer_tokens)
+            record["context"] = [doc.get("page_content", "") for doc in source_docs]
+        logger.info("RAG response", extra=record)
+
+    async def _store_answer(self, query: str, answer_tokens: List[str], source_docs: List[dict],
+                            bucket: Optional[str] = None):
+        product_ids = [
+            doc["metadata"]["product_id"] for doc in source_docs
+            if "product_id" in (doc.get("metadata") or {})
+        ]
+        try:
+            await self.answer_cache.set(query, answer_tokens, product_ids, bucket=bucket)
+        except Exception as e:
+            logger.error(f"Failed to cache answer for query '{query}': {e}")
+
+    async def _get_cached_answer(self, query: str, bucket: Optional[str] = None,
+                                 semantic: bool = True) -> Optional[List[str]]:
+        if self.answer_cache is None:
+            return None
+        try:
+            return await self.answer_cache.get(query, bucket, semantic=semantic)
+        except Exception as e:
+            logger.error(f"Answer cache lookup failed for query '{query}': {e}")
+            return None
+
+    async def _get_similar_answer(self, query: str, bucket: Optional[str] = None) -> Optional[List[str]]:
+        try:
+            return await self.answer_cache.get_similar(query, bucket)
+        except Exception as e:
+            logger.error(f"Semantic answer cache lookup failed for query '{query}': {e}")
+            return None
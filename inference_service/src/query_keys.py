@@ -0,0 +1,35 @@
+import hashlib
+import re
+import unicodedata
+import zlib
+from typing import Optional
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query for cache and coalescing keys (case, punctuation and spacing folded)."""
+    text = unicodedata.normalize("NFKC", query).casefold()
+    text = _NON_WORD.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def query_digest(query: str) -> str:
+    """Short, fixed-length hash of the normalized query, safe to embed in Redis keys."""
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def personalization_bucket(user_id: Optional[str], num_buckets: Optional[int] = None) -> str:
+    """
+    Groups users whose requests may share one personalised pipeline run. Without
+    an explicit bucket count every user is their own bucket, so one user's
+    personalised answer is never served to another.
+    """
+    if user_id is None:
+        return "anon"
+    if num_buckets is None:
+        return f"user:{user_id}"
+    if num_buckets <= 1:
+        return "all"
+    return str(zlib.crc32(user_id.encode("utf-8")) % num_buckets)
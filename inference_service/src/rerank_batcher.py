@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+
+from . import clients
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[str, str]
+
+
+class PairScorer(Protocol):
+    async def score(self, pairs: Sequence[Pair]) -> List[float]:
+        ...
+
+
+class SageMakerPairScorer:
+    """
+    Scores (query, passage) pairs with a cross-encoder endpoint in one call, using
+    the Hugging Face text-classification payload: {"inputs": [{"text", "text_pair"}, ...]}.
+    """
+
+    def __init__(self, endpoint_name: str, client=None):
+        self.endpoint_name = endpoint_name
+        self.client = client or clients.get_sagemaker_runtime_client()
+
+    def _score_sync(self, pairs: Sequence[Pair]) -> List[float]:
+        body = json.dumps({"inputs": [{"text": query, "text_pair": passage} for query, passage in pairs]})
+        response = self.client.invoke_endpoint(EndpointName=self.endpoint_name, ContentType="application/json",
+                                               Accept="application/json", Body=body)
+        predictions = json.loads(response["Body"].read())
+        scores = [p["score"] if isinstance(p, dict) else float(p) for p in predictions]
+        if len(scores) != len(pairs):
+            raise ValueError(f"Reranker returned {len(scores)} scores for {len(pairs)} pairs.")
+        return scores
+
+    async def score(self, pairs: Sequence[Pair]) -> List[float]:
+        return await asyncio.to_thread(self._score_sync, pairs)
+
+
+def top_by_score(docs: List[dict], scores: Sequence[float], top_k: int) -> List[dict]:
+    """The `top_k` docs by reranker score, each annotated with its `rerank_score`."""
+    order = sorted(range(len(docs)), key=scores.__getitem__, reverse=True)[:top_k]
+    return [{**docs[i], "rerank_score": scores[i]} for i in order]
+
+
+class _Waiter:
+    """One caller's pairs and the future its scores are delivered to."""
+
+    def __init__(self, pairs: List[Pair]):
+        self.pairs = pairs
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class RerankBatcher:
+    """
+    Coalesces rerank calls from concurrent requests into batched endpoint calls.
+    Pairs are collected until `max_batch_pairs` is reached or `max_wait_ms` has
+    passed since the first one arrived, then scored in one call (identical pairs
+    only once) and the scores are scattered back to the waiting callers. A caller
+    that gives up (e.g. its rerank budget expires) is simply dropped from the batch.
+    Drop-in for the reranker client: `rerank(query, docs, user_id, top_k)`,
+    though `user_id` is not used, as pairs are scored without user context.
+    """
+
+    def __init__(self, scorer: PairScorer, max_batch_pairs: int = 256, max_wait_ms: float = 5.0,
+                 max_concurrent_batches: int = 4):
+        self.scorer = scorer
+        self.max_batch_pairs = max_batch_pairs
+        self.max_wait_s = max_wait_ms / 1000
+        self.max_concurrent_batches = max_concurrent_batches
+        self._pending: List[_Waiter] = []
+        self._pending_pairs = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._slots: Optional[asyncio.Semaphore] = None  # created on the loop that runs the batches
+        self._in_flight: set = set()
+        self.stats = {"requests": 0, "batches": 0, "pairs": 0, "scored_pairs": 0}
+
+    async def score(self, pairs: Sequence[Pair]) -> List[float]:
+        """Scores pairs as part of the next batch(es); large requests are split across batches."""
+        self.stats["requests"] += 1
+        waiters = []
+        for start in range(0, len(pairs), self.max_batch_pairs):
+            waiter = _Waiter(list(pairs[start:start + self.max_batch_pairs]))
+            self._enqueue(waiter)
+            waiters.append(waiter)
+        try:
+            parts = await asyncio.gather(*[waiter.future for waiter in waiters])
+        except BaseException:
+            for waiter in waiters:
+                waiter.future.cancel()
+            raise
+        return [score for part in parts for score in part]
+
+    async def rerank(self, query: str, docs: List[dict], user_id: Optional[str] = None, top_k: int = 5) -> List[dict]:
+        if not docs:
+            return []
+        scores = await self.score([(query, doc.get("page_content", "")) for doc in docs])
+        return top_by_score(docs, scores, top_k)
+
+    def _enqueue(self, waiter: _Waiter):
+        if self._pending and self._pending_pairs + len(waiter.pairs) > self.max_batch_pairs:
+            self._flush()
+        self._pending.append(waiter)
+        self._pending_pairs += len(waiter.pairs)
+        if self._pending_pairs >= self.max_batch_pairs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_s, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        waiters = [waiter for waiter in self._pending if not waiter.future.done()]
+        self._pending, self._pending_pairs = [], 0
+        if waiters:
+            task = asyncio.get_running_loop().create_task(self._run_batch(waiters))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _run_batch(self, waiters: List[_Waiter]):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        async with self._slots:
+            # Callers may have given up while the batch waited for a slot.
+            waiters = [waiter for waiter in waiters if not waiter.future.done()]
+            if not waiters:
+                return
+            unique: Dict[Pair, int] = {}
+            for waiter in waiters:
+                for pair in waiter.pairs:
+                    unique.setdefault(pair, len(unique))
+            self.stats["batches"] += 1
+            self.stats["pairs"] += sum(len(waiter.pairs) for waiter in waiters)
+            self.stats["scored_pairs"] += len(unique)
+            try:
+                scores = await self.scorer.score(list(unique))
+            except Exception as e:
+                logger.error(f"Rerank batch of {len(unique)} pairs failed: {e}")
+                for waiter in waiters:
+                    if not waiter.future.done():
+                        waiter.future.set_exception(e)
+                return
+        for waiter in waiters:
+            if not waiter.future.done():
+                waiter.future.set_result([scores[unique[pair]] for pair in waiter.pairs])
@@ -0,0 +1,144 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from . import tracing
+from .fusion import doc_key
+from .query_keys import normalize_query
+from .rerank_batcher import PairScorer, top_by_score
+
+logger = logging.getLogger(__name__)
+
+
+class RerankScoreCache:
+    """
+    In-process LRU of cross-encoder scores keyed by (normalized query, chunk, model
+    version), with a TTL. A score only depends on the query and chunk text, and
+    chunk IDs change with their content, so entries never need invalidating; the
+    TTL just bounds how long a retired model version's scores linger.
+    """
+
+    def __init__(self, max_entries: int = 200_000, ttl_s: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[Tuple[str, Hashable, str], Tuple[float, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, query: str, chunk_keys: Sequence[Hashable], model_version: str) -> Dict[Hashable, float]:
+        normalized = normalize_query(query)
+        now = time.monotonic()
+        found = {}
+        for chunk in chunk_keys:
+            key = (normalized, chunk, model_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            expires_at, score = entry
+            if now >= expires_at:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            found[chunk] = score
+        self.hits += len(found)
+        self.misses += len(chunk_keys) - len(found)
+        return found
+
+    def put_many(self, query: str, scores: Dict[Hashable, float], model_version: str):
+        normalized = normalize_query(query)
+        expires_at = time.monotonic() + self.ttl_s
+        for chunk, score in scores.items():
+            key = (normalized, chunk, model_version)
+            self._entries[key] = (expires_at, score)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def retriever_score(doc: dict) -> Optional[float]:
+    """The score the candidate list is ordered by: the fused RRF score if present, else the retriever's."""
+    score = doc.get("rrf_score", doc.get("score"))
+    return None if score is None else float(score)
+
+
+@dataclass(frozen=True)
+class CandidateCutoff:
+    """
+    Shrinks a ranked candidate list before reranking. Scores are min-max
+    normalised over the list; the list is cut at the first drop between
+    neighbours of at least `max_gap`, and candidates below `min_relative_score`
+    are dropped. At least `min_k` candidates are always kept, and lists without
+    retriever scores (or not ordered by them) are passed through unchanged.
+    """
+    min_k: int = 10
+    max_gap: float = 0.25
+    min_relative_score: float = 0.0
+
+    def apply(self, docs: List[dict]) -> List[dict]:
+        if len(docs) <= self.min_k:
+            return docs
+        scores = [retriever_score(doc) for doc in docs]
+        if None in scores or any(a < b for a, b in zip(scores, scores[1:])):
+            return docs
+        low, span = scores[-1], scores[0] - scores[-1]
+        if span <= 0:
+            return docs
+        for i in range(self.min_k, len(docs)):
+            gap = (scores[i - 1] - scores[i]) / span
+            if gap >= self.max_gap or (scores[i] - low) / span < self.min_relative_score:
+                return docs[:i]
+        return docs
+
+    @classmethod
+    def from_settings(cls, settings) -> "CandidateCutoff":
+        defaults = cls()
+        return cls(
+            min_k=getattr(settings, "rerank_min_candidates", defaults.min_k),
+            max_gap=getattr(settings, "rerank_max_score_gap", defaults.max_gap),
+            min_relative_score=getattr(settings, "rerank_min_relative_score", defaults.min_relative_score),
+        )
+
+
+class CachingReranker:
+    """
+    Reranker client in front of a PairScorer (a SageMakerPairScorer or a
+    RerankBatcher): candidates are first cut down with `cutoff`, only pairs not in
+    the score cache are sent to the endpoint, and the top_k by score are returned.
+    Scores depend on the query and passage only: `user_id` is accepted for
+    interface compatibility but not used, so this replaces a personalised reranker
+    only where personalisation is switched off.
+    """
+
+    def __init__(self, scorer: PairScorer, model_version: str, cache: Optional[RerankScoreCache] = None,
+                 cutoff: Optional[CandidateCutoff] = None):
+        self.scorer = scorer
+        self.model_version = model_version
+        self.cache = cache
+        self.cutoff = cutoff
+        self.stats = {"candidates": 0, "after_cutoff": 0, "scored": 0}
+
+    async def rerank(self, query: str, docs: List[dict], user_id: Optional[str] = None, top_k: int = 5) -> List[dict]:
+        self.stats["candidates"] += len(docs)
+        if self.cutoff is not None:
+            docs = self.cutoff.apply(docs)
+        self.stats["after_cutoff"] += len(docs)
+        if not docs:
+            return []
+
+        keys = [doc_key(doc) for doc in docs]
+        known = self.cache.get_many(query, keys, self.model_version) if self.cache is not None else {}
+        missing = [i for i, key in enumerate(keys) if key not in known]
+        if missing:
+            with tracing.span("rerank.score", candidates=len(docs), cached=len(known), scored=len(missing)):
+                scored = await self.scorer.score([(query, docs[i].get("page_content", "")) for i in missing])
+            fresh = {keys[i]: score for i, score in zip(missing, scored)}
+            self.stats["scored"] += len(fresh)
+            if self.cache is not None:
+                self.cache.put_many(query, fresh, self.model_version)
+            known = {**known, **fresh}
+        return top_by_score(docs, [known[key] for key in keys], top_k)
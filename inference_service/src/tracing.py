@@ -0,0 +1,333 @@
+"""
+Lightweight in-process tracing for the RAG hot path.
+
+A trace is started per request (`start_trace`) and carried in a context
+variable, so tasks created while it is active inherit it and every log line
+gets its trace_id (see `TraceIdFilter`). Spans (`span`, `traced`) record what
+each stage spent; for unsampled requests they are a shared no-op, so tracing
+costs one context-variable lookup per stage when sampling is off. Finished,
+sampled traces go to a pluggable exporter (by default one JSON log line).
+
+Optionally a fraction of requests is profiled: a background thread samples the
+event-loop thread's stack while they run, and traces that turn out slow are
+exported with their hottest stacks, showing where CPU time went between spans.
+"""
+import asyncio
+import functools
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    start_ms: float
+    duration_ms: float
+    attributes: Dict[str, Any]
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    name: str
+    sampled: bool
+    started_at: float = field(default_factory=time.perf_counter)
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    spans: List[SpanRecord] = field(default_factory=list)
+    stacks: Optional[Counter] = None  # collapsed stack -> samples, when profiled
+    _next_span_id: int = 0
+
+    def new_span_id(self) -> int:
+        self._next_span_id += 1
+        return self._next_span_id
+
+    def to_dict(self, max_stacks: int = 20) -> Dict[str, Any]:
+        record = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "duration_ms": round((time.perf_counter() - self.started_at) * 1000, 2),
+            "attributes": self.attributes,
+            "spans": [
+                {"name": s.name, "id": s.span_id, "parent": s.parent_id, "start_ms": s.start_ms,
+                 "duration_ms": s.duration_ms, **({"attributes": s.attributes} if s.attributes else {})}
+                for s in sorted(self.spans, key=lambda s: s.start_ms)
+            ],
+        }
+        if self.stacks:
+            record["profile"] = [{"stack": stack, "samples": n} for stack, n in self.stacks.most_common(max_stacks)]
+        return record
+
+
+class Span:
+    """An open span; `set` adds attributes that are exported with it."""
+
+    recording = True
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[int], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = trace.new_span_id()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.started_at = time.perf_counter()
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def finish(self):
+        ended_at = time.perf_counter()
+        self.trace.spans.append(SpanRecord(
+            self.name, self.span_id, self.parent_id,
+            round((self.started_at - self.trace.started_at) * 1000, 2),
+            round((ended_at - self.started_at) * 1000, 2), self.attributes,
+        ))
+
+
+class _NoopSpan:
+    recording = False
+
+    def set(self, key: str, value: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class TraceExporter(Protocol):
+    def export(self, trace: Trace) -> None:
+        ...
+
+
+class LoggingExporter:
+    """Writes each finished trace as one JSON log line (picked up by the JSON logger)."""
+
+    def __init__(self, log: Optional[logging.Logger] = None):
+        self.log = log or logger
+
+    def export(self, trace: Trace):
+        self.log.info(f"trace {json.dumps(trace.to_dict(), default=str)}")
+
+
+class StackSampler:
+    """
+    Samples, every `interval_s`, the stack of each thread running a profiled
+    trace and adds it (collapsed, outermost frame first) to those traces. Stacks
+    are per thread, so requests sharing the event loop share their samples.
+    """
+
+    def __init__(self, interval_s: float = 0.005, max_depth: int = 64):
+        self.interval_s = interval_s
+        self.max_depth = max_depth
+        self._active: Dict[int, List[Trace]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, trace: Trace, thread_id: int):
+        trace.stacks = Counter()
+        with self._lock:
+            self._active.setdefault(thread_id, []).append(trace)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, trace: Trace, thread_id: int):
+        with self._lock:
+            traces = self._active.get(thread_id, [])
+            if trace in traces:
+                traces.remove(trace)
+            if not traces:
+                self._active.pop(thread_id, None)
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_s)
+            frames = sys._current_frames()
+            # Counted under the lock, so a trace gets no samples once `remove` has returned.
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                for thread_id, traces in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is None:
+                        continue
+                    stack = self._collapse(frame)
+                    for trace in traces:
+                        trace.stacks[stack] += 1
+            del frames
+
+
+class Tracer:
+    """
+    Sampling and export policy. `sample_rate` of requests record spans; if
+    `slow_ms` is set only sampled traces at least that slow are exported.
+    `profile_rate` of requests are also stack-sampled, and their profile is
+    exported when the trace is slower than `slow_ms` (or always, if unset).
+    """
+
+    def __init__(self, sample_rate: float = 0.0, exporter: Optional[TraceExporter] = None,
+                 slow_ms: Optional[float] = None, profile_rate: float = 0.0, profile_interval_ms: float = 5.0):
+        self.sample_rate = sample_rate
+        self.exporter = exporter or LoggingExporter()
+        self.slow_ms = slow_ms
+        self.profile_rate = profile_rate
+        self.sampler = StackSampler(profile_interval_ms / 1000)
+
+    @classmethod
+    def from_settings(cls, settings) -> "Tracer":
+        return cls(
+            sample_rate=getattr(settings, "trace_sample_rate", 0.0),
+            slow_ms=getattr(settings, "trace_slow_ms", None),
+            profile_rate=getattr(settings, "profile_sample_rate", 0.0),
+            profile_interval_ms=getattr(settings, "profile_interval_ms", 5.0),
+        )
+
+    def _finish(self, trace: Trace):
+        duration_ms = (time.perf_counter() - trace.started_at) * 1000
+        if self.slow_ms is not None and duration_ms < self.slow_ms:
+            return
+        try:
+            self.exporter.export(trace)
+        except Exception as e:
+            logger.error(f"Failed to export trace {trace.trace_id}: {e}")
+
+
+_tracer = Tracer()
+
+
+def configure(tracer: Tracer) -> Tracer:
+    """Installs `tracer` as the process-wide sampling and export policy."""
+    global _tracer
+    _tracer = tracer
+    return tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def get_trace_id() -> Optional[str]:
+    """The current request's trace ID, if a trace is active."""
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, sampled: Optional[bool] = None,
+                **attributes) -> Iterator[Trace]:
+    """
+    Makes a new trace current for the enclosed code (and tasks created in it).
+    Safe to use inside async generators: the previous values are restored by
+    value, not by context token.
+    """
+    tracer = _tracer
+    if sampled is None:
+        sampled = tracer.sample_rate > 0 and random.random() < tracer.sample_rate
+    profiled = tracer.profile_rate > 0 and random.random() < tracer.profile_rate
+    trace = Trace(trace_id or uuid4().hex, name, sampled or profiled, attributes=attributes)
+    thread_id = threading.get_ident()
+    if profiled:
+        tracer.sampler.add(trace, thread_id)
+    previous_trace, previous_span = _current_trace.get(), _current_span.get()
+    _current_trace.set(trace)
+    _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        _current_trace.set(previous_trace)
+        _current_span.set(previous_span)
+        if profiled:
+            tracer.sampler.remove(trace, thread_id)
+        if trace.sampled:
+            tracer._finish(trace)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Any]:
+    """Times the enclosed code as a child of the current span; a no-op unless the trace is sampled."""
+    trace = _current_trace.get()
+    if trace is None or not trace.sampled:
+        yield _NOOP_SPAN
+        return
+    parent = _current_span.get()
+    current = Span(trace, name, parent.span_id if parent is not None else None, attributes)
+    _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set("error", type(e).__name__)
+        raise
+    finally:
+        _current_span.set(parent)
+        current.finish()
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator form of `span` for sync and async functions."""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """p50 / p99 / max in milliseconds, for span attributes such as inter-token gaps."""
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {"p50": pick(0.5), "p99": pick(0.99), "max": round(ordered[-1] * 1000, 2)}
+
+
+class TraceIdFilter(logging.Filter):
+    """Stamps records with the current trace ID, which the JSON formatter writes out."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "trace_id"):
+            trace_id = get_trace_id()
+            if trace_id is not None:
+                record.trace_id = trace_id
+        return True
+
+
+def install_log_filter():
+    """Adds TraceIdFilter to the root logger's handlers (records from child loggers skip logger filters)."""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
@@ -0,0 +1,182 @@
+import json
+import os
+import struct
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without a full sort."""
+    k = min(k, scores.shape[0])
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class ExactIndex:
+    """Brute-force cosine search; the ground truth for recall measurements."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = _normalize(vectors)
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.vectors @ _normalize(query)
+        top = top_k_indices(scores, k)
+        return top, scores[top]
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index for cosine similarity.
+
+    Vectors are clustered with k-means and stored contiguously per cluster, so a
+    query only scores the `nprobe` closest clusters. Storage is float32 or int8
+    (symmetric per-dimension scale, folded into the query at search time), and the
+    vector block can be memory-mapped straight from disk.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, ids: np.ndarray,
+                 vectors: np.ndarray, scale: Optional[np.ndarray] = None, nprobe: int = 8):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.scale = scale
+        self.nprobe = nprobe
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: Optional[int] = None, dtype: str = "float32",
+              nprobe: int = 8, n_iter: int = 20, seed: int = 0) -> "IVFIndex":
+        vectors = _normalize(vectors)
+        n = vectors.shape[0]
+        n_lists = min(n_lists or max(1, int(np.sqrt(n))), n)
+        rng = np.random.default_rng(seed)
+
+        # k-means on a sample is enough to place the centroids.
+        sample = vectors[rng.choice(n, size=min(n, 256 * n_lists), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assignment == c]
+                if members.shape[0]:
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=n_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        stored = vectors[order]
+        scale = None
+        if dtype == "int8":
+            scale = np.maximum(np.abs(stored).max(axis=0), 1e-12) / 127.0
+            stored = np.round(stored / scale).astype(np.int8)
+        elif dtype != "float32":
+            raise ValueError(f"Unsupported IVF storage dtype '{dtype}'.")
+        return cls(centroids, list_offsets, order.astype(np.int64), stored, scale, nprobe)
+
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (row ids, cosine scores) of the approximate top-k, best first."""
+        query = _normalize(query)
+        probes = top_k_indices(self.centroids @ query, nprobe or self.nprobe)
+        if self.scale is not None:
+            query = query * self.scale
+
+        blocks, block_ids = [], []
+        for c in probes:
+            start, end = self.list_offsets[c], self.list_offsets[c + 1]
+            if end > start:
+                blocks.append(self.vectors[start:end])
+                block_ids.append(self.ids[start:end])
+        if not blocks:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        candidates = np.concatenate(blocks).astype(np.float32, copy=False)
+        scores = candidates @ query
+        top = top_k_indices(scores, k)
+        return np.concatenate(block_ids)[top], scores[top]
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "list_offsets.npy"), self.list_offsets)
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        if self.scale is not None:
+            np.save(os.path.join(path, "scale.npy"), self.scale)
+        with open(os.path.join(path, "ivf.json"), "w") as f:
+            json.dump({"nprobe": self.nprobe, "dtype": str(self.vectors.dtype)}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "IVFIndex":
+        """Loads an index; with `mmap` the vector block stays on disk and is paged in on demand."""
+        with open(os.path.join(path, "ivf.json")) as f:
+            meta = json.load(f)
+        scale_path = os.path.join(path, "scale.npy")
+        return cls(
+            centroids=np.load(os.path.join(path, "centroids.npy")),
+            list_offsets=np.load(os.path.join(path, "list_offsets.npy")),
+            ids=np.load(os.path.join(path, "ids.npy")),
+            vectors=np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None),
+            scale=np.load(scale_path) if os.path.exists(scale_path) else None,
+            nprobe=meta["nprobe"],
+        )
+
+
+def recall_at_k(index, exact: ExactIndex, queries: np.ndarray, k: int = 10) -> float:
+    """Mean fraction of the exact top-k neighbours that `index` also returns."""
+    hits = 0
+    for query in np.atleast_2d(queries):
+        approx_ids, _ = index.search(query, k)
+        exact_ids, _ = exact.search(query, k)
+        hits += len(np.intersect1d(approx_ids, exact_ids))
+    return hits / (k * np.atleast_2d(queries).shape[0])
+
+
+# Must match MAGIC / FORMAT_VERSION in ingestion_pipeline/src/embedding_store.py
+EMBEDDING_FILE_MAGIC = b"RAGEMB01"
+EMBEDDING_FILE_VERSION = 1
+
+
+def read_embedding_file(path: str) -> Tuple[List[str], np.ndarray]:
+    """
+    Reads the .remb embedding files written by the ingestion pipeline
+    (format documented in ingestion_pipeline/src/embedding_store.py) and returns
+    (chunk ids, float32 vectors) ready for IVFIndex.build.
+    """
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(buffer[:8]) != EMBEDDING_FILE_MAGIC:
+        raise ValueError(f"{path} is not a RAG embedding file.")
+    (header_length,) = struct.unpack("<Q", bytes(buffer[8:16]))
+    header = json.loads(bytes(buffer[16:16 + header_length]).decode("utf-8"))
+    if header["version"] != EMBEDDING_FILE_VERSION:
+        raise ValueError(f"{path} has unsupported embedding file version {header['version']}.")
+    dtype, dim, count = header["dtype"], header["dim"], header["count"]
+
+    storage = np.dtype(np.uint8 if dtype == "binary" else dtype)
+    row_items = header["row_bytes"] // storage.itemsize
+    rows = np.frombuffer(buffer, dtype=storage, count=count * row_items,
+                         offset=header["data_offset"]).reshape(count, row_items)
+    if dtype == "int8":
+        scale = np.frombuffer(buffer, dtype=np.float32, count=dim, offset=header["scale_offset"])
+        vectors = rows.astype(np.float32) * scale
+    elif dtype == "binary":
+        vectors = np.unpackbits(rows, axis=1, count=dim).astype(np.float32) * 2.0 - 1.0
+    else:
+        vectors = rows.astype(np.float32, copy=False)
+
+    ids_blob = bytes(buffer[header["ids_offset"]:header["ids_offset"] + header["ids_length"]])
+    return (ids_blob.decode("utf-8").split("\n") if count else []), vectors
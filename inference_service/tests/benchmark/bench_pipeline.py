@@ -0,0 +1,291 @@
+"""
+End-to-end pipeline benchmark against local stand-ins. RAGOrchestrator (or the
+FastAPI app, over an in-process ASGI transport) runs with fake retriever,
+reranker, HyDE, Bedrock streamer, guardrails and Redis, each with a log-normal
+latency (median / p99 in ms, all configurable). For every concurrency level it
+reports time-to-first-token, total latency percentiles, throughput and
+event-loop lag, and writes the results to tests/benchmark/results/ under the
+current commit so runs can be compared.
+
+Run from inference_service/:
+    python -m tests.benchmark.bench_pipeline --concurrency 1 16 64 --requests 400
+    python -m tests.benchmark.bench_pipeline --target app --golden data/processed/golden_evaluation_dataset.jsonl
+    python -m tests.benchmark.bench_pipeline --compare tests/benchmark/results/orchestrator-<sha>.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import time
+import zlib
+from contextlib import ExitStack
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from unittest import mock
+
+from src import orchestrator as orchestrator_module
+from src.answer_cache import AnswerCache
+from src.budget import LatencyBudget
+from src.coalescing import SingleFlight
+from src.fakes import (FakeGenerator, FakeQueryTransformer, FakeRedis, FakeReranker, FakeRetriever,
+                       LatencyDistribution)
+from src.orchestrator import RAGOrchestrator
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class LoopLagMonitor:
+    """Samples how late a periodic timer fires: time the loop spent unable to run ready callbacks."""
+
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s = interval_s
+        self.lags_ms: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            self.lags_ms.append(max(0.0, (time.perf_counter() - started - self.interval_s) * 1000))
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def latency_arg(value: str, name: str) -> LatencyDistribution:
+    """Each fake gets its own seed, derived from its name, so their delays are independent but repeatable."""
+    median, _, p99 = value.partition("/")
+    return LatencyDistribution(float(median) / 1000, float(p99 or median) / 1000, seed=zlib.crc32(name.encode()))
+
+
+def load_queries(golden: Optional[str], n: int) -> List[str]:
+    if golden:
+        with open(golden) as f:
+            queries = [json.loads(line)["query"] for line in f if line.strip()]
+    else:
+        queries = [f"{colour} {item} for {use}" for colour in ("red", "black", "navy", "green")
+                   for item in ("running shoes", "rain jacket", "wool sweater", "backpack", "hiking boots")
+                   for use in ("winter", "travel", "the office", "trail running", "kids")]
+    return [queries[i % len(queries)] for i in range(n)]
+
+
+def build_orchestrator(args) -> RAGOrchestrator:
+    documents = [{"id": f"chunk-{i}", "page_content": f"Product {i}: durable, lightweight, available in many colours.",
+                  "metadata": {"product_id": f"p{i}"}} for i in range(200)]
+    answer_cache = AnswerCache(redis_client=FakeRedis(latency_arg(args.redis_ms, "redis"))) if args.answer_cache else None
+    return RAGOrchestrator(
+        settings=None,
+        retriever_client=FakeRetriever(documents, latency_arg(args.retriever_ms, "retriever")),
+        reranker_client=FakeReranker(latency_arg(args.reranker_ms, "reranker")),
+        generator_client=FakeGenerator(latency_arg(args.first_token_ms, "first_token"),
+                                       latency_arg(args.inter_token_ms, "inter_token"), args.tokens),
+        transformer_client=FakeQueryTransformer(latency_arg(args.hyde_ms, "hyde")),
+        budget=LatencyBudget(),
+        answer_cache=answer_cache,
+        speculative_retrieval=args.speculative,
+        coalescer=SingleFlight() if args.coalescing else None,
+    )
+
+
+def fake_guardrails(latency: LatencyDistribution) -> ExitStack:
+    async def apply_input_guardrails(query: str) -> str:
+        await latency.wait()
+        return query
+
+    async def apply_output_guardrails(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+        async for token in tokens:
+            yield token
+
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(orchestrator_module.guardrails, "apply_input_guardrails", apply_input_guardrails))
+    stack.enter_context(mock.patch.object(orchestrator_module.guardrails, "apply_output_guardrails", apply_output_guardrails))
+    return stack
+
+
+def orchestrator_target(orchestrator: RAGOrchestrator) -> Callable[[str, str], AsyncIterator[str]]:
+    return orchestrator.stream_rag_response
+
+
+def app_target(orchestrator: RAGOrchestrator) -> Callable[[str, str], AsyncIterator[str]]:
+    """
+    Drives the FastAPI app directly over ASGI, in this process and event loop.
+    (httpx's ASGITransport buffers whole responses, which would hide time-to-first-token.)
+    The startup event, which builds real clients, is skipped; the fake-backed pipeline is injected instead.
+    """
+    from src.main import app
+
+    app.state.orchestrator = orchestrator
+
+    async def stream(query: str, user_id: str) -> AsyncIterator[str]:
+        body = json.dumps({"query": query, "user_id": user_id}).encode("utf-8")
+        chunks: asyncio.Queue = asyncio.Queue()
+        finished = asyncio.Event()
+        state = {"request_sent": False, "status": None}
+
+        async def receive():
+            if not state["request_sent"]:
+                state["request_sent"] = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    await chunks.put(message["body"].decode("utf-8"))
+                if not message.get("more_body"):
+                    await chunks.put(None)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": "/search", "raw_path": b"/search", "query_string": b"", "root_path": "",
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+        }
+        task = asyncio.create_task(app(scope, receive, send))
+        try:
+            while (chunk := await chunks.get()) is not None:
+                yield chunk
+            await task
+            if state["status"] != 200:
+                raise RuntimeError(f"/search returned {state['status']}")
+        finally:
+            finished.set()
+            if not task.done():
+                task.cancel()
+
+    return stream
+
+
+async def run_level(target, queries: List[str], concurrency: int) -> Dict:
+    ttft_ms: List[float] = []
+    total_ms: List[float] = []
+    errors = 0
+    next_query = iter(enumerate(queries))
+
+    async def worker():
+        nonlocal errors
+        for i, query in next_query:
+            started = time.perf_counter()
+            first = None
+            try:
+                async for _ in target(query, f"user-{i % 50}"):
+                    if first is None:
+                        first = time.perf_counter()
+            except Exception:
+                errors += 1
+                continue
+            total_ms.append((time.perf_counter() - started) * 1000)
+            if first is not None:
+                ttft_ms.append((first - started) * 1000)
+
+    with LoopLagMonitor() as lag:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(queries),
+        "errors": errors,
+        "throughput_rps": len(total_ms) / elapsed,
+        "ttft_ms": {f"p{q}": percentile(ttft_ms, q) for q in (50, 95, 99)},
+        "total_ms": {f"p{q}": percentile(total_ms, q) for q in (50, 95, 99)},
+        "loop_lag_ms": {"p99": percentile(lag.lags_ms, 99), "max": max(lag.lags_ms, default=0.0),
+                        "mean": statistics.mean(lag.lags_ms) if lag.lags_ms else 0.0},
+    }
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_level(level: Dict, baseline: Optional[Dict] = None):
+    def fmt(value: float, old: Optional[float]) -> str:
+        if old:
+            return f"{value:8.1f} ({(value - old) / old * 100:+5.1f}%)"
+        return f"{value:8.1f}"
+
+    old = baseline or {}
+    print(f"c={level['concurrency']:<4} "
+          f"rps {fmt(level['throughput_rps'], old.get('throughput_rps'))}  "
+          f"ttft p50 {fmt(level['ttft_ms']['p50'], old.get('ttft_ms', {}).get('p50'))}  "
+          f"p99 {fmt(level['ttft_ms']['p99'], old.get('ttft_ms', {}).get('p99'))}  "
+          f"total p50 {fmt(level['total_ms']['p50'], old.get('total_ms', {}).get('p50'))}  "
+          f"p99 {fmt(level['total_ms']['p99'], old.get('total_ms', {}).get('p99'))}  "
+          f"loop lag p99 {fmt(level['loop_lag_ms']['p99'], old.get('loop_lag_ms', {}).get('p99'))}  "
+          f"errors {level['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("orchestrator", "app"), default="orchestrator")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=300, help="requests per concurrency level")
+    parser.add_argument("--golden", help="golden dataset JSONL to draw queries from")
+    parser.add_argument("--retriever-ms", default="60/200", help="median[/p99] in ms")
+    parser.add_argument("--reranker-ms", default="80/250")
+    parser.add_argument("--hyde-ms", default="300/900")
+    parser.add_argument("--guardrails-ms", default="5/20")
+    parser.add_argument("--redis-ms", default="1/5")
+    parser.add_argument("--first-token-ms", default="350/1200")
+    parser.add_argument("--inter-token-ms", default="15/40")
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--speculative", action="store_true")
+    parser.add_argument("--coalescing", action="store_true")
+    parser.add_argument("--answer-cache", action="store_true")
+    parser.add_argument("--compare", help="earlier results file to print deltas against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+    # Per-request and degraded-stage logs would swamp the report; they show up in the latencies anyway.
+    logging.disable(logging.WARNING)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {level["concurrency"]: level for level in json.load(f)["levels"]}
+
+    async def run_all() -> List[Dict]:
+        levels = []
+        for concurrency in args.concurrency:
+            # A fresh pipeline per level, so caches and coalescing start cold each time.
+            orchestrator = build_orchestrator(args)
+            target = app_target(orchestrator) if args.target == "app" else orchestrator_target(orchestrator)
+            level = await run_level(target, load_queries(args.golden, args.requests), concurrency)
+            print_level(level, baseline.get(concurrency))
+            levels.append(level)
+        return levels
+
+    with fake_guardrails(latency_arg(args.guardrails_ms, "guardrails")):
+        levels = asyncio.run(run_all())
+
+    if not args.no_save:
+        commit = current_commit()
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{args.target}-{commit}.json")
+        with open(path, "w") as f:
+            json.dump({"commit": commit, "timestamp": time.time(), "args": vars(args), "levels": levels}, f, indent=2)
+        print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
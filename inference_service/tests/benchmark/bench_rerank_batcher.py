@@ -0,0 +1,58 @@
+"""
+Compares per-request rerank calls with micro-batched ones against a fake
+cross-encoder endpoint whose cost is a fixed overhead plus a per-pair cost.
+
+Run from inference_service/:
+    python -m tests.benchmark.bench_rerank_batcher --concurrency 32 --requests 512
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from src.fakes import FakeRerankerEndpoint
+from src.rerank_batcher import RerankBatcher, SageMakerPairScorer
+
+
+async def run(reranker, queries, candidates, concurrency):
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with slots:
+            started = time.perf_counter()
+            await reranker.rerank(query, candidates, None, top_k=5)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(query) for query in queries])
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--overhead-ms", type=float, default=15.0)
+    parser.add_argument("--per-pair-ms", type=float, default=0.05)
+    parser.add_argument("--max-batch-pairs", type=int, default=400)
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    candidates = [{"page_content": f"product {i} in colour {i % 7}"} for i in range(args.candidates)]
+    queries = [f"product {i % 97} colour {i % 7}" for i in range(args.requests)]
+
+    for name, max_batch_pairs, window_ms in [("per request", args.candidates, 0.0),
+                                             ("micro-batched", args.max_batch_pairs, args.window_ms)]:
+        endpoint = FakeRerankerEndpoint(args.overhead_ms / 1000, args.per_pair_ms / 1000)
+        batcher = RerankBatcher(SageMakerPairScorer("bench", client=endpoint), max_batch_pairs=max_batch_pairs,
+                                max_wait_ms=window_ms, max_concurrent_batches=args.concurrency)
+        elapsed, latencies = asyncio.run(run(batcher, queries, candidates, args.concurrency))
+        print(f"{name:14}: {args.requests / elapsed:7.1f} req/s, p50 {statistics.median(latencies) * 1000:6.1f} ms, "
+              f"p95 {latencies[int(0.95 * len(latencies))] * 1000:6.1f} ms, {len(endpoint.batch_sizes)} endpoint calls, "
+              f"mean batch {statistics.mean(endpoint.batch_sizes):.0f} pairs")
+
+
+if __name__ == "__main__":
+    main()
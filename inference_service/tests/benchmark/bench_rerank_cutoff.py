@@ -0,0 +1,120 @@
+"""
+Measures what adaptive candidate cutoffs and the score cache cost in NDCG@5 and
+save in reranker work. Candidates come from BM25 over the product descriptions
+(50 per query, with retriever scores); a FakeRerankerEndpoint with a fixed
+overhead and a per-pair cost plays the cross-encoder.
+
+Against the golden dataset (dataset_generation output) and the products it was built from:
+    python -m tests.benchmark.bench_rerank_cutoff --golden data/processed/golden_evaluation_dataset.jsonl \\
+        --products data/processed/products.jsonl
+Without them, a synthetic catalogue and query set are used.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import numpy as np
+
+from src.bm25 import BM25Index
+from src.fakes import FakeRerankerEndpoint
+from src.rerank_batcher import SageMakerPairScorer
+from src.rerank_cache import CachingReranker, CandidateCutoff, RerankScoreCache
+
+COLOURS = ["red", "blue", "green", "black", "white", "grey", "navy", "beige"]
+ITEMS = ["running shoes", "hiking boots", "rain jacket", "wool sweater", "denim jeans", "leather bag", "scarf", "cap"]
+MATERIALS = ["cotton", "leather", "wool", "nylon", "recycled polyester", "suede"]
+FEATURES = ["waterproof", "lightweight", "breathable", "insulated", "slim fit", "packable", "reflective"]
+
+
+def synthetic(n_products: int, n_queries: int, rng: random.Random):
+    products = []
+    for i in range(n_products):
+        colour, item, material = rng.choice(COLOURS), rng.choice(ITEMS), rng.choice(MATERIALS)
+        features = rng.sample(FEATURES, 2)
+        products.append({"product_id": str(i), "description": (
+            f"{colour} {item} made from {material}. {features[0].capitalize()} and {features[1]}, "
+            f"model {i}, for everyday use.")})
+    golden = []
+    for _ in range(n_queries):
+        product = rng.choice(products)
+        words = product["description"].rstrip(".").replace(",", "").split()
+        golden.append({"query": " ".join(rng.sample(words, 5)), "relevant_product_id": product["product_id"]})
+    return products, golden
+
+
+def load_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def ndcg_at_k(ranked_ids, relevant_id, k=5) -> float:
+    # Binary relevance with a single relevant product: the ideal DCG is 1.
+    for rank, product_id in enumerate(ranked_ids[:k]):
+        if product_id == relevant_id:
+            return 1.0 / np.log2(rank + 2)
+    return 0.0
+
+
+async def evaluate(reranker, golden, candidates, top_k=5):
+    scores, latencies = [], []
+    for record, docs in zip(golden, candidates):
+        started = time.perf_counter()
+        reranked = await reranker.rerank(record["query"], docs, None, top_k=top_k)
+        latencies.append(time.perf_counter() - started)
+        scores.append(ndcg_at_k([doc["metadata"]["product_id"] for doc in reranked], record["relevant_product_id"]))
+    return statistics.mean(scores), sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--golden")
+    parser.add_argument("--products")
+    parser.add_argument("--queries", type=int, default=500, help="synthetic queries (without --golden)")
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--overhead-ms", type=float, default=5.0)
+    parser.add_argument("--per-pair-ms", type=float, default=0.2)
+    parser.add_argument("--repeat-share", type=float, default=0.3, help="share of queries repeated for the cache run")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    if args.golden and args.products:
+        products, golden = load_jsonl(args.products), load_jsonl(args.golden)
+    else:
+        products, golden = synthetic(5000, args.queries, rng)
+
+    documents = [{"id": p["product_id"], "page_content": p["description"], "metadata": {"product_id": str(p["product_id"])}}
+                 for p in products]
+    index = BM25Index([doc["page_content"] for doc in documents])
+    candidates = []
+    for record in golden:
+        ids, bm25_scores = index.search(record["query"], args.candidates)
+        candidates.append([{**documents[i], "score": float(s)} for i, s in zip(ids.tolist(), bm25_scores.tolist())])
+
+    configs = [("all candidates", None)] + [
+        (f"cutoff min_k={min_k} gap={gap}", CandidateCutoff(min_k=min_k, max_gap=gap))
+        for min_k, gap in [(20, 0.2), (10, 0.2), (10, 0.1), (5, 0.1)]
+    ]
+    for name, cutoff in configs:
+        endpoint = FakeRerankerEndpoint(args.overhead_ms / 1000, args.per_pair_ms / 1000)
+        reranker = CachingReranker(SageMakerPairScorer("bench", client=endpoint), "bench", cutoff=cutoff)
+        ndcg, latencies = asyncio.run(evaluate(reranker, golden, candidates))
+        print(f"{name:28}: NDCG@5 {ndcg:.4f}, {reranker.stats['after_cutoff'] / len(golden):5.1f} pairs/query, "
+              f"rerank p50 {statistics.median(latencies) * 1000:5.1f} ms, p95 {latencies[int(0.95 * len(latencies))] * 1000:5.1f} ms")
+
+    # Repeated (popular) queries: the score cache skips pairs it has already scored.
+    repeats = [rng.randrange(len(golden)) for _ in range(int(len(golden) * args.repeat_share))]
+    workload = golden + [golden[i] for i in repeats]
+    workload_candidates = candidates + [candidates[i] for i in repeats]
+    endpoint = FakeRerankerEndpoint(args.overhead_ms / 1000, args.per_pair_ms / 1000)
+    cache = RerankScoreCache()
+    reranker = CachingReranker(SageMakerPairScorer("bench", client=endpoint), "bench", cache=cache)
+    ndcg, latencies = asyncio.run(evaluate(reranker, workload, workload_candidates))
+    print(f"{'score cache, repeats':28}: NDCG@5 {ndcg:.4f}, {reranker.stats['scored'] / len(workload):5.1f} pairs/query, "
+          f"rerank p50 {statistics.median(latencies) * 1000:5.1f} ms, hit rate {cache.hits / (cache.hits + cache.misses):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Reports recall@k and per-query latency of the local IVF index against exact search.
+
+Run from inference_service/:
+    python -m tests.benchmark.bench_vector_index --n 100000 --dim 1024
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.vector_index import ExactIndex, IVFIndex, recall_at_k
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(max(8, args.n // 500), args.dim))
+    vectors = (centers[rng.integers(centers.shape[0], size=args.n)]
+               + 0.5 * rng.normal(size=(args.n, args.dim))).astype(np.float32)
+    queries = vectors[rng.choice(args.n, size=args.queries, replace=False)] + 0.1 * rng.normal(size=(args.queries, args.dim))
+    exact = ExactIndex(vectors)
+
+    started = time.perf_counter()
+    for query in queries:
+        exact.search(query, args.k)
+    print(f"exact            : {(time.perf_counter() - started) / args.queries * 1000:.3f} ms/query")
+
+    for dtype in ("float32", "int8"):
+        index = IVFIndex.build(vectors, dtype=dtype)
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            started = time.perf_counter()
+            for query in queries:
+                index.search(query, args.k)
+            latency_ms = (time.perf_counter() - started) / args.queries * 1000
+            recall = recall_at_k(index, exact, queries, k=args.k)
+            print(f"ivf {dtype:7} nprobe={nprobe:<3}: {latency_ms:.3f} ms/query, recall@{args.k}={recall:.3f}, "
+                  f"vectors={index.vectors.nbytes / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Open-loop load generator for /search. Requests are sent on an arrival schedule
+(Poisson, or bursty: a Poisson process whose rate jumps by --burst-factor
+during bursts). A slow service therefore builds a queue, as it would in
+production, instead of slowing the client down as locust's closed loop does.
+Queries are replayed from a query log or the golden dataset. Each streamed
+response body is read incrementally, so time-to-first-token, inter-token
+latency and completion time are measured separately. Results are broken down by
+the X-Variant-Version response header (control / challenger).
+
+Run from inference_service/:
+    python -m tests.load.open_loop --url http://localhost:8000 --queries golden_evaluation_dataset.jsonl \\
+        --rate 20 --duration 120 --arrivals bursty --output results.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+
+@dataclass
+class RequestRecord:
+    scheduled_at: float
+    started_at: float = 0.0
+    status: Optional[int] = None
+    variant: str = "unknown"
+    ttft_s: Optional[float] = None
+    total_s: Optional[float] = None
+    inter_token_s: List[float] = field(default_factory=list)
+    bytes: int = 0
+    error: Optional[str] = None
+
+
+def load_queries(path: str) -> List[Tuple[str, Optional[str]]]:
+    """(query, user_id) pairs from JSONL records with a "query" field, or from plain text lines."""
+    queries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                queries.append((record["query"], record.get("user_id")))
+            else:
+                queries.append((line, None))
+    return queries
+
+
+def poisson_arrivals(rate: float, duration_s: float, rng: random.Random) -> Iterator[float]:
+    t = rng.expovariate(rate)
+    while t < duration_s:
+        yield t
+        t += rng.expovariate(rate)
+
+
+def bursty_arrivals(rate: float, duration_s: float, rng: random.Random, burst_factor: float = 5.0,
+                    mean_burst_s: float = 5.0, mean_calm_s: float = 30.0) -> Iterator[float]:
+    """
+    Two-state Markov-modulated Poisson process. The calm rate is set so the
+    long-run average stays at `rate`: calm_rate * (calm + factor * burst) / (calm + burst) = rate.
+    """
+    calm_rate = rate * (mean_calm_s + mean_burst_s) / (mean_calm_s + burst_factor * mean_burst_s)
+    t, bursting = 0.0, False
+    while t < duration_s:
+        state_end = t + rng.expovariate(1 / (mean_burst_s if bursting else mean_calm_s))
+        state_rate = calm_rate * (burst_factor if bursting else 1.0)
+        t += rng.expovariate(state_rate)
+        while t < min(state_end, duration_s):
+            yield t
+            t += rng.expovariate(state_rate)
+        t, bursting = state_end, not bursting
+
+
+async def send(client: httpx.AsyncClient, url: str, query: str, user_id: Optional[str], record: RequestRecord):
+    record.started_at = time.perf_counter()
+    last = record.started_at
+    try:
+        async with client.stream("POST", url, json={"query": query, "user_id": user_id}) as response:
+            record.status = response.status_code
+            record.variant = response.headers.get("X-Variant-Version", "unknown")
+            async for chunk in response.aiter_raw():
+                if not chunk:
+                    continue
+                now = time.perf_counter()
+                if record.ttft_s is None:
+                    record.ttft_s = now - record.started_at
+                else:
+                    record.inter_token_s.append(now - last)
+                last = now
+                record.bytes += len(chunk)
+        record.total_s = time.perf_counter() - record.started_at
+        if record.status != 200:
+            record.error = f"HTTP {record.status}"
+    except httpx.HTTPError as e:
+        record.error = type(e).__name__
+
+
+async def run(url: str, queries: List[Tuple[str, Optional[str]]], arrivals: List[float], max_in_flight: int,
+              timeout_s: float) -> Tuple[List[RequestRecord], int, float]:
+    """Fires one request per arrival time; returns the records, the arrivals dropped at the client cap, and the wall time."""
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    records: List[RequestRecord] = []
+    tasks = set()
+    dropped = 0
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(timeout_s, connect=5.0)) as client:
+        started = time.perf_counter()
+        for i, offset in enumerate(arrivals):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(tasks) >= max_in_flight:
+                # Never queue at the client: that would turn the open loop back into a closed one.
+                dropped += 1
+                continue
+            query, user_id = queries[i % len(queries)]
+            # send_lag (started_at - scheduled_at) shows when the generator itself cannot keep up.
+            record = RequestRecord(scheduled_at=started + offset)
+            records.append(record)
+            task = asyncio.create_task(send(client, url, query, user_id or f"load-user-{i % 1000}", record))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+        elapsed = time.perf_counter() - started
+    return records, dropped, elapsed
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] * 1000
+    return {"p50_ms": pick(50), "p90_ms": pick(90), "p99_ms": pick(99), "max_ms": ordered[-1] * 1000}
+
+
+def summarize(records: List[RequestRecord], elapsed_s: float) -> Dict[str, Dict]:
+    by_variant: Dict[str, List[RequestRecord]] = defaultdict(list)
+    for record in records:
+        by_variant[record.variant].append(record)
+        by_variant["all"].append(record)
+    summary = {}
+    for variant, group in sorted(by_variant.items()):
+        ok = [r for r in group if r.error is None]
+        summary[variant] = {
+            "requests": len(group),
+            "errors": len(group) - len(ok),
+            "error_kinds": dict(sorted({e: sum(r.error == e for r in group) for e in {r.error for r in group if r.error}}.items())),
+            "throughput_rps": len(ok) / elapsed_s if elapsed_s else 0.0,
+            "ttft": _percentiles([r.ttft_s for r in ok if r.ttft_s is not None]),
+            "inter_token": _percentiles([gap for r in ok for gap in r.inter_token_s]),
+            "total": _percentiles([r.total_s for r in ok]),
+            "send_lag": _percentiles([max(0.0, r.started_at - r.scheduled_at) for r in group]),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="service base URL")
+    parser.add_argument("--queries", required=True, help="query log or golden dataset (JSONL with 'query'), or text lines")
+    parser.add_argument("--rate", type=float, default=10.0, help="mean arrivals per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of arrivals")
+    parser.add_argument("--arrivals", choices=("poisson", "bursty"), default="poisson")
+    parser.add_argument("--burst-factor", type=float, default=5.0)
+    parser.add_argument("--mean-burst-s", type=float, default=5.0)
+    parser.add_argument("--mean-calm-s", type=float, default=30.0)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--shuffle", action="store_true", help="replay queries in random order")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the summary (and raw records) as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    queries = load_queries(args.queries)
+    if args.shuffle:
+        rng.shuffle(queries)
+    if args.arrivals == "poisson":
+        arrivals = list(poisson_arrivals(args.rate, args.duration, rng))
+    else:
+        arrivals = list(bursty_arrivals(args.rate, args.duration, rng, args.burst_factor,
+                                        args.mean_burst_s, args.mean_calm_s))
+
+    print(f"Sending {len(arrivals)} requests over {args.duration:.0f}s ({args.arrivals}, mean {args.rate}/s) "
+          f"to {args.url}/search")
+    records, dropped, elapsed = asyncio.run(run(f"{args.url.rstrip('/')}/search", queries, arrivals,
+                                                args.max_in_flight, args.timeout))
+    summary = summarize(records, elapsed)
+
+    for variant, stats in summary.items():
+        ttft, itl, total = stats["ttft"], stats["inter_token"], stats["total"]
+        print(f"{variant:12} {stats['requests']:6d} req, {stats['errors']:5d} errors, {stats['throughput_rps']:7.1f} rps | "
+              f"TTFT p50 {ttft.get('p50_ms', 0):7.0f} p99 {ttft.get('p99_ms', 0):7.0f} ms | "
+              f"ITL p50 {itl.get('p50_ms', 0):5.1f} p99 {itl.get('p99_ms', 0):6.1f} ms | "
+              f"total p50 {total.get('p50_ms', 0):7.0f} p99 {total.get('p99_ms', 0):7.0f} ms")
+    if dropped:
+        print(f"{dropped} arrivals dropped at the client (--max-in-flight {args.max_in_flight} reached).")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "dropped": dropped, "elapsed_s": elapsed, "summary": summary,
+                       "records": [asdict(r) for r in records]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
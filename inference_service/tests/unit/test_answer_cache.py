@@ -0,0 +1,58 @@
+import pytest
+
+from src.answer_cache import AnswerCache, replay
+from src.fakes import FakeRedis
+
+@pytest.mark.asyncio
+async def test_answer_cache_round_trip_through_redis_tier():
+    """A cached answer is shared via Redis and matched on the normalized query."""
+    redis_client = FakeRedis()
+    writer = AnswerCache(redis_client=redis_client)
+    reader = AnswerCache(redis_client=redis_client)  # e.g. another ECS task with a cold local tier
+
+    await writer.set("Waterproof trail running shoes", ["Try", " the", " X1."], product_ids=["p1"])
+    tokens = await reader.get("  waterproof trail-running shoes? ")
+
+    assert tokens == ["Try", " the", " X1."]
+    assert reader.hits["redis"] == 1
+    assert [t async for t in replay(tokens)] == tokens
+
+@pytest.mark.asyncio
+async def test_semantic_tier_matches_near_duplicate_queries():
+    embeddings = {
+        "waterproof trail running shoes": [1.0, 0.0, 0.1],
+        "water proof trail runners": [0.98, 0.0, 0.12],
+        "leather office shoes": [0.0, 1.0, 0.0],
+    }
+
+    async def embed(query):
+        return embeddings[query]
+
+    cache = AnswerCache(embed_fn=embed, semantic_threshold=0.95)
+    await cache.set("waterproof trail running shoes", ["cached"])
+
+    assert await cache.get("water proof trail runners") == ["cached"]
+    assert await cache.get("leather office shoes") is None
+
+@pytest.mark.asyncio
+async def test_invalidate_products_drops_answers_citing_them():
+    cache = AnswerCache(redis_client=FakeRedis())
+    await cache.set("trail shoes", ["a"], product_ids=["p1", "p2"])
+    await cache.set("hiking boots", ["b"], product_ids=["p3"])
+
+    assert await cache.invalidate_products(["p2"]) == 1
+    assert await cache.get("trail shoes") is None
+    assert await cache.get("hiking boots") == ["b"]
+
+@pytest.mark.asyncio
+async def test_personalization_buckets_keep_answers_apart():
+    async def embed(query):
+        return [1.0, 0.0]
+
+    cache = AnswerCache(redis_client=FakeRedis(), embed_fn=embed)
+    await cache.set("trail shoes", ["for bucket 1"], bucket="1")
+
+    assert await cache.get("trail shoes", bucket="1") == ["for bucket 1"]
+    assert await cache.get("trail shoes", bucket="2") is None
+    assert await cache.get("trail shoes") is None
+    assert await cache.get_similar("trail runners", bucket="1") == ["for bucket 1"]
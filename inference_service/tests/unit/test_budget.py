@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+
+from src.budget import LatencyBudget, StageTimer
+
+@pytest.mark.asyncio
+async def test_stage_timer_returns_fallback_on_timeout():
+    """A stage that overruns its timeout is cancelled and replaced by the fallback."""
+    timer = StageTimer(LatencyBudget(total_budget_s=None))
+    cancelled = asyncio.Event()
+
+    async def slow_stage():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    result = await timer.run("query_transform", slow_stage(), timeout=0.01, fallback="raw query")
+
+    assert result == "raw query"
+    assert cancelled.is_set()
+    assert timer.outcomes["query_transform"] == "timeout_fallback"
+    assert timer.spend_ms["query_transform"] < 500
+
+@pytest.mark.asyncio
+async def test_stage_timer_skips_stages_once_total_budget_is_spent():
+    """Once the overall budget is exhausted, stages without a fallback raise immediately."""
+    timer = StageTimer(LatencyBudget(total_budget_s=0.0))
+
+    async def stage():
+        return "never"
+
+    with pytest.raises(asyncio.TimeoutError):
+        await timer.run("retrieval", stage(), timeout=1.0)
+    assert timer.outcomes["retrieval"] == "skipped"
+
+def test_latency_budget_from_settings_keeps_defaults():
+    class Settings:
+        rerank_timeout_s = 0.2
+
+    budget = LatencyBudget.from_settings(Settings())
+    assert budget.rerank_timeout_s == 0.2
+    assert budget.retrieval_timeout_s == LatencyBudget().retrieval_timeout_s
@@ -0,0 +1,27 @@
+import asyncio
+import pytest
+from src import clients
+
+@pytest.mark.asyncio
+async def test_async_redis_is_shared_within_a_loop():
+    clients.reset()
+    client = clients.get_async_redis("cache.local")
+    assert clients.get_async_redis("cache.local") is client
+    assert clients.get_async_redis("other.local") is not client
+    clients.reset()
+
+def test_async_redis_is_not_shared_across_loops():
+    clients.reset()
+
+    async def get():
+        return clients.get_async_redis("cache.local")
+
+    assert asyncio.run(get()) is not asyncio.run(get())
+    clients.reset()
+
+@pytest.mark.asyncio
+async def test_warm_up_never_raises(mocker):
+    clients.reset()
+    mocker.patch.object(clients.boto3, "Session", side_effect=RuntimeError("no credentials"))
+    await clients.warm_up(object())
+    clients.reset()
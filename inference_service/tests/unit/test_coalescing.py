@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+
+from src.coalescing import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_streams_share_one_upstream():
+    """A late joiner receives the tokens it missed and the live tail, from a single upstream run."""
+    group = SingleFlight()
+    upstream_calls = 0
+    release = asyncio.Event()
+
+    async def upstream():
+        nonlocal upstream_calls
+        upstream_calls += 1
+        yield "a"
+        yield "b"
+        await release.wait()
+        yield "c"
+
+    async def consume():
+        return [token async for token in group.stream("key", upstream)]
+
+    leader = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)  # leader has already seen "a" and "b"
+    follower = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert await leader == ["a", "b", "c"]
+    assert await follower == ["a", "b", "c"]
+    assert upstream_calls == 1
+    assert group.joined == 1
+    assert group.in_flight() == 0
+
+@pytest.mark.asyncio
+async def test_upstream_is_cancelled_when_every_subscriber_leaves():
+    group = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def upstream():
+        try:
+            yield "a"
+            await asyncio.sleep(10)
+        finally:
+            cancelled.set()
+
+    stream = group.stream("key", upstream)
+    assert await stream.__anext__() == "a"
+    await stream.aclose()
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert group.in_flight() == 0
+
+@pytest.mark.asyncio
+async def test_request_right_after_the_last_subscriber_leaves_starts_fresh():
+    group = SingleFlight()
+    runs = 0
+
+    async def upstream():
+        nonlocal runs
+        runs += 1
+        yield "a"
+        await asyncio.sleep(0.01)
+        yield "b"
+
+    stream = group.stream("key", upstream)
+    assert await stream.__anext__() == "a"
+    await stream.aclose()
+    # Joins before the cancelled upstream task has had a chance to run.
+    assert [token async for token in group.stream("key", upstream)] == ["a", "b"]
+    assert runs == 2 and group.joined == 0
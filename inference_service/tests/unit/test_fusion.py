@@ -0,0 +1,15 @@
+from src.fusion import reciprocal_rank_fusion
+
+def test_rrf_rewards_documents_found_by_both_queries():
+    """Documents retrieved by both the raw and HyDE queries rank above single-list hits."""
+    hyde_docs = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    raw_docs = [{"id": "d"}, {"id": "c"}, {"id": "a"}]
+
+    fused = reciprocal_rank_fusion([hyde_docs, raw_docs])
+
+    assert [doc["id"] for doc in fused] == ["a", "c", "d", "b"]
+    assert fused[0]["rrf_score"] > fused[-1]["rrf_score"]
+
+def test_rrf_truncates_to_top_n():
+    fused = reciprocal_rank_fusion([[{"page_content": str(i)} for i in range(10)]], top_n=3)
+    assert [doc["page_content"] for doc in fused] == ["0", "1", "2"]
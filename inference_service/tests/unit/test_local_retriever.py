@@ -0,0 +1,95 @@
+import json
+import struct
+import threading
+
+import numpy as np
+import pytest
+
+from src.bm25 import BM25Index
+from src.local_retriever import LocalHybridRetriever
+from src.vector_index import read_embedding_file
+
+DOCUMENTS = [
+    {"page_content": "Waterproof trail running shoes with a grippy outsole.", "metadata": {"product_id": "p1"}},
+    {"page_content": "Leather office shoes for formal wear.", "metadata": {"product_id": "p2"}},
+    {"page_content": "Lightweight road running shoes.", "metadata": {"product_id": "p3"}},
+    {"page_content": "Insulated winter jacket, waterproof shell.", "metadata": {"product_id": "p4"}},
+]
+EMBEDDINGS = np.array([[1, 0, 0], [0, 1, 0], [0.8, 0.2, 0], [0.3, 0, 1]], dtype=np.float32)
+
+def test_bm25_ranks_documents_matching_more_query_terms_first():
+    index = BM25Index([doc["page_content"] for doc in DOCUMENTS])
+    doc_ids, scores = index.search("waterproof trail shoes", k=4)
+    assert doc_ids[0] == 0
+    assert list(scores) == sorted(scores, reverse=True)
+
+@pytest.mark.asyncio
+async def test_local_hybrid_retriever_blends_vector_and_keyword_scores(tmp_path):
+    async def embed(query):
+        return [1.0, 0.05, 0.0]
+
+    retriever = LocalHybridRetriever.build(DOCUMENTS, EMBEDDINGS, embed_fn=embed)
+    retriever.save(str(tmp_path))
+    loaded = LocalHybridRetriever.load(str(tmp_path), embed_fn=embed)
+
+    results = await loaded.retrieve("waterproof trail running shoes", top_k=2)
+
+    assert [doc["metadata"]["product_id"] for doc in results] == ["p1", "p3"]
+    assert results[0]["score"] >= results[1]["score"]
+
+@pytest.mark.asyncio
+async def test_local_search_runs_off_the_event_loop():
+    async def embed(query):
+        return [1.0, 0.0, 0.0]
+
+    retriever = LocalHybridRetriever.build(DOCUMENTS, EMBEDDINGS, embed_fn=embed)
+    search, threads = retriever.search, []
+
+    def recording_search(*args):
+        threads.append(threading.current_thread())
+        return search(*args)
+
+    retriever.search = recording_search
+    await retriever.retrieve("trail shoes", top_k=1)
+
+    assert threads and threads[0] is not threading.current_thread()
+
+def write_remb(path, ids, vectors, version=1):
+    """A float32 .remb file laid out as ingestion_pipeline/src/embedding_store.py writes it."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    ids_blob = "\n".join(ids).encode("utf-8")
+    header_length, data_offset = 448, 512
+    ids_offset = data_offset + (vectors.nbytes + 63) // 64 * 64
+    header = {"version": version, "dtype": "float32", "dim": vectors.shape[1], "count": len(ids),
+              "row_bytes": vectors.shape[1] * 4, "data_offset": data_offset, "ids_offset": ids_offset,
+              "ids_length": len(ids_blob), "scale_offset": None}
+    with open(path, "wb") as f:
+        f.write(b"RAGEMB01" + struct.pack("<Q", header_length) + json.dumps(header).encode().ljust(header_length))
+        f.write(b"\0" * (data_offset - f.tell()) + vectors.tobytes())
+        f.write(b"\0" * (ids_offset - f.tell()) + ids_blob)
+
+@pytest.mark.asyncio
+async def test_local_retriever_loads_ingestion_embedding_files(tmp_path):
+    """A directory of ingestion output (.remb plus documents) is indexed on load, rows matched by chunk ID."""
+    ids = [f"{doc['metadata']['product_id']}#0" for doc in DOCUMENTS]
+    write_remb(str(tmp_path / "embeddings.remb"), ids[::-1], EMBEDDINGS[::-1])
+    with open(tmp_path / "documents.jsonl", "w") as f:
+        for chunk_id, doc in zip(ids, DOCUMENTS):
+            f.write(json.dumps({"id": chunk_id, **doc}) + "\n")
+
+    async def embed(query):
+        return [1.0, 0.05, 0.0]
+
+    loaded = LocalHybridRetriever.load(str(tmp_path), embed_fn=embed)
+    results = await loaded.retrieve("waterproof trail running shoes", top_k=2)
+
+    assert [doc["metadata"]["product_id"] for doc in results] == ["p1", "p3"]
+
+def test_embedding_file_reader_handles_empty_files_and_rejects_other_versions(tmp_path):
+    write_remb(str(tmp_path / "empty.remb"), [], np.empty((0, 3)))
+    ids, vectors = read_embedding_file(str(tmp_path / "empty.remb"))
+    assert ids == [] and vectors.shape == (0, 3)
+
+    write_remb(str(tmp_path / "v2.remb"), ["a"], [[1.0, 0.0, 0.0]], version=2)
+    with pytest.raises(ValueError, match="version"):
+        read_embedding_file(str(tmp_path / "v2.remb"))
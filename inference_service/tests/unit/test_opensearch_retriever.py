@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+
+from src.opensearch_retriever import AsyncOpenSearchRetriever
+
+def hits(*ids):
+    return {"hits": {"hits": [
+        {"_id": doc_id, "_score": 1.0, "_source": {"text": f"text of {doc_id}", "metadata": {"product_id": doc_id}}}
+        for doc_id in ids
+    ]}}
+
+class FakeAsyncOpenSearch:
+    def __init__(self, fail_keyword=False):
+        self.fail_keyword = fail_keyword
+        self.queries = []
+
+    async def search(self, index, body):
+        kind = next(iter(body["query"]))
+        self.queries.append(kind)
+        await asyncio.sleep(0.01)
+        if kind == "match":
+            if self.fail_keyword:
+                raise ConnectionError("keyword leg down")
+            return hits("b", "c", "d")
+        return hits("a", "b", "c")
+
+@pytest.mark.asyncio
+async def test_keyword_search_overlaps_embedding_and_results_are_fused():
+    client = FakeAsyncOpenSearch()
+
+    async def embed(query):
+        await asyncio.sleep(0.001)
+        # The keyword query is already in flight while the query is embedded.
+        assert client.queries == ["match"]
+        return [0.1, 0.2]
+
+    results = await AsyncOpenSearchRetriever(client, "products", embed).retrieve("shoes", top_k=3)
+
+    assert [doc["id"] for doc in results] == ["b", "c", "a"]
+    assert results[0]["page_content"] == "text of b" and results[0]["metadata"] == {"product_id": "b"}
+    assert results[0]["score"] > results[-1]["score"]
+
+@pytest.mark.asyncio
+async def test_keyword_failure_degrades_to_vector_results():
+    async def embed(query):
+        return [0.1, 0.2]
+
+    results = await AsyncOpenSearchRetriever(FakeAsyncOpenSearch(fail_keyword=True), "products", embed).retrieve("shoes")
+    assert [doc["id"] for doc in results] == ["a", "b", "c"]
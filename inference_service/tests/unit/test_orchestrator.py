@@ -1,20 +1,27 @@
+import asyncio
+import time
 import pytest
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, MagicMock
 
+from src.budget import LatencyBudget
 from src.orchestrator import RAGOrchestrator
 
+async def async_tokens(tokens):
+    for token in tokens:
+        yield token
+
 @pytest.mark.asyncio
 async def test_orchestrator_full_flow(mocker):
     """Tests the full orchestration flow with mocked dependencies."""
     # ARRANGE: Mock all external clients and their async methods
     mock_retriever = AsyncMock()
     mock_reranker = AsyncMock()
-    mock_generator = AsyncMock()
+    mock_generator = MagicMock()
     mock_transformer = AsyncMock()
 
     mock_retriever.retrieve.return_value = [{"page_content": "doc1"}]
     mock_reranker.rerank.return_value = [{"page_content": "reranked_doc1"}]
-    mock_generator.stream_response.return_value = (token for token in ["This", " is", " a", " test."]) # Async generator mock
+    mock_generator.stream_response.return_value = async_tokens(["This", " is", " a", " test."])
     mock_transformer.transform_query.return_value = "transformed query"
     
     mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
@@ -39,4 +46,349 @@ async def test_orchestrator_full_flow(mocker):
     mock_reranker.rerank.assert_awaited_once()
     mock_generator.construct_prompt.assert_called_once()
     mock_generator.stream_response.assert_called_once()
-    assert result == "This is a test."
\ No newline at end of file
+    assert result == "This is a test."
+
+@pytest.mark.asyncio
+async def test_each_response_is_logged_as_a_structured_record(mocker, caplog):
+    """The log processor's quality signals are computed from this record."""
+    mock_retriever = AsyncMock()
+    mock_retriever.retrieve.return_value = [{"page_content": "doc1"}]
+    mock_reranker = AsyncMock()
+    mock_reranker.rerank.return_value = [{"page_content": "reranked_doc1"}]
+    mock_generator = MagicMock()
+    mock_generator.stream_response.return_value = async_tokens(["This", " is", " grounded."])
+    mock_transformer = AsyncMock()
+    mock_transformer.transform_query.return_value = "transformed query"
+    mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
+    mocker.patch('src.guardrails.apply_output_guardrails', side_effect=lambda x: x)
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=mock_reranker,
+        generator_client=mock_generator,
+        transformer_client=mock_transformer,
+        variant="challenger",
+    )
+
+    with caplog.at_level("INFO", logger="src.orchestrator"):
+        [token async for token in orchestrator_instance.stream_rag_response("test query", "user123")]
+
+    [record] = [r for r in caplog.records if r.getMessage() == "RAG response"]
+    assert (record.query, record.user_id, record.variant) == ("test query", "user123", "challenger")
+    assert record.answer == "This is grounded." and record.context == ["reranked_doc1"]
+    assert record.answer_source == "pipeline" and record.total_ms > 0
+
+@pytest.mark.asyncio
+async def test_orchestrator_degrades_slow_stages(mocker):
+    """A slow HyDE call falls back to the raw query and a slow rerank to the retriever's top-k."""
+    async def slow(result, delay=1.0):
+        await asyncio.sleep(delay)
+        return result
+
+    mock_retriever = AsyncMock()
+    mock_reranker = MagicMock()
+    mock_generator = MagicMock()
+    mock_transformer = MagicMock()
+
+    retrieved = [{"page_content": f"doc{i}"} for i in range(10)]
+    mock_retriever.retrieve.return_value = retrieved
+    mock_transformer.transform_query.side_effect = lambda q: slow("transformed query")
+    mock_reranker.rerank.side_effect = lambda *args, **kwargs: slow([])
+    mock_generator.stream_response.return_value = async_tokens(["ok"])
+
+    mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
+    mocker.patch('src.guardrails.apply_output_guardrails', side_effect=lambda x: x)
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=mock_reranker,
+        generator_client=mock_generator,
+        transformer_client=mock_transformer,
+        budget=LatencyBudget(query_transform_timeout_s=0.05, rerank_timeout_s=0.05, fallback_top_k=3),
+    )
+
+    result = "".join([token async for token in orchestrator_instance.stream_rag_response("raw query", "user123")])
+
+    assert result == "ok"
+    mock_retriever.retrieve.assert_awaited_once_with("raw query", top_k=50)
+    mock_generator.construct_prompt.assert_called_once_with("safe query", retrieved[:3])
+
+@pytest.mark.asyncio
+async def test_speculative_retrieval_fuses_raw_and_hyde_candidates(mocker):
+    """In speculative mode both the raw and HyDE queries are retrieved and fused before reranking."""
+    mock_retriever = AsyncMock()
+    mock_reranker = AsyncMock()
+    mock_generator = MagicMock()
+    mock_transformer = AsyncMock()
+
+    mock_retriever.retrieve.side_effect = lambda q, top_k: [{"id": f"{q}-doc"}, {"id": "shared"}]
+    mock_reranker.rerank.side_effect = lambda query, docs, user_id, top_k: docs[:top_k]
+    mock_transformer.transform_query.return_value = "hyde query"
+    mock_generator.stream_response.return_value = async_tokens(["ok"])
+
+    mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
+    mocker.patch('src.guardrails.apply_output_guardrails', side_effect=lambda x: x)
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=mock_reranker,
+        generator_client=mock_generator,
+        transformer_client=mock_transformer,
+        speculative_retrieval=True,
+    )
+
+    result = "".join([token async for token in orchestrator_instance.stream_rag_response("raw query", "user123")])
+
+    assert result == "ok"
+    assert [call.args[0] for call in mock_retriever.retrieve.await_args_list] == ["raw query", "hyde query"]
+    reranked_candidates = mock_reranker.rerank.await_args.args[1]
+    assert reranked_candidates[0]["id"] == "shared"
+    assert {doc["id"] for doc in reranked_candidates} == {"shared", "raw query-doc", "hyde query-doc"}
+
+@pytest.mark.asyncio
+async def test_cached_answer_skips_the_pipeline(mocker):
+    """A cache hit is replayed token by token without touching retrieval or generation."""
+    mock_retriever = AsyncMock()
+    mock_generator = MagicMock()
+    answer_cache = AsyncMock()
+    answer_cache.get.return_value = ["cached", " answer"]
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=AsyncMock(),
+        generator_client=mock_generator,
+        transformer_client=AsyncMock(),
+        answer_cache=answer_cache,
+    )
+
+    result = [token async for token in orchestrator_instance.stream_rag_response("trail shoes", "user123")]
+
+    assert result == ["cached", " answer"]
+    mock_retriever.retrieve.assert_not_awaited()
+    mock_generator.stream_response.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_retrieval_timeout_replays_cached_answer(mocker):
+    """When retrieval misses its deadline, a cached answer is replayed like a normal cache hit."""
+    from src import orchestrator as orchestrator_module
+
+    async def slow_retrieve(query, top_k):
+        await asyncio.sleep(1)
+
+    mock_retriever = AsyncMock()
+    mock_retriever.retrieve.side_effect = slow_retrieve
+    mock_transformer = AsyncMock()
+    mock_transformer.transform_query.return_value = "transformed query"
+    answer_cache = AsyncMock()
+    answer_cache.semantic = None
+    # Too slow for the up-front lookup, in time for the fallback one.
+    answer_cache.get.side_effect = [None, ["cached", " answer"]]
+    mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
+    replay = mocker.patch.object(orchestrator_module, "replay", side_effect=orchestrator_module.replay)
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=AsyncMock(),
+        generator_client=MagicMock(),
+        transformer_client=mock_transformer,
+        answer_cache=answer_cache,
+        budget=LatencyBudget(retrieval_timeout_s=0.05),
+    )
+
+    result = [token async for token in orchestrator_instance.stream_rag_response("trail shoes", "u1")]
+
+    assert result == ["cached", " answer"]
+    replay.assert_called_once_with(["cached", " answer"])
+
+@pytest.mark.asyncio
+async def test_semantic_cache_hit_within_its_own_budget(mocker):
+    """Embedding the query takes longer than the exact-lookup budget; the semantic tier still answers."""
+    from src.answer_cache import AnswerCache
+
+    async def slow_embed(query):
+        await asyncio.sleep(0.1)
+        return [1.0, 0.0] if "trail" in query else [0.0, 1.0]
+
+    async def slow_transform(query):
+        await asyncio.sleep(0.2)
+        return "transformed query"
+
+    answer_cache = AnswerCache(embed_fn=slow_embed, semantic_threshold=0.9)
+    await answer_cache.set("waterproof trail shoes", ["cached", " answer"], bucket="user:u1")
+    mock_retriever = AsyncMock()
+    mock_transformer = AsyncMock()
+    mock_transformer.transform_query.side_effect = slow_transform
+    mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=AsyncMock(),
+        generator_client=MagicMock(),
+        transformer_client=mock_transformer,
+        answer_cache=answer_cache,
+    )
+
+    started = time.perf_counter()
+    result = [token async for token in orchestrator_instance.stream_rag_response("trail shoes, waterproof?", "u1")]
+
+    assert result == ["cached", " answer"]
+    assert answer_cache.hits["semantic"] == 1
+    mock_retriever.retrieve.assert_not_awaited()
+    assert time.perf_counter() - started < 0.2  # HyDE was not waited for
+
+@pytest.mark.asyncio
+async def test_semantic_cache_miss_does_not_delay_retrieval(mocker):
+    """Retrieval starts while the semantic tier is still embedding the query."""
+    from src.answer_cache import AnswerCache
+
+    async def slow_embed(query):
+        await asyncio.sleep(0.2)
+        return [0.0, 1.0]
+
+    started = time.perf_counter()
+    retrieval_started_at = []
+
+    async def retrieve(query, top_k):
+        retrieval_started_at.append(time.perf_counter() - started)
+        return [{"page_content": "doc1"}]
+
+    mock_retriever = AsyncMock()
+    mock_retriever.retrieve.side_effect = retrieve
+    mock_transformer = AsyncMock()
+    mock_transformer.transform_query.return_value = "transformed query"
+    mock_generator = MagicMock()
+    mock_generator.stream_response.return_value = async_tokens(["fresh", " answer"])
+    mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
+    mocker.patch('src.guardrails.apply_output_guardrails', side_effect=lambda x: x)
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=AsyncMock(),
+        generator_client=mock_generator,
+        transformer_client=mock_transformer,
+        answer_cache=AnswerCache(embed_fn=slow_embed, semantic_threshold=0.9),
+    )
+
+    result = [token async for token in orchestrator_instance.stream_rag_response("trail shoes", "u1")]
+
+    assert result == ["fresh", " answer"]
+    assert retrieval_started_at[0] < 0.1
+
+@pytest.mark.asyncio
+async def test_cached_answers_are_not_shared_between_users_by_default(mocker):
+    """One user's re-ranked answer is not served to another user."""
+    from src.answer_cache import AnswerCache
+
+    mock_retriever = AsyncMock()
+    mock_retriever.retrieve.return_value = [{"page_content": "doc1"}]
+    mock_transformer = AsyncMock()
+    mock_transformer.transform_query.return_value = "transformed query"
+    mock_generator = MagicMock()
+    mock_generator.stream_response.side_effect = lambda prompt: async_tokens(["answer"])
+    mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
+    mocker.patch('src.guardrails.apply_output_guardrails', side_effect=lambda x: x)
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=AsyncMock(),
+        generator_client=mock_generator,
+        transformer_client=mock_transformer,
+        answer_cache=AnswerCache(),
+    )
+
+    for user_id in ("u1", "u2", "u1"):
+        [token async for token in orchestrator_instance.stream_rag_response("trail shoes", user_id)]
+
+    assert mock_retriever.retrieve.await_count == 2
+    assert orchestrator_instance.answer_cache.hits["local"] == 1
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_requests_are_coalesced(mocker):
+    """Two concurrent requests for the same normalized query trigger a single retrieval."""
+    from src.coalescing import SingleFlight
+
+    async def slow_tokens():
+        for token in ["shared", " answer"]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    mock_retriever = AsyncMock()
+    mock_generator = MagicMock()
+    mock_transformer = AsyncMock()
+    mock_retriever.retrieve.return_value = [{"page_content": "doc1"}]
+    mock_transformer.transform_query.return_value = "transformed query"
+    mock_generator.stream_response.side_effect = lambda prompt: slow_tokens()
+
+    mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
+    mocker.patch('src.guardrails.apply_output_guardrails', side_effect=lambda x: x)
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=AsyncMock(),
+        generator_client=mock_generator,
+        transformer_client=mock_transformer,
+        coalescer=SingleFlight(),
+        personalization_buckets=1,  # everyone shares one bucket
+    )
+
+    async def search(query, user_id):
+        return "".join([t async for t in orchestrator_instance.stream_rag_response(query, user_id)])
+
+    results = await asyncio.gather(search("Trail shoes", "u1"), search("trail shoes!", "u2"))
+
+    assert results == ["shared answer", "shared answer"]
+    mock_retriever.retrieve.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_different_users_are_not_coalesced_by_default(mocker):
+    """Without configured buckets, only the same user's identical requests share a run."""
+    from src.coalescing import SingleFlight
+
+    async def slow_tokens():
+        for token in ["personal", " answer"]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    mock_retriever = AsyncMock()
+    mock_generator = MagicMock()
+    mock_transformer = AsyncMock()
+    mock_retriever.retrieve.return_value = [{"page_content": "doc1"}]
+    mock_transformer.transform_query.return_value = "transformed query"
+    mock_generator.stream_response.side_effect = lambda prompt: slow_tokens()
+
+    mocker.patch('src.guardrails.apply_input_guardrails', return_value="safe query")
+    mocker.patch('src.guardrails.apply_output_guardrails', side_effect=lambda x: x)
+
+    orchestrator_instance = RAGOrchestrator(
+        settings=mocker.Mock(),
+        retriever_client=mock_retriever,
+        reranker_client=AsyncMock(),
+        generator_client=mock_generator,
+        transformer_client=mock_transformer,
+        coalescer=SingleFlight(),
+    )
+
+    async def search(query, user_id):
+        return "".join([t async for t in orchestrator_instance.stream_rag_response(query, user_id)])
+
+    await asyncio.gather(search("trail shoes", "u1"), search("trail shoes", "u2"), search("Trail shoes", "u1"))
+
+    assert mock_retriever.retrieve.await_count == 2
+    assert orchestrator_instance.coalescer.joined == 1
+
+@pytest.mark.asyncio
+async def test_pair_scoring_rerankers_need_personalisation_switched_off():
+    """Batching, score caching and cutoff rerank without the user, so they are not enabled silently."""
+    from types import SimpleNamespace
+
+    with pytest.raises(ValueError, match="personalized_rerank"):
+        await RAGOrchestrator.create(SimpleNamespace(rerank_score_cache=True))
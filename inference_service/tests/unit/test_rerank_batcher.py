@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+
+from src.fakes import FakeRerankerEndpoint
+from src.rerank_batcher import RerankBatcher, SageMakerPairScorer
+
+def docs(*texts):
+    return [{"id": str(i), "page_content": text} for i, text in enumerate(texts)]
+
+CATALOGUE = docs("red running shoes", "blue denim jacket", "red wool scarf", "trail running shoes, waterproof")
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_endpoint_call():
+    endpoint = FakeRerankerEndpoint(overhead_s=0.01)
+    batcher = RerankBatcher(SageMakerPairScorer("reranker", client=endpoint), max_batch_pairs=64, max_wait_ms=20)
+
+    results = await asyncio.gather(
+        batcher.rerank("red shoes", CATALOGUE, "u1", top_k=2),
+        batcher.rerank("running shoes waterproof", CATALOGUE, "u2", top_k=1),
+        batcher.rerank("red shoes", CATALOGUE, "u3", top_k=2),
+    )
+
+    assert endpoint.batch_sizes == [8]  # 12 pairs, identical ones scored once
+    assert [doc["id"] for doc in results[0]] == ["0", "2"]
+    assert results[0][0]["rerank_score"] == 1.0
+    assert [doc["id"] for doc in results[1]] == ["3"]
+    assert results[2] == results[0]
+
+@pytest.mark.asyncio
+async def test_batches_are_capped_and_large_requests_split():
+    endpoint = FakeRerankerEndpoint()
+    batcher = RerankBatcher(SageMakerPairScorer("reranker", client=endpoint), max_batch_pairs=4, max_wait_ms=50)
+
+    many = docs(*[f"product {i}" for i in range(10)])
+    results = await batcher.rerank("product 7", many, None, top_k=3)
+
+    assert endpoint.batch_sizes == [4, 4, 2]
+    assert results[0]["id"] == "7"
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_is_dropped_and_errors_reach_every_waiter():
+    class FailingScorer:
+        async def score(self, pairs):
+            raise RuntimeError("endpoint down")
+
+    batcher = RerankBatcher(FailingScorer(), max_wait_ms=20)
+    gave_up = asyncio.create_task(batcher.rerank("q", CATALOGUE))
+    waiting = asyncio.create_task(batcher.rerank("q2", CATALOGUE))
+    await asyncio.sleep(0)
+    gave_up.cancel()
+
+    with pytest.raises(RuntimeError, match="endpoint down"):
+        await waiting
+    assert batcher.stats["pairs"] == len(CATALOGUE)
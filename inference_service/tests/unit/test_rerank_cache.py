@@ -0,0 +1,44 @@
+import time
+
+import pytest
+
+from src.fakes import FakeRerankerEndpoint
+from src.rerank_batcher import SageMakerPairScorer
+from src.rerank_cache import CachingReranker, CandidateCutoff, RerankScoreCache
+
+def ranked(*scores):
+    return [{"id": f"c{i}", "page_content": f"chunk {i}", "score": score} for i, score in enumerate(scores)]
+
+def test_cutoff_stops_at_the_first_large_gap_but_keeps_min_k():
+    docs = ranked(0.95, 0.93, 0.9, 0.88, 0.4, 0.38, 0.35, 0.3)
+    assert [d["id"] for d in CandidateCutoff(min_k=2, max_gap=0.3).apply(docs)] == ["c0", "c1", "c2", "c3"]
+    assert len(CandidateCutoff(min_k=6, max_gap=0.3).apply(docs)) == 8
+    # Unscored or unordered lists are left alone.
+    assert len(CandidateCutoff(min_k=2).apply([{"id": str(i)} for i in range(5)])) == 5
+    assert len(CandidateCutoff(min_k=2, max_gap=0.3).apply(list(reversed(docs)))) == 8
+
+def test_score_cache_evicts_least_recently_used_and_expires(monkeypatch):
+    cache = RerankScoreCache(max_entries=2, ttl_s=10)
+    cache.put_many("Red shoes", {"a": 0.9, "b": 0.1}, "v1")
+    assert cache.get_many("red shoes!", ["a"], "v1") == {"a": 0.9}  # normalized query
+    assert cache.get_many("red shoes", ["a"], "v2") == {}  # other model version
+    cache.put_many("red shoes", {"c": 0.5}, "v1")
+    assert cache.get_many("red shoes", ["a", "b", "c"], "v1") == {"a": 0.9, "c": 0.5}
+
+    later = time.monotonic() + 11
+    monkeypatch.setattr("src.rerank_cache.time.monotonic", lambda: later)
+    assert cache.get_many("red shoes", ["a"], "v1") == {}
+
+@pytest.mark.asyncio
+async def test_repeated_queries_only_score_new_pairs():
+    endpoint = FakeRerankerEndpoint()
+    reranker = CachingReranker(SageMakerPairScorer("reranker", client=endpoint), "v1", cache=RerankScoreCache())
+    docs = ranked(0.9, 0.8, 0.7)
+    docs[2]["page_content"] = "red shoes"
+
+    first = await reranker.rerank("red shoes", docs, "u1", top_k=2)
+    second = await reranker.rerank("Red shoes?", docs + ranked(0.6, 0.5, 0.4, 0.3)[3:], "u2", top_k=2)
+
+    assert endpoint.batch_sizes == [3, 1]
+    assert first[0]["id"] == second[0]["id"] == "c2"
+    assert first[0]["rerank_score"] == 1.0
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from src import tracing
+from src.budget import LatencyBudget
+from src.fakes import FakeGenerator, FakeQueryTransformer, FakeReranker, FakeRetriever, LatencyDistribution
+from src.orchestrator import RAGOrchestrator
+
+
+class ListExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace.to_dict())
+
+
+@pytest.fixture
+def exporter():
+    previous = tracing.get_tracer()
+    exporter = ListExporter()
+    yield tracing.configure(tracing.Tracer(sample_rate=1.0, exporter=exporter)).exporter
+    tracing.configure(previous)
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_across_tasks_and_trace_id_reaches_logs(exporter, caplog):
+    @tracing.traced("child")
+    async def child():
+        await asyncio.sleep(0.001)
+        logging.getLogger("test").info("inside child")
+
+    handler = caplog.handler
+    handler.addFilter(tracing.TraceIdFilter())
+    with caplog.at_level(logging.INFO, logger="test"):
+        with tracing.start_trace("search", trace_id="abc123"):
+            with tracing.span("parent"):
+                await asyncio.gather(asyncio.create_task(child()), child())
+        assert tracing.get_trace_id() is None
+
+    [trace] = exporter.traces
+    assert trace["trace_id"] == "abc123"
+    spans = {s["id"]: s for s in trace["spans"]}
+    parent = next(s for s in spans.values() if s["name"] == "parent")
+    children = [s for s in spans.values() if s["name"] == "child"]
+    assert len(children) == 2 and all(s["parent"] == parent["id"] for s in children)
+    assert [r.trace_id for r in caplog.records if r.name == "test"] == ["abc123", "abc123"]
+
+
+@pytest.mark.asyncio
+async def test_unsampled_traces_record_nothing(exporter):
+    tracing.get_tracer().sample_rate = 0.0
+    with tracing.start_trace("search") as trace:
+        with tracing.span("retrieval") as s:
+            assert not s.recording
+    assert trace.spans == [] and exporter.traces == []
+    assert trace.trace_id  # still available for log correlation
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_stages_and_token_timing_are_traced(exporter, mocker):
+    async def passthrough(tokens):
+        async for token in tokens:
+            yield token
+
+    async def safe(query):
+        return query
+
+    mocker.patch("src.guardrails.apply_input_guardrails", side_effect=safe)
+    mocker.patch("src.guardrails.apply_output_guardrails", side_effect=passthrough)
+    fast = LatencyDistribution(0.002)
+    docs = [{"id": f"d{i}", "page_content": f"doc {i}", "metadata": {}} for i in range(10)]
+    orchestrator = RAGOrchestrator(None, FakeRetriever(docs, fast), FakeReranker(fast),
+                                   FakeGenerator(fast, LatencyDistribution(0.001), tokens=5),
+                                   FakeQueryTransformer(fast), budget=LatencyBudget())
+
+    with tracing.start_trace("search"):
+        answer = [token async for token in orchestrator.stream_rag_response("red shoes", "u1")]
+
+    [trace] = exporter.traces
+    names = [s["name"] for s in trace["spans"]]
+    for stage in ("guardrails", "query_transform", "retrieval", "rerank", "generation"):
+        assert stage in names
+    generation = next(s for s in trace["spans"] if s["name"] == "generation")
+    assert generation["attributes"]["tokens"] == len(answer)
+    assert generation["attributes"]["ttft_ms"] > 0
+    assert set(generation["attributes"]["inter_token_ms"]) == {"p50", "p99", "max"}
+
+
+def test_profiled_slow_trace_exports_hot_stacks(exporter):
+    tracing.configure(tracing.Tracer(exporter=exporter, slow_ms=20, profile_rate=1.0, profile_interval_ms=1))
+
+    def busy_wait():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+
+    with tracing.start_trace("slow"):
+        busy_wait()
+    with tracing.start_trace("fast"):
+        pass
+
+    [trace] = exporter.traces
+    assert trace["name"] == "slow"
+    assert any("busy_wait" in entry["stack"] for entry in trace["profile"])
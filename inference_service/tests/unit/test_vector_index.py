@@ -0,0 +1,29 @@
+import numpy as np
+
+from src.vector_index import ExactIndex, IVFIndex, recall_at_k
+
+def clustered_vectors(n=2000, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+def test_ivf_recall_against_exact_search():
+    """IVF search recovers most of the exact top-10 for both float32 and int8 storage."""
+    vectors = clustered_vectors()
+    queries = vectors[:50] + 0.05
+    exact = ExactIndex(vectors)
+
+    for dtype in ("float32", "int8"):
+        index = IVFIndex.build(vectors, n_lists=32, dtype=dtype, nprobe=6)
+        assert recall_at_k(index, exact, queries, k=10) >= 0.9
+
+def test_ivf_index_round_trips_through_memory_mapped_files(tmp_path):
+    vectors = clustered_vectors(n=500)
+    index = IVFIndex.build(vectors, n_lists=8, dtype="int8")
+    index.save(str(tmp_path))
+
+    loaded = IVFIndex.load(str(tmp_path), mmap=True)
+
+    assert isinstance(loaded.vectors, np.memmap)
+    ids, _ = loaded.search(vectors[7], k=1)
+    assert ids[0] == 7
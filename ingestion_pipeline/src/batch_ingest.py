@@ -0,0 +1,464 @@
+"""
+Batch catalogue ingestion: a single worker streams every product under an S3
+prefix (or a local directory) through load -> clean/chunk -> embed -> index,
+with bounded queues between the stages and a checkpoint file so a crashed run
+resumes where it stopped. The per-product state machine remains the path for
+individual catalogue updates.
+
+With --snapshot-dir the indexed chunks are also written as a local index
+directory (`embeddings.remb` plus `documents.jsonl`) that the inference
+service's LocalHybridRetriever loads.
+
+Run from ingestion_pipeline/:
+    python -m src.batch_ingest --bucket my-catalogue --prefix products/ \\
+        --opensearch-host abc.us-east-1.aoss.amazonaws.com --index products \\
+        --checkpoint /tmp/catalogue.ckpt
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Awaitable, Callable, Iterator, List, Optional, Protocol, Sequence, Set, Union
+
+import numpy as np
+
+from . import clients
+from .delta_indexer import DeltaPlan, ManifestStore, assign_chunk_ids, build_bulk_actions, plan_product_update
+from .embedding_store import write_embedding_file
+from .text_processor import chunk_text, clean_text
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # end-of-stream marker passed between stages
+
+
+class ObjectSource(Protocol):
+    def list_keys(self) -> Iterator[str]:
+        ...
+
+    def read(self, key: str) -> bytes:
+        ...
+
+    async def read_async(self, key: str) -> bytes:
+        ...
+
+
+class S3ObjectSource:
+    """Product JSON objects under an S3 prefix, listed page by page."""
+
+    def __init__(self, bucket: str, prefix: str = "", client=None, suffix: str = ".json",
+                 max_pool_connections: int = 64):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.suffix = suffix
+        self.max_pool_connections = max_pool_connections
+        # The connection pool has to cover the loader concurrency.
+        self.client = client or clients.get_s3_client(max_pool_connections=max_pool_connections)
+
+    def list_keys(self) -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(self.suffix):
+                    yield obj["Key"]
+
+    def read(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    async def read_async(self, key: str) -> bytes:
+        if not clients.HAS_AIOBOTOCORE:
+            return await asyncio.to_thread(self.read, key)
+        client = await clients.get_async_boto3_client("s3", max_pool_connections=self.max_pool_connections)
+        response = await client.get_object(Bucket=self.bucket, Key=key)
+        async with response["Body"] as stream:
+            return await stream.read()
+
+
+class LocalDirectorySource:
+    """Product JSON files under a local directory, for tests and local runs."""
+
+    def __init__(self, root: str, suffix: str = ".json"):
+        self.root = root
+        self.suffix = suffix
+
+    def list_keys(self) -> Iterator[str]:
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith(self.suffix):
+                    yield os.path.relpath(os.path.join(dirpath, name), self.root)
+
+    def read(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), "rb") as f:
+            return f.read()
+
+    async def read_async(self, key: str) -> bytes:
+        return await asyncio.to_thread(self.read, key)
+
+
+class Checkpoint:
+    """
+    Append-only JSONL of keys whose chunks are indexed; a restarted run skips them.
+    Keys whose indexing failed are recorded too, and retried by the next run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Set[str] = set()
+        self.failed: Set[str] = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        key = record["key"]
+                    except (json.JSONDecodeError, KeyError):
+                        continue  # a line torn by the crash
+                    if record.get("failed"):
+                        self.failed.add(key)
+                    else:
+                        self.completed.add(key)
+                        self.failed.discard(key)
+        self._file = open(path, "a")
+
+    def _append(self, records: List[dict]):
+        self._file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def mark(self, keys: Sequence[str]):
+        self._append([{"key": key} for key in keys])
+        self.completed.update(keys)
+        self.failed.difference_update(keys)
+
+    def mark_failed(self, keys: Sequence[str]):
+        self._append([{"key": key, "failed": True} for key in keys])
+        self.failed.update(keys)
+
+    def close(self):
+        self._file.close()
+
+
+class IndexSnapshot:
+    """
+    Local index directory of the chunks indexed in one run: documents are
+    appended to `documents.jsonl` as they are indexed, and the vectors are
+    written to `embeddings.remb` (see embedding_store) on `close`.
+    Products skipped through the checkpoint are not included.
+    """
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        self.path = path
+        self.dtype = dtype
+        os.makedirs(path, exist_ok=True)
+        self._documents = open(os.path.join(path, "documents.jsonl"), "w")
+        self._ids: List[str] = []
+        self._vectors: List[np.ndarray] = []
+
+    def add(self, chunk_ids: Sequence[str], texts: Sequence[str], vectors: np.ndarray, metadata: dict):
+        for chunk_id, text in zip(chunk_ids, texts):
+            self._documents.write(json.dumps({"id": chunk_id, "page_content": text, "metadata": metadata}) + "\n")
+        self._ids.extend(chunk_ids)
+        self._vectors.append(np.asarray(vectors, dtype=np.float32))
+
+    def close(self):
+        self._documents.close()
+        vectors = np.vstack(self._vectors) if self._vectors else np.empty((0, 0), dtype=np.float32)
+        write_embedding_file(os.path.join(self.path, "embeddings.remb"), self._ids, vectors, self.dtype)
+
+
+@dataclass
+class PreparedProduct:
+    key: str
+    product_id: str
+    chunks: List[str]
+    metadata: dict
+    embeddings: Optional[np.ndarray] = None
+    plan: Optional[DeltaPlan] = None  # diff against the stored manifest, when manifests are kept
+
+    @property
+    def texts_to_embed(self) -> List[str]:
+        return [text for _, text in self.plan.upserts] if self.plan is not None else self.chunks
+
+
+@dataclass
+class IngestStats:
+    listed: int = 0
+    skipped: int = 0
+    products: int = 0
+    chunks: int = 0
+    deleted: int = 0
+    failed: List[str] = field(default_factory=list)
+    elapsed_s: float = 0.0
+
+    @property
+    def products_per_minute(self) -> float:
+        return 60.0 * self.products / self.elapsed_s if self.elapsed_s else 0.0
+
+
+def prepare_product(key: str, raw: bytes, chunk_size: int = 1000, chunk_overlap: int = 200) -> PreparedProduct:
+    """Parses one product file and cleans/chunks its description, as the state machine's Lambdas do."""
+    product = json.loads(raw)
+    product_id = str(product["product_id"])
+    chunks = chunk_text(clean_text(product.get("description") or ""), chunk_size, chunk_overlap)
+    metadata = {k: v for k, v in product.items() if k != "description"}
+    metadata["product_id"] = product_id
+    return PreparedProduct(key=key, product_id=product_id, chunks=chunks, metadata=metadata)
+
+
+class BatchIngestor:
+    """
+    Runs the pipeline stages as asyncio tasks joined by bounded queues, so a slow
+    stage applies back-pressure instead of letting the catalogue pile up in memory.
+    Chunks of many products share embedding and bulk requests. Document IDs are
+    deterministic, so re-indexing after a crash is idempotent. `index_fn` may be a
+    coroutine function (async client) or a blocking one (run on a worker thread).
+
+    With a manifest store, each product is diffed against its stored manifest as
+    in the incremental path: only new chunks are embedded and indexed, chunks
+    that disappeared are deleted and metadata-only changes become partial updates.
+    Otherwise every chunk is indexed, and can also be written to an IndexSnapshot.
+    """
+
+    def __init__(self, source: ObjectSource, embed_fn: Callable[[List[str]], Awaitable[np.ndarray]],
+                 index_fn: Callable[[List[dict]], Union[Awaitable[object], object]], checkpoint: Checkpoint,
+                 manifest_store: Optional[ManifestStore] = None, load_concurrency: int = 32,
+                 queue_size: int = 256, embed_batch_chunks: int = 256, index_batch_docs: int = 500,
+                 chunk_size: int = 1000, chunk_overlap: int = 200, snapshot: Optional[IndexSnapshot] = None):
+        if snapshot is not None and manifest_store is not None:
+            raise ValueError("A snapshot needs every chunk; it cannot be combined with a manifest store.")
+        self.source = source
+        self.embed_fn = embed_fn
+        self.index_fn = index_fn
+        self.checkpoint = checkpoint
+        self.manifest_store = manifest_store
+        self.load_concurrency = load_concurrency
+        self.queue_size = queue_size
+        self.embed_batch_chunks = embed_batch_chunks
+        self.index_batch_docs = index_batch_docs
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.snapshot = snapshot
+        self.stats = IngestStats()
+
+    async def _list(self, keys_out: asyncio.Queue):
+        keys = iter(self.source.list_keys())
+        while True:
+            # Listing blocks on S3, so pages are pulled in a thread.
+            page = await asyncio.to_thread(lambda: list(islice(keys, 1000)))
+            if not page:
+                break
+            for key in page:
+                self.stats.listed += 1
+                if key in self.checkpoint.completed:
+                    self.stats.skipped += 1
+                    continue
+                await keys_out.put(key)
+        for _ in range(self.load_concurrency):
+            await keys_out.put(_DONE)
+
+    async def _load(self, keys_in: asyncio.Queue, products_out: asyncio.Queue):
+        while (key := await keys_in.get()) is not _DONE:
+            try:
+                raw = await self.source.read_async(key)
+                # Cleaning and chunking are CPU-bound, so they stay off the event loop.
+                product = await asyncio.to_thread(prepare_product, key, raw, self.chunk_size, self.chunk_overlap)
+                if self.manifest_store is not None:
+                    previous = await asyncio.to_thread(self.manifest_store.get, product.product_id)
+                    product.plan = plan_product_update(product.product_id, product.chunks, product.metadata, previous)
+            except Exception as e:
+                # Left out of the checkpoint, so the next run retries it.
+                logger.error(f"Skipping {key}: {e}")
+                self.stats.failed.append(key)
+                continue
+            await products_out.put(product)
+        await products_out.put(_DONE)
+
+    async def _embed(self, products_in: asyncio.Queue, products_out: asyncio.Queue):
+        pending: List[PreparedProduct] = []
+        pending_chunks = 0
+        loaders_running = self.load_concurrency
+
+        async def flush():
+            nonlocal pending, pending_chunks
+            texts = [text for product in pending for text in product.texts_to_embed]
+            vectors = await self.embed_fn(texts) if texts else np.empty((0, 0), dtype=np.float32)
+            start = 0
+            for product in pending:
+                count = len(product.texts_to_embed)
+                product.embeddings = vectors[start:start + count]
+                start += count
+                await products_out.put(product)
+            pending, pending_chunks = [], 0
+
+        while loaders_running:
+            item = await products_in.get()
+            if item is _DONE:
+                loaders_running -= 1
+            else:
+                pending.append(item)
+                pending_chunks += len(item.texts_to_embed)
+            # Embed once a batch is full, or when the loaders have nothing ready.
+            if pending and (pending_chunks >= self.embed_batch_chunks or products_in.empty()):
+                await flush()
+        if pending:
+            await flush()
+        await products_out.put(_DONE)
+
+    def _save_manifests(self, batch: List[PreparedProduct]):
+        for product in batch:
+            self.manifest_store.put(product.product_id, product.plan.manifest)
+
+    async def _index(self, products_in: asyncio.Queue):
+        batch: List[PreparedProduct] = []
+        documents: List[dict] = []
+
+        async def flush():
+            nonlocal batch, documents
+            try:
+                if documents:
+                    if asyncio.iscoroutinefunction(self.index_fn):
+                        await self.index_fn(documents)
+                    else:
+                        await asyncio.to_thread(self.index_fn, documents)
+            except Exception as e:
+                # Recorded as failed, so the run carries on and the next one retries them.
+                keys = [product.key for product in batch]
+                logger.error(f"Indexing {len(keys)} products failed, e.g. {keys[0]}: {e}")
+                self.checkpoint.mark_failed(keys)
+                self.stats.failed.extend(keys)
+                batch, documents = [], []
+                return
+            if self.manifest_store is not None:
+                # Saved only once the index has the product's new chunks.
+                await asyncio.to_thread(self._save_manifests, batch)
+            if self.snapshot is not None:
+                for product in batch:
+                    chunk_ids = [chunk_id for chunk_id, _ in assign_chunk_ids(product.product_id, product.chunks)]
+                    self.snapshot.add(chunk_ids, product.chunks, product.embeddings, product.metadata)
+            self.checkpoint.mark([product.key for product in batch])
+            self.stats.products += len(batch)
+            for product in batch:
+                self.stats.chunks += len(product.texts_to_embed)
+                self.stats.deleted += len(product.plan.deletes) if product.plan is not None else 0
+            batch, documents = [], []
+
+        while (product := await products_in.get()) is not _DONE:
+            if product.plan is not None:
+                documents.extend(build_bulk_actions(product.plan, product.embeddings, product.metadata))
+            else:
+                chunk_ids = assign_chunk_ids(product.product_id, product.chunks)
+                for (chunk_id, _), text, vector in zip(chunk_ids, product.chunks, product.embeddings):
+                    documents.append({"_id": chunk_id, "text": text, "embedding": vector.tolist(),
+                                      "metadata": product.metadata})
+            batch.append(product)
+            if len(documents) >= self.index_batch_docs:
+                await flush()
+        if batch:
+            await flush()
+
+    async def run(self) -> IngestStats:
+        started = time.perf_counter()
+        keys: asyncio.Queue = asyncio.Queue(self.queue_size)
+        loaded: asyncio.Queue = asyncio.Queue(self.queue_size)
+        embedded: asyncio.Queue = asyncio.Queue(self.queue_size)
+        tasks = [
+            asyncio.create_task(self._list(keys)),
+            *[asyncio.create_task(self._load(keys, loaded)) for _ in range(self.load_concurrency)],
+            asyncio.create_task(self._embed(loaded, embedded)),
+            asyncio.create_task(self._index(embedded)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self.stats.elapsed_s = time.perf_counter() - started
+        logger.info(f"Ingested {self.stats.products} products ({self.stats.chunks} chunks indexed, "
+                    f"{self.stats.deleted} stale chunks deleted) in "
+                    f"{self.stats.elapsed_s:.1f}s, {self.stats.products_per_minute:.0f} products/min; "
+                    f"{self.stats.skipped} already done, {len(self.stats.failed)} failed.")
+        return self.stats
+
+
+def main():
+    from .bulk_indexer import AsyncBulkIndexer, bulk_load_mode
+    from .delta_indexer import LocalManifestStore
+    from .embedding_cache import CachedEmbeddingEngine, create_cache_from_env
+    from .embedding_engine import BedrockEmbeddingProvider, EmbeddingEngine
+    from .opensearch_indexer import get_opensearch_client
+
+    parser = argparse.ArgumentParser(description="Ingest a whole product catalogue in one run.")
+    parser.add_argument("--bucket", help="S3 bucket holding one JSON file per product")
+    parser.add_argument("--prefix", default="")
+    parser.add_argument("--local-dir", help="read products from a directory instead of S3")
+    parser.add_argument("--opensearch-host", required=True)
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION", "us-east-1"))
+    parser.add_argument("--index", default="products")
+    parser.add_argument("--checkpoint", default="catalogue-ingest.ckpt")
+    parser.add_argument("--manifest-dir", help="keep delta-indexing manifests and only reindex what changed")
+    parser.add_argument("--snapshot-dir", help="also write the indexed chunks as a local retriever index")
+    parser.add_argument("--load-concurrency", type=int, default=32)
+    parser.add_argument("--bulk-load-mode", action="store_true",
+                        help="disable refresh and replicas during the run (managed domains only)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.local_dir:
+        source = LocalDirectorySource(args.local_dir)
+    elif args.bucket:
+        source = S3ObjectSource(args.bucket, args.prefix, max_pool_connections=args.load_concurrency * 2)
+    else:
+        parser.error("one of --bucket or --local-dir is required")
+    if args.snapshot_dir and args.manifest_dir:
+        parser.error("--snapshot-dir needs every chunk and cannot be combined with --manifest-dir")
+
+    # Loads, embedding calls and bulk requests all run on the event loop; without
+    # aiobotocore, S3 and Bedrock calls fall back to the thread pool.
+    engine = CachedEmbeddingEngine(EmbeddingEngine(BedrockEmbeddingProvider(native_async=True)),
+                                   create_cache_from_env())
+    checkpoint = Checkpoint(args.checkpoint)
+    snapshot = IndexSnapshot(args.snapshot_dir) if args.snapshot_dir else None
+
+    async def run():
+        indexer = AsyncBulkIndexer(clients.get_async_opensearch_client(args.opensearch_host, args.region),
+                                   args.index)
+
+        async def index_fn(documents: List[dict]):
+            result = await indexer.index(documents)
+            if result.failed:
+                # Raising records the batch's products as failed, so the next run retries them.
+                raise RuntimeError(f"{len(result.failed)} documents failed to index, e.g. {result.failed[0]}")
+
+        ingestor = BatchIngestor(
+            source, engine.embed, index_fn, checkpoint,
+            manifest_store=LocalManifestStore(args.manifest_dir) if args.manifest_dir else None,
+            load_concurrency=args.load_concurrency, snapshot=snapshot,
+        )
+        try:
+            await ingestor.run()
+        finally:
+            engine.emit_hit_rate()
+            await clients.close_async_clients()
+
+    try:
+        if args.bulk_load_mode:
+            with bulk_load_mode(get_opensearch_client(args.opensearch_host, args.region), args.index):
+                asyncio.run(run())
+        else:
+            asyncio.run(run())
+    finally:
+        checkpoint.close()
+        if snapshot is not None:
+            snapshot.close()
+
+
+if __name__ == "__main__":
+    main()
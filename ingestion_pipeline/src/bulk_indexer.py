@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional
+
+from opensearchpy.exceptions import ConnectionError, TransportError
+from opensearchpy.helpers.actions import expand_action
+
+logger = logging.getLogger(__name__)
+
+# Item or request statuses worth retrying: 429 is the cluster's back-pressure signal.
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+@dataclass
+class BulkResult:
+    succeeded: int = 0
+    failed: List[dict] = field(default_factory=list)
+    requests: int = 0
+    retried_items: int = 0
+    elapsed_s: float = 0.0
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.succeeded / self.elapsed_s if self.elapsed_s else 0.0
+
+
+def serialize_action(action: dict, index_name: Optional[str] = None) -> bytes:
+    """One bulk action (same dict shape as `helpers.bulk` accepts) as its NDJSON lines."""
+    if index_name is not None and "_index" not in action:
+        action = {**action, "_index": index_name}
+    meta, body = expand_action(action)
+    lines = json.dumps(meta) + "\n"
+    if body is not None:
+        lines += json.dumps(body) + "\n"
+    return lines.encode("utf-8")
+
+
+class BulkIndexer:
+    """
+    Parallel bulk indexing over the client's connection pool. Requests are cut by
+    both byte size and doc count; the doc count shrinks when the cluster rejects
+    or slows down and grows back while requests stay fast. Only the items that were
+    rejected are resent, with full-jitter exponential backoff.
+    """
+
+    def __init__(self, client, index_name: Optional[str] = None, max_chunk_bytes: int = 10 * 1024 * 1024,
+                 max_chunk_docs: int = 1000, min_chunk_docs: int = 50, max_concurrency: int = 8,
+                 max_retries: int = 6, base_backoff_s: float = 0.5, max_backoff_s: float = 30.0,
+                 target_request_s: float = 2.0):
+        self.client = client
+        self.index_name = index_name
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_chunk_docs = max_chunk_docs
+        self.min_chunk_docs = min(min_chunk_docs, max_chunk_docs)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff_s = base_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.target_request_s = target_request_s
+        self.chunk_docs = max_chunk_docs
+        self._lock = threading.Lock()
+
+    def _adapt(self, rejected: bool, elapsed_s: float):
+        with self._lock:
+            if rejected:
+                self.chunk_docs = max(self.min_chunk_docs, self.chunk_docs // 2)
+            elif elapsed_s > self.target_request_s:
+                self.chunk_docs = max(self.min_chunk_docs, int(self.chunk_docs * 0.75))
+            else:
+                self.chunk_docs = min(self.max_chunk_docs, int(self.chunk_docs * 1.25) + 1)
+
+    def _chunks(self, actions: Iterable[dict]) -> Iterator[List[bytes]]:
+        current: List[bytes] = []
+        current_bytes = 0
+        for action in actions:
+            line = serialize_action(action, self.index_name)
+            if current and (len(current) >= self.chunk_docs or current_bytes + len(line) > self.max_chunk_bytes):
+                yield current
+                current, current_bytes = [], 0
+            current.append(line)
+            current_bytes += len(line)
+        if current:
+            yield current
+
+    def _partition(self, lines: List[bytes], response: Optional[dict], result: BulkResult) -> List[bytes]:
+        """Records the outcome of one bulk response and returns the lines worth resending."""
+        if response is None:
+            return lines
+        to_retry = []
+        for line, item in zip(lines, response["items"]):
+            ((op_type, outcome),) = item.items()
+            status = outcome.get("status", 500)
+            if status < 300 or (op_type == "delete" and status == 404):
+                result.succeeded += 1
+            elif status in RETRYABLE_STATUSES:
+                to_retry.append(line)
+            else:
+                result.failed.append(item)
+        return to_retry
+
+    def _backoff_s(self, attempt: int) -> float:
+        # Full-jitter exponential backoff
+        return random.uniform(0, min(self.max_backoff_s, self.base_backoff_s * 2 ** attempt))
+
+    @staticmethod
+    def _give_up(to_retry: List[bytes], result: BulkResult):
+        result.failed.extend({"error": "rejected after retries", "action": line.split(b"\n", 1)[0].decode()}
+                             for line in to_retry)
+
+    @staticmethod
+    def _is_retryable(error: TransportError) -> bool:
+        return isinstance(error, ConnectionError) or error.status_code in RETRYABLE_STATUSES
+
+    def _send(self, lines: List[bytes]) -> BulkResult:
+        result = BulkResult()
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            result.requests += 1
+            try:
+                response = self.client.bulk(body=b"".join(lines))
+            except TransportError as e:
+                if not self._is_retryable(e):
+                    raise
+                response = None
+            to_retry = self._partition(lines, response, result)
+            self._adapt(rejected=bool(to_retry), elapsed_s=time.perf_counter() - started)
+            if not to_retry:
+                return result
+            if attempt == self.max_retries:
+                self._give_up(to_retry, result)
+                return result
+            result.retried_items += len(to_retry)
+            lines = to_retry
+            time.sleep(self._backoff_s(attempt))
+        return result
+
+    def index(self, actions: Iterable[dict]) -> BulkResult:
+        """Indexes `actions` (a list or a generator) and returns the combined outcome."""
+        total = BulkResult()
+        started = time.perf_counter()
+        # Bounds how far the producer runs ahead of the requests in flight.
+        slots = threading.BoundedSemaphore(self.max_concurrency * 2)
+        futures = []
+        with ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="bulk") as pool:
+            for chunk in self._chunks(actions):
+                slots.acquire()
+                future = pool.submit(self._send, chunk)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+            for future in futures:
+                part = future.result()
+                total.succeeded += part.succeeded
+                total.failed.extend(part.failed)
+                total.requests += part.requests
+                total.retried_items += part.retried_items
+        total.elapsed_s = time.perf_counter() - started
+        logger.info(f"Bulk indexed {total.succeeded} docs in {total.requests} requests "
+                    f"({total.retried_items} items retried, {len(total.failed)} failed), "
+                    f"{total.docs_per_second:.0f} docs/s.")
+        return total
+
+
+class AsyncBulkIndexer(BulkIndexer):
+    """
+    BulkIndexer for an AsyncOpenSearch client: the same sizing, retry and
+    backoff rules, with requests in flight as tasks on the running event loop
+    instead of threads.
+    """
+
+    async def _send_async(self, lines: List[bytes]) -> BulkResult:
+        result = BulkResult()
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            result.requests += 1
+            try:
+                response = await self.client.bulk(body=b"".join(lines))
+            except TransportError as e:
+                if not self._is_retryable(e):
+                    raise
+                response = None
+            to_retry = self._partition(lines, response, result)
+            self._adapt(rejected=bool(to_retry), elapsed_s=time.perf_counter() - started)
+            if not to_retry:
+                return result
+            if attempt == self.max_retries:
+                self._give_up(to_retry, result)
+                return result
+            result.retried_items += len(to_retry)
+            lines = to_retry
+            await asyncio.sleep(self._backoff_s(attempt))
+        return result
+
+    async def index(self, actions: Iterable[dict]) -> BulkResult:
+        total = BulkResult()
+        started = time.perf_counter()
+        slots = asyncio.Semaphore(self.max_concurrency)
+        tasks = []
+
+        async def send(chunk: List[bytes]) -> BulkResult:
+            try:
+                return await self._send_async(chunk)
+            finally:
+                slots.release()
+
+        try:
+            for chunk in self._chunks(actions):
+                await slots.acquire()
+                tasks.append(asyncio.create_task(send(chunk)))
+            for part in await asyncio.gather(*tasks):
+                total.succeeded += part.succeeded
+                total.failed.extend(part.failed)
+                total.requests += part.requests
+                total.retried_items += part.retried_items
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        total.elapsed_s = time.perf_counter() - started
+        logger.info(f"Bulk indexed {total.succeeded} docs in {total.requests} requests "
+                    f"({total.retried_items} items retried, {len(total.failed)} failed), "
+                    f"{total.docs_per_second:.0f} docs/s.")
+        return total
+
+
+@contextmanager
+def bulk_load_mode(client, index_name: str):
+    """
+    Turns off refresh and replicas for the duration of a large load, then restores
+    the previous settings and refreshes once. For managed OpenSearch domains;
+    Serverless collections manage these settings themselves.
+    """
+    current = client.indices.get_settings(index=index_name)[index_name]["settings"]["index"]
+    previous = {
+        "refresh_interval": current.get("refresh_interval", "1s"),
+        "number_of_replicas": current.get("number_of_replicas", "1"),
+    }
+    client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+    logger.info(f"Bulk load mode on for '{index_name}' (was {previous}).")
+    try:
+        yield
+    finally:
+        client.indices.put_settings(index=index_name, body={"index": previous})
+        client.indices.refresh(index=index_name)
+        logger.info(f"Bulk load mode off for '{index_name}'.")
@@ -0,0 +1,32 @@
+import logging
+import os
+from typing import Iterable
+
+from . import clients
+
+logger = logging.getLogger(__name__)
+
+clients.warm_up_in_lambda(services=(), redis_host=os.environ.get("REDIS_HOST"))
+
+# Must match the key layout in inference_service/src/answer_cache.py
+KEY_PREFIX = "answer-cache"
+
+
+def invalidate_cached_answers(redis_client, product_ids: Iterable[str]) -> int:
+    """Deletes every cached RAG answer that cites one of the reindexed products."""
+    stale = set()
+    for product_id in product_ids:
+        product_key = f"{KEY_PREFIX}:product:{product_id}"
+        stale.update(redis_client.smembers(product_key))
+        redis_client.delete(product_key)
+    if stale:
+        redis_client.delete(*stale)
+    logger.info(f"Invalidated {len(stale)} cached answers.")
+    return len(stale)
+
+
+def handler(event, context):
+    """Step Functions task run after indexing; accepts `product_id` or `product_ids`."""
+    product_ids = event.get("product_ids") or [event["product_id"]]
+    redis_client = clients.get_redis_client(os.environ["REDIS_HOST"])
+    return {"invalidated": invalidate_cached_answers(redis_client, product_ids)}
@@ -0,0 +1,180 @@
+"""
+Shared text cleaning and chunking for ingestion and dataset generation.
+
+The splitter follows RecursiveCharacterTextSplitter's algorithm (same separators,
+separators kept at the start of a split, whitespace stripped), so chunks are
+identical to the ones it produces. Splits are tracked as (start, end) offsets
+into the input rather than as copied substrings. That gives every chunk its
+position in the source text for free, and strings are only materialised for the
+final chunks. Splitter configurations (compiled separator patterns) are built once
+and reused; `chunk_documents` spreads large batches over a process pool.
+
+This module has no dependencies on the rest of the pipeline, so other components
+can import it directly (e.g. `from ingestion_pipeline.src import chunking`).
+"""
+import logging
+import multiprocessing
+import re
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TAG = re.compile(r"<[^>]+>")
+# Word pieces and punctuation: a tokenizer-free approximation of subword token counts.
+_TOKEN = re.compile(r"\w{1,8}|[^\w\s]")
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+
+def clean_text(text: str) -> str:
+    """Removes HTML tags."""
+    return _TAG.sub("", text)
+
+
+def approximate_token_count(text: str) -> int:
+    return len(_TOKEN.findall(text))
+
+
+@dataclass(frozen=True)
+class ChunkerConfig:
+    chunk_size: int = 1000
+    chunk_overlap: int = 200
+    separators: Tuple[str, ...] = DEFAULT_SEPARATORS
+    length_unit: str = "chars"  # or "tokens": sizes counted with approximate_token_count
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # text == source[start:end]
+    end: int
+
+
+class Chunker:
+    def __init__(self, config: ChunkerConfig = ChunkerConfig()):
+        if config.chunk_overlap > config.chunk_size:
+            raise ValueError(f"chunk_overlap ({config.chunk_overlap}) is larger than chunk_size ({config.chunk_size}).")
+        if config.length_unit not in ("chars", "tokens"):
+            raise ValueError(f"Unknown length_unit '{config.length_unit}'. Expected 'chars' or 'tokens'.")
+        self.config = config
+        self._patterns = [re.compile(re.escape(sep)) if sep else None for sep in config.separators]
+        self._count_tokens = config.length_unit == "tokens"
+
+    def _length(self, text: str, start: int, end: int) -> int:
+        if self._count_tokens:
+            return len(_TOKEN.findall(text, start, end))
+        return end - start
+
+    def _pieces(self, text: str, start: int, end: int, level: int) -> List[Tuple[int, int]]:
+        pattern = self._patterns[level]
+        if pattern is None:
+            return [(i, i + 1) for i in range(start, end)]
+        cuts = [start]
+        cuts.extend(m.start() for m in pattern.finditer(text, start, end) if m.start() > start)
+        cuts.append(end)
+        return list(zip(cuts, cuts[1:]))
+
+    def _split(self, text: str, start: int, end: int, level: int) -> Iterator[Chunk]:
+        separators = self.config.separators
+        chosen, next_level = len(separators) - 1, None
+        for i in range(level, len(separators)):
+            if not separators[i]:
+                chosen = i
+                break
+            if self._patterns[i].search(text, start, end):
+                chosen = i
+                next_level = i + 1 if i + 1 < len(separators) else None
+                break
+
+        good: List[Tuple[int, int, int]] = []
+        for piece_start, piece_end in self._pieces(text, start, end, chosen):
+            length = self._length(text, piece_start, piece_end)
+            if length < self.config.chunk_size:
+                good.append((piece_start, piece_end, length))
+                continue
+            if good:
+                yield from self._merge(text, good)
+                good = []
+            if next_level is None:
+                yield Chunk(text[piece_start:piece_end], piece_start, piece_end)
+            else:
+                yield from self._split(text, piece_start, piece_end, next_level)
+        if good:
+            yield from self._merge(text, good)
+
+    def _merge(self, text: str, splits: List[Tuple[int, int, int]]) -> Iterator[Chunk]:
+        size, overlap = self.config.chunk_size, self.config.chunk_overlap
+        current: deque = deque()
+        total = 0
+        for split in splits:
+            length = split[2]
+            if total + length > size and current:
+                chunk = _stripped(text, current[0][0], current[-1][1])
+                if chunk is not None:
+                    yield chunk
+                while total > overlap or (total + length > size and total > 0):
+                    total -= current.popleft()[2]
+            current.append(split)
+            total += length
+        if current:
+            chunk = _stripped(text, current[0][0], current[-1][1])
+            if chunk is not None:
+                yield chunk
+
+    def iter_chunks(self, text: str) -> Iterator[Chunk]:
+        """Yields chunks lazily, in document order."""
+        if not self._count_tokens and len(text) <= self.config.chunk_size:
+            # Short descriptions are a single chunk; skip splitting and merging.
+            chunk = _stripped(text, 0, len(text))
+            return iter([chunk] if chunk is not None else [])
+        return self._split(text, 0, len(text), 0)
+
+    def split(self, text: str) -> List[str]:
+        return [chunk.text for chunk in self.iter_chunks(text)]
+
+
+def _stripped(text: str, start: int, end: int) -> Optional[Chunk]:
+    piece = text[start:end]
+    stripped = piece.strip()
+    if not stripped:
+        return None
+    if len(stripped) == len(piece):
+        return Chunk(piece, start, end)
+    start += len(piece) - len(piece.lstrip())
+    return Chunk(stripped, start, start + len(stripped))
+
+
+@lru_cache(maxsize=32)
+def get_chunker(chunk_size: int = 1000, chunk_overlap: int = 200, length_unit: str = "chars") -> Chunker:
+    """Shared Chunker per configuration."""
+    return Chunker(ChunkerConfig(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_unit=length_unit))
+
+
+_worker_chunker: Optional[Chunker] = None
+
+
+def _init_worker(config: ChunkerConfig):
+    global _worker_chunker
+    _worker_chunker = Chunker(config)
+
+
+def _chunk_in_worker(text: str) -> List[Chunk]:
+    return list(_worker_chunker.iter_chunks(text))
+
+
+def chunk_documents(texts: Iterable[str], config: ChunkerConfig = ChunkerConfig(), processes: Optional[int] = None,
+                    batch_size: int = 256) -> Iterator[List[Chunk]]:
+    """
+    Chunks many documents on a pool of worker processes (all cores by default),
+    yielding each document's chunks in input order. `texts` is consumed lazily,
+    so catalogue-sized inputs can be streamed. processes=1 runs in this process.
+    """
+    if processes == 1:
+        chunker = Chunker(config)
+        for text in texts:
+            yield list(chunker.iter_chunks(text))
+        return
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(config,)) as pool:
+        yield from pool.imap(_chunk_in_worker, texts, chunksize=batch_size)
@@ -0,0 +1,199 @@
+"""
+Process-wide clients for the ingestion Lambdas and batch jobs.
+
+Every client is created on first use and then reused for the life of the
+process (a warm Lambda container keeps it across invocations). Creation happens
+under a lock, so concurrent threads never build a client twice; boto3 sessions
+are not safe to share while clients are being created, but the clients
+themselves are. Call `warm_up()` from a handler module's init phase to pay for
+endpoint resolution, credential lookup and TLS setup before the first event.
+
+Async clients (aiobotocore, AsyncOpenSearch) hold connections bound to the event
+loop that opened them, so they are cached per loop and closed with
+`close_async_clients()`. aiobotocore is optional; without it, async callers fall
+back to the shared boto3 clients on a worker thread.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import boto3
+import redis
+from botocore.config import Config
+from opensearchpy import (AWSV4SignerAsyncAuth, AWSV4SignerAuth, AsyncHttpConnection, AsyncOpenSearch, OpenSearch,
+                          RequestsHttpConnection)
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session as get_aio_session
+except ImportError:
+    AioConfig = get_aio_session = None
+
+HAS_AIOBOTOCORE = get_aio_session is not None
+
+logger = logging.getLogger(__name__)
+
+BOTO_CONFIG = Config(
+    max_pool_connections=64,
+    connect_timeout=2,
+    read_timeout=60,
+    tcp_keepalive=True,
+    retries={"max_attempts": 3, "mode": "adaptive"},
+)
+
+_lock = threading.RLock()
+_clients: Dict[Tuple, Any] = {}
+_session: Optional[boto3.Session] = None
+
+
+class _LoopClients:
+    """Async clients of one event loop, plus the exit stack that closes them."""
+
+    def __init__(self):
+        self.clients: Dict[Tuple, Any] = {}
+        self.lock = asyncio.Lock()
+        self.exit_stack = contextlib.AsyncExitStack()
+
+
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClients]" = weakref.WeakKeyDictionary()
+
+
+def _get_or_create(key: Tuple, factory: Callable[[], Any]):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = factory()
+    return client
+
+
+def get_session() -> boto3.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.Session()
+        return _session
+
+
+def get_boto3_client(service: str, region_name: Optional[str] = None, **config_overrides):
+    """Shared boto3 client; `config_overrides` (e.g. max_pool_connections) get their own instance."""
+    key = ("boto3", service, region_name, repr(sorted(config_overrides.items())))
+    config = BOTO_CONFIG.merge(Config(**config_overrides)) if config_overrides else BOTO_CONFIG
+    return _get_or_create(key, lambda: get_session().client(service, region_name=region_name, config=config))
+
+
+def get_s3_client(**config_overrides):
+    return get_boto3_client("s3", **config_overrides)
+
+
+def get_bedrock_runtime_client():
+    # Callers (EmbeddingEngine, ImagePipeline) back off on throttling themselves.
+    return get_boto3_client("bedrock-runtime", retries={"max_attempts": 2, "mode": "standard"})
+
+
+_SERVICE_GETTERS = {"s3": get_s3_client, "bedrock-runtime": get_bedrock_runtime_client}
+
+
+def get_opensearch_client(host: str, region: str, pool_maxsize: int = 32) -> OpenSearch:
+    """Signed OpenSearch Serverless client; the session's credentials refresh themselves."""
+    def create():
+        auth = AWSV4SignerAuth(get_session().get_credentials(), region, "aoss")
+        return OpenSearch(
+            hosts=[{"host": host, "port": 443}],
+            http_auth=auth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=RequestsHttpConnection,
+            pool_maxsize=pool_maxsize,
+            timeout=30,
+        )
+    return _get_or_create(("opensearch", host, region, pool_maxsize), create)
+
+
+def get_redis_client(host: str, port: int = 6379) -> redis.Redis:
+    return _get_or_create(("redis", host, port), lambda: redis.Redis(
+        host=host, port=port, socket_connect_timeout=2, socket_timeout=2,
+        socket_keepalive=True, health_check_interval=30,
+    ))
+
+
+def _for_running_loop() -> _LoopClients:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        return _loop_clients.setdefault(loop, _LoopClients())
+
+
+async def get_async_boto3_client(service: str, max_pool_connections: int = 64):
+    """aiobotocore client for the running loop (requires aiobotocore)."""
+    if not HAS_AIOBOTOCORE:
+        raise ImportError("Async AWS clients need aiobotocore: pip install aiobotocore")
+    state = _for_running_loop()
+    key = ("aiobotocore", service, max_pool_connections)
+    if key not in state.clients:
+        # An asyncio lock, because entering the client's context awaits.
+        async with state.lock:
+            if key not in state.clients:
+                config = AioConfig(max_pool_connections=max_pool_connections, connect_timeout=2, read_timeout=60,
+                                   tcp_keepalive=True, retries={"max_attempts": 3, "mode": "adaptive"})
+                state.clients[key] = await state.exit_stack.enter_async_context(
+                    get_aio_session().create_client(service, config=config))
+    return state.clients[key]
+
+
+def get_async_opensearch_client(host: str, region: str, pool_maxsize: int = 64) -> AsyncOpenSearch:
+    """Signed AsyncOpenSearch client for the running loop."""
+    state = _for_running_loop()
+    key = ("opensearch", host, region, pool_maxsize)
+    client = state.clients.get(key)
+    if client is None:
+        auth = AWSV4SignerAsyncAuth(get_session().get_credentials(), region, "aoss")
+        client = state.clients[key] = AsyncOpenSearch(
+            hosts=[{"host": host, "port": 443}], http_auth=auth, use_ssl=True, verify_certs=True,
+            connection_class=AsyncHttpConnection, pool_maxsize=pool_maxsize, timeout=30,
+        )
+        state.exit_stack.push_async_callback(client.close)
+    return client
+
+
+async def close_async_clients():
+    """Closes the running loop's async clients (call before the loop shuts down)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        state = _loop_clients.pop(loop, None)
+    if state is not None:
+        await state.exit_stack.aclose()
+
+
+def warm_up(services: Sequence[str] = ("s3", "bedrock-runtime"), opensearch_host: Optional[str] = None,
+            redis_host: Optional[str] = None):
+    """Creates the given clients and resolves credentials. Never raises: a failure here is retried on first use."""
+    try:
+        get_session().get_credentials()
+        for service in services:
+            _SERVICE_GETTERS.get(service, lambda: get_boto3_client(service))()
+        if opensearch_host:
+            get_opensearch_client(opensearch_host, os.environ.get("AWS_REGION", "us-east-1"))
+        if redis_host:
+            get_redis_client(redis_host).ping()
+    except Exception as e:
+        logger.warning(f"Client warm-up failed: {e}")
+
+
+def warm_up_in_lambda(**kwargs):
+    """warm_up() during a Lambda's init phase; a no-op elsewhere (tests, local runs)."""
+    if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+        warm_up(**kwargs)
+
+
+def reset():
+    """Drops all cached clients (tests, or after forking)."""
+    global _session
+    with _lock:
+        _clients.clear()
+        _loop_clients.clear()
+        _session = None
@@ -1,13 +1,17 @@
-import boto3
+import asyncio
 import json
 import logging
 
+from . import clients
+
 logger = logging.getLogger(__name__)
 
+clients.warm_up_in_lambda(services=("s3",))
+
 def load_product_data(bucket: str, key: str) -> dict:
     """Loads a single product's JSON data from S3."""
     try:
-        s3 = boto3.client('s3')
+        s3 = clients.get_s3_client()
         response = s3.get_object(Bucket=bucket, Key=key)
         content = response['Body'].read().decode('utf-8')
         return json.loads(content)
@@ -15,5 +19,21 @@ def load_product_data(bucket: str, key: str) -> dict:
         logger.error(f"Error loading data from s3://{bucket}/{key}: {e}")
         raise
 
+async def load_product_data_async(bucket: str, key: str) -> dict:
+    """Async variant of load_product_data, for callers that load many products concurrently."""
+    try:
+        if clients.HAS_AIOBOTOCORE:
+            s3 = await clients.get_async_boto3_client("s3")
+            response = await s3.get_object(Bucket=bucket, Key=key)
+            async with response['Body'] as stream:
+                content = (await stream.read()).decode('utf-8')
+        else:
+            s3 = clients.get_s3_client()
+            content = await asyncio.to_thread(lambda: s3.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8'))
+        return json.loads(content)
+    except Exception as e:
+        logger.error(f"Error loading data from s3://{bucket}/{key}: {e}")
+        raise
+
 # In a real scenario, this would list all new/updated product files.
 # For the Step Function, the input `key` will be provided in the event payload.
\ No newline at end of file
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from .bulk_indexer import BulkIndexer
+from .embedding_cache import normalize_chunk
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(normalize_chunk(text).encode("utf-8")).hexdigest()
+
+
+def assign_chunk_ids(product_id: str, chunks: Sequence[str]) -> List[Tuple[str, str]]:
+    """
+    Deterministic, content-addressed chunk IDs: `<product_id>#<hash prefix>`, with an
+    occurrence suffix for repeated text. An unchanged chunk keeps its ID even when
+    chunks before it are added or removed.
+    """
+    seen: Dict[str, int] = {}
+    assigned = []
+    for text in chunks:
+        digest = content_hash(text)
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        suffix = f"-{occurrence}" if occurrence else ""
+        assigned.append((f"{product_id}#{digest[:16]}{suffix}", digest))
+    return assigned
+
+
+def metadata_hash(metadata: dict) -> str:
+    return hashlib.sha256(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ManifestStore(Protocol):
+    def get(self, product_id: str) -> Optional[dict]:
+        ...
+
+    def put(self, product_id: str, manifest: dict):
+        ...
+
+
+class LocalManifestStore:
+    """One JSON manifest per product under a directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, product_id: str) -> str:
+        return os.path.join(self.root, f"{hashlib.sha1(product_id.encode('utf-8')).hexdigest()}.json")
+
+    def get(self, product_id: str) -> Optional[dict]:
+        try:
+            with open(self._path(product_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, product_id: str, manifest: dict):
+        tmp_path = self._path(product_id) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path(product_id))
+
+
+class S3ManifestStore:
+    """Manifests as s3://<bucket>/<prefix><product_id>.json, for the Lambda pipeline."""
+
+    def __init__(self, client, bucket: str, prefix: str = "manifests/"):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get(self, product_id: str) -> Optional[dict]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}{product_id}.json")
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response["Body"].read())
+
+    def put(self, product_id: str, manifest: dict):
+        self.client.put_object(Bucket=self.bucket, Key=f"{self.prefix}{product_id}.json",
+                               Body=json.dumps(manifest).encode("utf-8"))
+
+
+@dataclass
+class DeltaPlan:
+    product_id: str
+    upserts: List[Tuple[str, str]] = field(default_factory=list)   # (chunk_id, text)
+    deletes: List[str] = field(default_factory=list)
+    metadata_updates: List[str] = field(default_factory=list)       # unchanged chunks, new metadata
+    manifest: dict = field(default_factory=dict)
+    first_sync: bool = False
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.upserts or self.deletes or self.metadata_updates)
+
+
+def plan_product_update(product_id: str, chunks: Sequence[str], metadata: dict,
+                        previous: Optional[dict]) -> DeltaPlan:
+    """Diffs the new chunking of a product against its manifest."""
+    assigned = assign_chunk_ids(product_id, chunks)
+    new_chunks = {chunk_id: digest for chunk_id, digest in assigned}
+    old_chunks = (previous or {}).get("chunks", {})
+    new_metadata_hash = metadata_hash(metadata)
+    metadata_changed = previous is not None and previous.get("metadata_hash") != new_metadata_hash
+
+    plan = DeltaPlan(product_id=product_id, first_sync=previous is None)
+    for (chunk_id, _), text in zip(assigned, chunks):
+        if chunk_id not in old_chunks:
+            plan.upserts.append((chunk_id, text))
+        elif metadata_changed:
+            plan.metadata_updates.append(chunk_id)
+    plan.deletes = [chunk_id for chunk_id in old_chunks if chunk_id not in new_chunks]
+    plan.manifest = {
+        "version": MANIFEST_VERSION,
+        "product_id": product_id,
+        "chunks": new_chunks,
+        "metadata_hash": new_metadata_hash,
+    }
+    return plan
+
+
+def build_bulk_actions(plan: DeltaPlan, embeddings: np.ndarray, metadata: dict,
+                       index_name: Optional[str] = None) -> List[dict]:
+    """
+    Turns a plan into bulk actions; `embeddings` holds one row per upserted chunk, in
+    order. Without `index_name` the actions carry no `_index`, for an indexer that sets it.
+    """
+    target = {"_index": index_name} if index_name is not None else {}
+    actions = []
+    for (chunk_id, text), vector in zip(plan.upserts, embeddings):
+        actions.append({
+            "_op_type": "index", **target, "_id": chunk_id,
+            "text": text, "embedding": np.asarray(vector).tolist(), "metadata": metadata,
+        })
+    for chunk_id in plan.metadata_updates:
+        actions.append({"_op_type": "update", **target, "_id": chunk_id, "doc": {"metadata": metadata}})
+    for chunk_id in plan.deletes:
+        actions.append({"_op_type": "delete", **target, "_id": chunk_id})
+    return actions
+
+
+def _stale_document_ids(client, index_name: str, product_id: str, keep: Sequence[str]) -> List[str]:
+    """IDs of the product's documents that are not in `keep`, e.g. ones the old pipeline wrote with random IDs."""
+    response = client.search(index=index_name, body={
+        "size": 10_000, "_source": False,
+        "query": {"bool": {
+            "filter": [{"term": {"metadata.product_id": product_id}}],
+            "must_not": [{"ids": {"values": list(keep)}}],
+        }},
+    })
+    return [hit["_id"] for hit in response["hits"]["hits"]]
+
+
+def sync_product(client, index_name: str, product_id: str, chunks: Sequence[str], metadata: dict,
+                 store: ManifestStore, embed_fn: Optional[Callable[[List[str]], np.ndarray]],
+                 chunk_embeddings: Optional[np.ndarray] = None, indexer: Optional[BulkIndexer] = None) -> DeltaPlan:
+    """
+    Incrementally reindexes one product: only new chunks are embedded and indexed,
+    chunks that disappeared are deleted, and a metadata-only change (price, stock)
+    becomes a partial update. The manifest is saved only once the index agrees.
+
+    `chunk_embeddings`, one row per chunk in order, replaces `embed_fn` when the
+    chunks were embedded upstream. Writes go through a BulkIndexer, which retries
+    rejected items; deletes are by ID, as Serverless collections have no delete-by-query.
+    """
+    indexer = indexer or BulkIndexer(client, index_name)
+    metadata = {**metadata, "product_id": product_id}
+    plan = plan_product_update(product_id, chunks, metadata, store.get(product_id))
+    if not plan.changed and not plan.first_sync:
+        logger.info(f"Product {product_id} unchanged; nothing to index.")
+        return plan
+
+    if not plan.upserts:
+        embeddings = np.empty((0, 0))
+    elif chunk_embeddings is not None:
+        # By position, so repeated chunk texts keep their own rows.
+        row_of = {chunk_id: row for row, (chunk_id, _) in enumerate(assign_chunk_ids(product_id, chunks))}
+        embeddings = chunk_embeddings[[row_of[chunk_id] for chunk_id, _ in plan.upserts]]
+    else:
+        embeddings = embed_fn([text for _, text in plan.upserts])
+    actions = build_bulk_actions(plan, embeddings, metadata)
+    if plan.first_sync:
+        # No manifest yet: documents written by the old pipeline (random IDs) would be orphaned.
+        stale = _stale_document_ids(client, index_name, product_id, list(plan.manifest["chunks"]))
+        actions += [{"_op_type": "delete", "_id": doc_id} for doc_id in stale]
+
+    result = indexer.index(actions)
+    if result.failed:
+        raise RuntimeError(f"Incremental indexing of product {product_id} failed for {len(result.failed)} actions.")
+
+    store.put(product_id, plan.manifest)
+    logger.info(f"Product {product_id}: {len(plan.upserts)} upserts, {len(plan.metadata_updates)} metadata updates, "
+                f"{len(plan.deletes)} deletes.")
+    return plan
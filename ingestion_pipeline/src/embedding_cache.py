@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from . import clients
+
+logger = logging.getLogger(__name__)
+
+# EMF lines must reach stdout verbatim, without the runtime's log prefix.
+metrics_logger = logging.getLogger(f"{__name__}.metrics")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_chunk(text: str) -> str:
+    """Whitespace and Unicode differences that don't change the embedding input don't change the key."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{normalize_chunk(text)}".encode("utf-8")).hexdigest()
+
+
+def image_key(model_id: str, image_bytes: bytes) -> str:
+    return hashlib.sha256(model_id.encode("utf-8") + b"\0" + image_bytes).hexdigest()
+
+
+class EmbeddingCacheBackend(Protocol):
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        ...
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        ...
+
+
+class InMemoryEmbeddingCache:
+    """LRU-bounded dict; mostly for tests and single-run batch jobs."""
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        for key in keys:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[key] = self._entries[key]
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        for key, vector in items:
+            self._entries[key] = np.asarray(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SQLiteEmbeddingCache:
+    """
+    Local file cache (float32 blobs). Least-recently-used entries are evicted once
+    the table exceeds `max_entries`; in Lambda, point it at /tmp to survive warm starts.
+    The connection is shared by worker threads, one statement sequence at a time.
+    The row count is taken once on open and kept up to date by `put_many`, so writes
+    never scan the table.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+                batch = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        now = time.time()
+        vectors = {key: np.asarray(vector, dtype=np.float32).tobytes() for key, vector in items}
+        keys = list(vectors)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                existing = 0
+                for start in range(0, len(keys), 500):  # primary-key lookups, not a table scan
+                    batch = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    (found,) = self._conn.execute(
+                        f"SELECT COUNT(*) FROM embeddings WHERE key IN ({placeholders})", batch
+                    ).fetchone()
+                    existing += found
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                                       [(key, blob, now) for key, blob in vectors.items()])
+                count = self._count + len(keys) - existing
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+                    count = self.max_entries
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            self._count = count
+
+
+class RedisEmbeddingCache:
+    """Shared cache across workers; entries expire after `ttl_s` (plus Redis' own maxmemory policy)."""
+
+    def __init__(self, client, ttl_s: int = 30 * 24 * 3600, prefix: str = "embedding-cache"):
+        self.client = client
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        if not keys:
+            return {}
+        values = self.client.mget([f"{self.prefix}:{key}" for key in keys])
+        return {key: np.frombuffer(value, dtype=np.float32) for key, value in zip(keys, values) if value is not None}
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        pipe = self.client.pipeline(transaction=False)
+        for key, vector in items:
+            pipe.set(f"{self.prefix}:{key}", np.asarray(vector, dtype=np.float32).tobytes(), ex=self.ttl_s)
+        pipe.execute()
+
+
+class CachedEmbeddingEngine:
+    """
+    Wraps an EmbeddingEngine so that only chunks whose (model, normalized text)
+    hash has not been seen before reach the embedding model. Cache lookups and
+    writes are blocking (SQLite, Redis), so they run on worker threads. Hit
+    counts accumulate until `emit_hit_rate` is called, once per invocation or run.
+    """
+
+    def __init__(self, engine, cache: EmbeddingCacheBackend):
+        self.engine = engine
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._unreported = [0, 0]  # hits, lookups since the last emit_hit_rate
+
+    @property
+    def model_id(self) -> str:
+        return self.engine.provider.model_id
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Same contract as EmbeddingEngine.embed, served from the cache where possible."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        keys = [text_key(self.model_id, text) for text in texts]
+        cached = await asyncio.to_thread(self.cache.get_many, list(dict.fromkeys(keys)))
+
+        # Identical chunks within the batch are embedded once.
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            fresh = await self.engine.embed(list(missing.values()))
+            new_items = list(zip(missing.keys(), fresh))
+            await asyncio.to_thread(self.cache.put_many, new_items)
+            cached.update(new_items)
+
+        hits = sum(1 for key in keys if key not in missing)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        self._unreported[0] += hits
+        self._unreported[1] += len(keys)
+        return np.stack([cached[key] for key in keys]).astype(np.float32, copy=False)
+
+    async def embed_products(self, chunks_by_product: Dict[str, List[str]]) -> Dict[str, np.ndarray]:
+        spans, texts = [], []
+        for product_id, chunks in chunks_by_product.items():
+            spans.append((product_id, len(texts), len(texts) + len(chunks)))
+            texts.extend(chunks)
+        vectors = await self.embed(texts)
+        return {product_id: vectors[start:end] for product_id, start, end in spans}
+
+    def embed_sync(self, texts: Sequence[str]) -> np.ndarray:
+        """Blocking entry point for Lambda handlers; reports the invocation's hit rate."""
+        try:
+            return asyncio.run(self.embed(texts))
+        finally:
+            self.emit_hit_rate()
+
+    def emit_hit_rate(self):
+        """
+        Writes the hit rate since the last call as one CloudWatch Embedded Metric
+        Format line (no API call needed); nothing is written if there were no lookups.
+        """
+        hits, total = self._unreported
+        if not total:
+            return
+        self._unreported = [0, 0]
+        _ensure_metrics_handler()
+        metrics_logger.info(json.dumps({
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": "RAGIngestion",
+                    "Dimensions": [["ModelId"]],
+                    "Metrics": [
+                        {"Name": "EmbeddingCacheHits", "Unit": "Count"},
+                        {"Name": "EmbeddingCacheLookups", "Unit": "Count"},
+                        {"Name": "EmbeddingCacheHitRate", "Unit": "Percent"},
+                    ],
+                }],
+            },
+            "ModelId": self.model_id,
+            "EmbeddingCacheHits": hits,
+            "EmbeddingCacheLookups": total,
+            "EmbeddingCacheHitRate": 100.0 * hits / total,
+        }))
+        logger.info(f"Embedding cache: {hits}/{total} hits ({self.hits} hits, {self.misses} misses this process).")
+
+
+def _ensure_metrics_handler():
+    if not metrics_logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        metrics_logger.addHandler(handler)
+        metrics_logger.setLevel(logging.INFO)
+        metrics_logger.propagate = False
+
+
+def create_cache_from_env() -> EmbeddingCacheBackend:
+    """Redis when EMBEDDING_CACHE_REDIS_HOST is set, otherwise SQLite at EMBEDDING_CACHE_PATH (default /tmp)."""
+    redis_host = os.environ.get("EMBEDDING_CACHE_REDIS_HOST")
+    if redis_host:
+        return RedisEmbeddingCache(clients.get_redis_client(redis_host))
+    return SQLiteEmbeddingCache(os.environ.get("EMBEDDING_CACHE_PATH", "/tmp/embedding-cache.sqlite"))
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from . import clients
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottledError(Exception):
+    """Raised by a provider when the model endpoint rejects a request for rate reasons."""
+
+
+class EmbeddingProvider(Protocol):
+    model_id: str
+    max_batch_size: int    # texts per request the model accepts
+    max_batch_chars: int   # rough request-size cap, to stay under the model's input limits
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+
+class BedrockEmbeddingProvider:
+    """Bedrock embedding models over one long-lived `bedrock-runtime` client."""
+
+    _THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException"}
+
+    def __init__(self, model_id: str = "amazon.titan-embed-text-v2:0", client=None, dimensions: int = 1024,
+                 native_async: bool = False):
+        self.model_id = model_id
+        self.dimensions = dimensions
+        # With aiobotocore, requests are awaited on the event loop rather than parked on
+        # the default thread pool, which has only min(32, cpus + 4) workers.
+        self.native_async = native_async and clients.HAS_AIOBOTOCORE
+        # Titan takes a single text per call; Cohere's embed API accepts up to 96.
+        self.max_batch_size = 96 if model_id.startswith("cohere.") else 1
+        self.max_batch_chars = 96 * 2048 if model_id.startswith("cohere.") else 50000
+        self.client = client or clients.get_bedrock_runtime_client()
+
+    def _invoke(self, body: dict) -> dict:
+        try:
+            response = self.client.invoke_model(modelId=self.model_id, body=json.dumps(body))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in self._THROTTLING_CODES:
+                raise ThrottledError(str(e)) from e
+            raise
+        return json.loads(response["body"].read())
+
+    async def _invoke_async(self, body: dict) -> dict:
+        client = await clients.get_async_boto3_client("bedrock-runtime")
+        try:
+            response = await client.invoke_model(modelId=self.model_id, body=json.dumps(body))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in self._THROTTLING_CODES:
+                raise ThrottledError(str(e)) from e
+            raise
+        async with response["body"] as stream:
+            return json.loads(await stream.read())
+
+    def _request_bodies(self, texts: List[str]) -> List[dict]:
+        if self.model_id.startswith("cohere."):
+            return [{"texts": texts, "input_type": "search_document"}]
+        return [{"inputText": text, "dimensions": self.dimensions, "normalize": True} for text in texts]
+
+    def _parse(self, responses: List[dict]) -> List[List[float]]:
+        if self.model_id.startswith("cohere."):
+            return responses[0]["embeddings"]
+        return [response["embedding"] for response in responses]
+
+    def _embed_sync(self, texts: List[str]) -> List[List[float]]:
+        return self._parse([self._invoke(body) for body in self._request_bodies(texts)])
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self.native_async:
+            return self._parse([await self._invoke_async(body) for body in self._request_bodies(texts)])
+        # boto3 is blocking; the thread pool lets many requests share the pooled connections.
+        return await asyncio.to_thread(self._embed_sync, texts)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that halves on throttling and creeps back up after successes (AIMD)."""
+
+    def __init__(self, max_concurrency: int, initial: Optional[int] = None, increase_after: int = 20):
+        self.max_concurrency = max_concurrency
+        self.limit = initial or max_concurrency
+        self.increase_after = increase_after
+        self._in_flight = 0
+        self._successes = 0
+        self._changed = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self._changed:
+            self._in_flight -= 1
+            self._changed.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.increase_after and self.limit < self.max_concurrency:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttle(self):
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+
+
+def pack_batches(texts: Sequence[str], max_batch_size: int, max_batch_chars: int) -> List[List[int]]:
+    """Groups text indices into batches bounded by item count and total characters."""
+    batches, current, current_chars = [], [], 0
+    for i, text in enumerate(texts):
+        if current and (len(current) >= max_batch_size or current_chars + len(text) > max_batch_chars):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(i)
+        current_chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingEngine:
+    """
+    Embeds many chunks (across many products) with batching, bounded concurrency,
+    a requests-per-second token bucket and adaptive backoff on throttling.
+    Create one per process and reuse it, so provider clients stay warm.
+    """
+
+    def __init__(self, provider: EmbeddingProvider, max_concurrency: int = 8,
+                 requests_per_second: Optional[float] = None, max_retries: int = 8,
+                 base_backoff_s: float = 0.2, max_backoff_s: float = 20.0):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.base_backoff_s = base_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.stats = {"requests": 0, "throttled": 0, "texts": 0}
+        # Concurrency learned from throttling, carried over between calls.
+        self._concurrency_limit = max_concurrency
+
+    async def _embed_with_retry(self, texts: List[str], limiter: AdaptiveLimiter,
+                                bucket: Optional[TokenBucket]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            if bucket is not None:
+                await bucket.acquire()
+            async with limiter:
+                try:
+                    self.stats["requests"] += 1
+                    vectors = await self.provider.embed_batch(texts)
+                    limiter.on_success()
+                    return vectors
+                except ThrottledError:
+                    self.stats["throttled"] += 1
+                    limiter.on_throttle()
+            if attempt == self.max_retries:
+                break
+            # Full-jitter exponential backoff
+            await asyncio.sleep(random.uniform(0, min(self.max_backoff_s, self.base_backoff_s * 2 ** attempt)))
+        raise ThrottledError(f"Embedding batch still throttled after {self.max_retries} retries.")
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embeds `texts`, returning a (len(texts), dim) float32 array in input order."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        limiter = AdaptiveLimiter(self.max_concurrency, initial=self._concurrency_limit)
+        bucket = TokenBucket(self.requests_per_second) if self.requests_per_second else None
+        batches = pack_batches(texts, self.provider.max_batch_size, self.provider.max_batch_chars)
+
+        tasks = [asyncio.create_task(self._embed_with_retry([texts[i] for i in batch], limiter, bucket))
+                 for batch in batches]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # One failed batch fails the call, so the rest stop spending requests.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._concurrency_limit = limiter.limit
+        output = None
+        for batch, vectors in zip(batches, results):
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if output is None:
+                output = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            output[batch] = vectors
+        self.stats["texts"] += len(texts)
+        logger.info(f"Embedded {len(texts)} texts in {len(batches)} requests "
+                    f"({self.stats['throttled']} throttled so far).")
+        return output
+
+    async def embed_products(self, chunks_by_product: Dict[str, List[str]]) -> Dict[str, np.ndarray]:
+        """Embeds the chunks of many products in shared batches, then splits the results back out."""
+        spans: List[Tuple[str, int, int]] = []
+        texts: List[str] = []
+        for product_id, chunks in chunks_by_product.items():
+            spans.append((product_id, len(texts), len(texts) + len(chunks)))
+            texts.extend(chunks)
+        vectors = await self.embed(texts)
+        return {product_id: vectors[start:end] for product_id, start, end in spans}
+
+    def embed_sync(self, texts: Sequence[str]) -> np.ndarray:
+        """Blocking entry point for Lambda handlers (not for use inside a running event loop)."""
+        return asyncio.run(self.embed(texts))
+
+
+_default_engine: Optional[EmbeddingEngine] = None
+
+
+def get_default_engine() -> EmbeddingEngine:
+    """Process-wide engine, created on first use and reused across Lambda invocations."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = EmbeddingEngine(BedrockEmbeddingProvider())
+    return _default_engine
@@ -1,22 +1,42 @@
 import logging
+from functools import lru_cache
 from typing import List
-from langchain_community.embeddings import BedrockEmbeddings
+import numpy as np
+
+from . import clients
+from .embedding_cache import CachedEmbeddingEngine, create_cache_from_env
+from .embedding_engine import get_default_engine
+from .image_pipeline import BedrockImageModelClient, ImagePipeline
 
 logger = logging.getLogger(__name__)
 
+clients.warm_up_in_lambda(services=("bedrock-runtime",))
+
+@lru_cache(maxsize=None)
+def _cached_text_engine() -> CachedEmbeddingEngine:
+    """Engine behind a content-hash cache, so unchanged chunks are never re-embedded."""
+    return CachedEmbeddingEngine(get_default_engine(), create_cache_from_env())
+
+@lru_cache(maxsize=None)
+def _image_pipeline() -> ImagePipeline:
+    """Thumbnails images before embedding them; shares the embedding cache with text."""
+    return ImagePipeline(BedrockImageModelClient(), cache=_cached_text_engine().cache, caption=False)
+
 def generate_text_embeddings(chunks: List[str]) -> List[List[float]]:
     """Generates embeddings for a list of text chunks."""
-    embeddings = BedrockEmbeddings(
-        model_id="amazon.titan-embed-text-v2:0",
-    )
+    return generate_text_embedding_array(chunks).tolist()
+
+def generate_text_embedding_array(chunks: List[str]) -> np.ndarray:
+    """Generates embeddings as one contiguous (n_chunks, dim) float32 array."""
+    logger.info(f"Generating text embeddings for {len(chunks)} chunks.")
+    return _cached_text_engine().embed_sync(chunks)
+
+async def generate_text_embedding_array_async(chunks: List[str]) -> np.ndarray:
+    """Async variant of generate_text_embedding_array, for use inside a running event loop."""
     logger.info(f"Generating text embeddings for {len(chunks)} chunks.")
-    return embeddings.embed_documents(chunks)
+    return await _cached_text_engine().embed(chunks)
 
 def generate_image_embedding(image_bytes: bytes) -> List[float]:
-    """Generates an embedding for a single image."""
-    embeddings = BedrockEmbeddings(
-        model_id="amazon.titan-embed-image-v1",
-    )
+    """Generates an embedding for a single image. For many images, use ImagePipeline.process directly."""
     logger.info(f"Generating image embedding for image of size {len(image_bytes)} bytes.")
-    # The actual implementation would involve base64 encoding the image
-    return embeddings.embed_query("placeholder for image bytes") # Placeholder
\ No newline at end of file
+    return _image_pipeline().process_sync([("image", image_bytes)])["image"].embedding
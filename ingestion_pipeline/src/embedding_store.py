@@ -0,0 +1,180 @@
+"""
+Compact storage for chunk embeddings.
+
+On-disk format (`.remb`, little-endian):
+
+    offset 0   8 bytes   magic b"RAGEMB01"
+    offset 8   8 bytes   uint64 length H of the JSON header
+    offset 16  H bytes   UTF-8 JSON header:
+                           {"version": 1, "dtype": "float32" | "float16" | "int8" | "binary",
+                            "dim": D, "count": N, "row_bytes": R,
+                            "data_offset": ..., "ids_offset": ..., "ids_length": ...,
+                            "scale_offset": ... | null}
+    data_offset          N * R bytes, one row per chunk, 64-byte aligned so it can be
+                         memory-mapped directly as an (N, R) array
+    scale_offset         int8 only: D float32 per-dimension scales (value = q * scale)
+    ids_offset           ids_length bytes of newline-separated UTF-8 chunk IDs, in row order
+
+Row encodings: float32 (4*D bytes), float16 (2*D), int8 symmetric per-dimension
+scalar quantization (D), binary sign bits packed MSB-first (ceil(D/8)). Readers
+other than this module (e.g. the inference service's local index) only need the
+header fields above.
+"""
+import base64
+import io
+import json
+import logging
+import struct
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RAGEMB01"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+DTYPES = ("float32", "float16", "int8", "binary")
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def quantize(vectors: np.ndarray, dtype: str = "float32") -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encodes float vectors as `dtype` rows; returns (rows, per-dimension scale or None)."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scale = (np.maximum(np.abs(vectors).max(axis=0, initial=0.0), 1e-12) / 127.0).astype(np.float32)
+        return np.round(vectors / scale).astype(np.int8), scale
+    if dtype == "binary":
+        return np.packbits(vectors > 0, axis=1), None
+    raise ValueError(f"Unsupported embedding dtype '{dtype}'. Expected one of {DTYPES}.")
+
+
+def dequantize(rows: np.ndarray, dtype: str, dim: int, scale: Optional[np.ndarray] = None) -> np.ndarray:
+    """Decodes rows back to float32 (binary rows decode to -1/+1 per dimension)."""
+    if dtype in ("float32", "float16"):
+        return np.asarray(rows, dtype=np.float32)
+    if dtype == "int8":
+        return np.asarray(rows, dtype=np.float32) * scale
+    if dtype == "binary":
+        bits = np.unpackbits(np.asarray(rows), axis=1, count=dim)
+        return bits.astype(np.float32) * 2.0 - 1.0
+    raise ValueError(f"Unsupported embedding dtype '{dtype}'.")
+
+
+def _serialize(ids: Sequence[str], vectors: np.ndarray, dtype: str) -> bytes:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if len(ids) != vectors.shape[0]:
+        raise ValueError(f"Got {len(ids)} ids for {vectors.shape[0]} vectors.")
+    if any("\n" in chunk_id for chunk_id in ids):
+        raise ValueError("Chunk IDs must not contain newlines.")
+
+    rows, scale = quantize(vectors, dtype)
+    ids_blob = "\n".join(ids).encode("utf-8")
+    header = {
+        "version": FORMAT_VERSION, "dtype": dtype, "dim": int(vectors.shape[1]),
+        "count": int(rows.shape[0]), "row_bytes": int(rows.shape[1] * rows.itemsize),
+    }
+    # The header is laid out with placeholder offsets first so its length is known.
+    placeholder = {**header, "data_offset": 0, "ids_offset": 0, "ids_length": 0, "scale_offset": 0}
+    header_length = len(json.dumps(placeholder).encode("utf-8")) + 128  # room for the real offsets
+    data_offset = _align(16 + header_length)
+    scale_offset = _align(data_offset + rows.nbytes) if scale is not None else None
+    ids_offset = _align((scale_offset + scale.nbytes) if scale is not None else data_offset + rows.nbytes)
+    header.update(data_offset=data_offset, ids_offset=ids_offset, ids_length=len(ids_blob), scale_offset=scale_offset)
+    header_bytes = json.dumps(header).encode("utf-8").ljust(header_length, b" ")
+
+    out = io.BytesIO()
+    out.write(MAGIC)
+    out.write(struct.pack("<Q", header_length))
+    out.write(header_bytes)
+    for offset, block in ((data_offset, rows), (scale_offset, scale), (ids_offset, ids_blob)):
+        if offset is None:
+            continue
+        out.write(b"\0" * (offset - out.tell()))
+        out.write(block if isinstance(block, bytes) else block.tobytes())
+    return out.getvalue()
+
+
+def write_embedding_file(path: str, ids: Sequence[str], vectors: np.ndarray, dtype: str = "float32"):
+    """Writes `vectors` (one row per chunk ID) to `path` in the .remb format."""
+    payload = _serialize(ids, vectors, dtype)
+    with open(path, "wb") as f:
+        f.write(payload)
+    logger.info(f"Wrote {len(ids)} {dtype} embeddings ({len(payload)} bytes) to {path}.")
+
+
+class EmbeddingFile:
+    """A .remb file (or in-memory buffer) whose rows are exposed without copying."""
+
+    def __init__(self, buffer, header: dict):
+        self.header = header
+        self.dtype = header["dtype"]
+        self.dim = header["dim"]
+        storage = np.dtype(np.uint8 if self.dtype == "binary" else self.dtype)
+        row_items = header["row_bytes"] // storage.itemsize
+        # Explicit row width: reshape(0, -1) is ambiguous for an empty file.
+        self.rows = np.frombuffer(
+            buffer, dtype=storage, count=header["count"] * row_items, offset=header["data_offset"],
+        ).reshape(header["count"], row_items)
+        self.scale = None
+        if header["scale_offset"] is not None:
+            self.scale = np.frombuffer(buffer, dtype=np.float32, count=self.dim, offset=header["scale_offset"])
+        ids_blob = bytes(buffer[header["ids_offset"]:header["ids_offset"] + header["ids_length"]])
+        self.ids: List[str] = ids_blob.decode("utf-8").split("\n") if header["count"] else []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def vectors(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """float32 view (or decoded copy, for quantized files) of rows [start, stop)."""
+        return dequantize(self.rows[start:stop], self.dtype, self.dim, self.scale)
+
+    @classmethod
+    def from_bytes(cls, buffer) -> "EmbeddingFile":
+        if bytes(buffer[:8]) != MAGIC:
+            raise ValueError("Not a RAG embedding file (bad magic).")
+        (header_length,) = struct.unpack("<Q", bytes(buffer[8:16]))
+        header = json.loads(bytes(buffer[16:16 + header_length]).decode("utf-8"))
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding file version {header['version']}.")
+        return cls(buffer, header)
+
+
+def open_embedding_file(path: str) -> EmbeddingFile:
+    """Memory-maps a .remb file; rows are paged in only when read."""
+    return EmbeddingFile.from_bytes(np.memmap(path, dtype=np.uint8, mode="r"))
+
+
+def encode_payload(ids: Sequence[str], vectors: np.ndarray, dtype: str = "float32") -> dict:
+    """
+    Packs embeddings for a Step Functions payload (a fraction of the size of JSON
+    float lists). Quantized dtypes are lossy: keep float32 for vectors that are indexed.
+    """
+    return {"format": "remb", "data": base64.b64encode(_serialize(ids, vectors, dtype)).decode("ascii")}
+
+
+def decode_payload(payload: dict) -> EmbeddingFile:
+    return EmbeddingFile.from_bytes(base64.b64decode(payload["data"]))
+
+
+def quantization_recall(vectors: np.ndarray, queries: np.ndarray, dtype: str, k: int = 10) -> float:
+    """recall@k of cosine search over `dtype`-quantized vectors against full float32 search."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rows, scale = quantize(vectors, dtype)
+    approx = dequantize(rows, dtype, vectors.shape[1], scale)
+
+    def normalized(x):
+        return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+    queries = normalized(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+    exact_top = np.argsort(-(queries @ normalized(vectors).T), axis=1)[:, :k]
+    approx_top = np.argsort(-(queries @ normalized(approx).T), axis=1)[:, :k]
+    hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact_top, approx_top))
+    return hits / (k * queries.shape[0])
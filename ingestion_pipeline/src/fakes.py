@@ -0,0 +1,233 @@
+"""Deterministic in-process stand-ins for the pipeline's external services, used in tests and benchmarks."""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy as np
+
+from .embedding_engine import ThrottledError
+
+
+class FakeEmbeddingProvider:
+    """
+    Embedding provider returning a deterministic unit vector per text. It can
+    simulate per-request latency, a concurrency quota (requests above it are
+    throttled) and a fixed number of initial throttles.
+    """
+
+    def __init__(self, dim: int = 64, max_batch_size: int = 16, max_batch_chars: int = 50000,
+                 latency_s: float = 0.0, max_concurrent_requests: int = 0, throttle_first: int = 0,
+                 model_id: str = "fake-embed-v1"):
+        self.model_id = model_id
+        self.dim = dim
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+        self.latency_s = latency_s
+        self.max_concurrent_requests = max_concurrent_requests
+        self.throttle_first = throttle_first
+        self.calls = 0
+        self.throttled = 0
+        self.embedded_texts: List[str] = []
+        self._in_flight = 0
+
+    def vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).normal(size=self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if len(texts) > self.max_batch_size:
+            raise ValueError(f"Batch of {len(texts)} exceeds max_batch_size={self.max_batch_size}.")
+        over_quota = self.max_concurrent_requests and self._in_flight >= self.max_concurrent_requests
+        if self.throttle_first > 0 or over_quota:
+            self.throttle_first = max(0, self.throttle_first - 1)
+            self.throttled += 1
+            raise ThrottledError("Fake provider is throttling.")
+        self._in_flight += 1
+        try:
+            await asyncio.sleep(self.latency_s)
+            self.embedded_texts.extend(texts)
+            return [self.vector(text) for text in texts]
+        finally:
+            self._in_flight -= 1
+
+
+
+class FakeOpenSearch:
+    """
+    Local HTTP stand-in for the OpenSearch APIs the pipeline uses: `_bulk`, index
+    `_settings` and `_refresh`. It can add per-request latency, reject a number of
+    initial bulk items with 429, and reject whole bulk requests with 429 while more
+    than `max_concurrent_bulk` are in flight, as a loaded cluster would.
+
+        with FakeOpenSearch() as fake:
+            client = OpenSearch(hosts=[{"host": fake.host, "port": fake.port}])
+    """
+
+    def __init__(self, latency_s: float = 0.0, per_doc_latency_s: float = 0.0, reject_first_items: int = 0,
+                 max_concurrent_bulk: int = 0):
+        self.latency_s = latency_s
+        self.per_doc_latency_s = per_doc_latency_s
+        self.reject_first_items = reject_first_items
+        self.max_concurrent_bulk = max_concurrent_bulk
+        self.documents: Dict[str, Dict[str, dict]] = {}
+        self.settings: Dict[str, dict] = {}
+        self.bulk_requests = 0
+        self.rejected_items = 0
+        self.rejected_requests = 0
+        self.refreshes = 0
+        self.peak_concurrent_bulk = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self.host = "127.0.0.1"
+        self.port = 0
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, payload: dict):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def do_POST(self):
+                path = self.path.split("?")[0].strip("/").split("/")
+                if path[-1] == "_bulk":
+                    status, payload = fake._bulk(self._body(), path[0] if len(path) > 1 else None)
+                elif path[-1] == "_refresh":
+                    self._body()
+                    fake.refreshes += 1
+                    status, payload = 200, {"_shards": {"failed": 0}}
+                else:
+                    status, payload = 404, {"error": f"unsupported path {self.path}"}
+                self._reply(status, payload)
+
+            def do_PUT(self):
+                index = self.path.split("?")[0].strip("/").split("/")[0]
+                body = json.loads(self._body() or b"{}")
+                settings = body.get("index", body)
+                fake.settings.setdefault(index, {}).update({k: str(v) for k, v in settings.items()})
+                self._reply(200, {"acknowledged": True})
+
+            def do_GET(self):
+                index = self.path.split("?")[0].strip("/").split("/")[0]
+                settings = fake.settings.setdefault(index, {"refresh_interval": "1s", "number_of_replicas": "1"})
+                self._reply(200, {index: {"settings": {"index": dict(settings)}}})
+
+        self._server = ThreadingHTTPServer((self.host, 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _bulk(self, body: bytes, default_index):
+        with self._lock:
+            self.bulk_requests += 1
+            self._in_flight += 1
+            self.peak_concurrent_bulk = max(self.peak_concurrent_bulk, self._in_flight)
+            overloaded = self.max_concurrent_bulk and self._in_flight > self.max_concurrent_bulk
+        try:
+            if overloaded:
+                self.rejected_requests += 1
+                return 429, {"error": {"type": "es_rejected_execution_exception"}, "status": 429}
+            lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+            items = []
+            i = 0
+            while i < len(lines):
+                ((op_type, meta),) = lines[i].items()
+                source = None
+                if op_type != "delete":
+                    source = lines[i + 1]
+                    i += 1
+                i += 1
+                items.append({op_type: self._apply(op_type, meta, source, default_index)})
+            time.sleep(self.latency_s + self.per_doc_latency_s * len(items))
+            errors = any(next(iter(item.values()))["status"] >= 300 for item in items)
+            return 200, {"took": 1, "errors": errors, "items": items}
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _apply(self, op_type: str, meta: dict, source, default_index) -> dict:
+        index = meta.get("_index", default_index)
+        doc_id = meta.get("_id") or hashlib.sha1(json.dumps(source, sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            if self.reject_first_items > 0:
+                self.reject_first_items -= 1
+                self.rejected_items += 1
+                return {"_index": index, "_id": doc_id, "status": 429,
+                        "error": {"type": "es_rejected_execution_exception"}}
+            docs = self.documents.setdefault(index, {})
+            if op_type in ("index", "create"):
+                docs[doc_id] = source
+                return {"_index": index, "_id": doc_id, "status": 201}
+            if op_type == "update":
+                if doc_id not in docs:
+                    return {"_index": index, "_id": doc_id, "status": 404,
+                            "error": {"type": "document_missing_exception"}}
+                docs[doc_id] = {**docs[doc_id], **source.get("doc", {})}
+                return {"_index": index, "_id": doc_id, "status": 200}
+            existed = docs.pop(doc_id, None) is not None
+            return {"_index": index, "_id": doc_id, "status": 200 if existed else 404}
+
+
+class FakeImageModelClient:
+    """
+    Image model returning a caption and unit vector derived from the image bytes.
+    Records payload sizes and the peak number of concurrent calls.
+    """
+
+    def __init__(self, dim: int = 32, latency_s: float = 0.0, model_id: str = "fake-image-embed-v1"):
+        self.model_id = model_id
+        self.dim = dim
+        self.latency_s = latency_s
+        self.caption_calls = 0
+        self.embed_calls = 0
+        self.payload_bytes: List[int] = []
+        self.peak_concurrency = 0
+        self._in_flight = 0
+
+    async def _call(self):
+        self._in_flight += 1
+        self.peak_concurrency = max(self.peak_concurrency, self._in_flight)
+        try:
+            await asyncio.sleep(self.latency_s)
+        finally:
+            self._in_flight -= 1
+
+    async def caption(self, image: bytes) -> str:
+        self.caption_calls += 1
+        self.payload_bytes.append(len(image))
+        await self._call()
+        return f"A product photo ({hashlib.sha1(image).hexdigest()[:8]})."
+
+    async def embed(self, image: bytes) -> List[float]:
+        self.embed_calls += 1
+        self.payload_bytes.append(len(image))
+        await self._call()
+        seed = int.from_bytes(hashlib.sha256(image).digest()[:8], "little")
+        vector = np.random.default_rng(seed).normal(size=self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
@@ -0,0 +1,270 @@
+"""
+Image stage for ingestion: product photos are decoded, oriented, flattened to RGB
+and shrunk to a small JPEG thumbnail before any model sees them. Identical or
+near-identical photos (re-encoded or resized uploads) are grouped by a 64-bit
+difference hash plus a coarse colour signature that must also match: the hash
+is computed on greyscale, so colour variants of one product shot on the same
+background hash alike, and the signature keeps them apart. Only one photo per
+group is captioned and embedded, with bounded concurrency, and the results are
+shared with the rest of the group.
+
+Pillow is needed for decoding and resizing. It is an optional dependency: the
+module imports without it and only fails when images are actually processed.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from . import clients
+from .embedding_cache import EmbeddingCacheBackend, image_key
+from .embedding_engine import ThrottledError
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - exercised only where Pillow is missing
+    Image = ImageOps = None
+
+CAPTION_PROMPT = ("Describe this product photo for an e-commerce search index: the item, colour, material, "
+                  "pattern and any visible details. One or two sentences, no preamble.")
+
+
+class ImageModelClient(Protocol):
+    model_id: str
+
+    async def caption(self, image: bytes) -> str:
+        ...
+
+    async def embed(self, image: bytes) -> List[float]:
+        ...
+
+
+class BedrockImageModelClient:
+    """Captions with a Claude 3 vision model and embeds with Titan Multimodal, over one pooled client."""
+
+    _THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException"}
+
+    def __init__(self, caption_model_id: str = "anthropic.claude-3-haiku-20240307-v1:0",
+                 embedding_model_id: str = "amazon.titan-embed-image-v1", client=None, embedding_dim: int = 1024):
+        self.caption_model_id = caption_model_id
+        self.model_id = embedding_model_id
+        self.embedding_dim = embedding_dim
+        self.client = client or clients.get_bedrock_runtime_client()
+
+    def _invoke(self, model_id: str, body: dict) -> dict:
+        try:
+            response = self.client.invoke_model(modelId=model_id, body=json.dumps(body))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in self._THROTTLING_CODES:
+                raise ThrottledError(str(e)) from e
+            raise
+        return json.loads(response["body"].read())
+
+    def _caption_sync(self, image: bytes) -> str:
+        response = self._invoke(self.caption_model_id, {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 200,
+            "messages": [{"role": "user", "content": [
+                {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg",
+                                             "data": base64.b64encode(image).decode("ascii")}},
+                {"type": "text", "text": CAPTION_PROMPT},
+            ]}],
+        })
+        return "".join(block.get("text", "") for block in response["content"]).strip()
+
+    def _embed_sync(self, image: bytes) -> List[float]:
+        return self._invoke(self.model_id, {
+            "inputImage": base64.b64encode(image).decode("ascii"),
+            "embeddingConfig": {"outputEmbeddingLength": self.embedding_dim},
+        })["embedding"]
+
+    async def caption(self, image: bytes) -> str:
+        return await asyncio.to_thread(self._caption_sync, image)
+
+    async def embed(self, image: bytes) -> List[float]:
+        return await asyncio.to_thread(self._embed_sync, image)
+
+
+@dataclass
+class PreparedImage:
+    thumbnail: bytes  # JPEG, longest side <= max_side
+    dhash: int
+    original_bytes: int
+    colour: Tuple[int, ...] = ()  # see colour_signature
+
+
+@dataclass
+class ImageResult:
+    caption: str
+    embedding: List[float]
+    representative_id: str  # the image whose model output this is (itself unless deduplicated)
+
+
+def _require_pillow():
+    if Image is None:
+        raise ImportError("The image stage needs Pillow: pip install Pillow")
+
+
+async def _no_caption() -> str:
+    return ""
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """Difference hash of a PIL image: one bit per horizontally adjacent pixel pair of a 9x8 greyscale."""
+    pixels = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def colour_signature(image, grid: int = 4) -> Tuple[int, ...]:
+    """Mean RGB of each cell of a grid x grid split of a PIL image, flattened."""
+    return tuple(image.convert("RGB").resize((grid, grid), Image.BOX).tobytes())
+
+
+def colours_match(a: Sequence[int], b: Sequence[int], tolerance: int = 24) -> bool:
+    """True if no cell channel differs by more than `tolerance` (re-encoding and small exposure changes pass)."""
+    return len(a) == len(b) and all(abs(x - y) <= tolerance for x, y in zip(a, b))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def prepare_image(image_bytes: bytes, max_side: int = 512, quality: int = 85) -> PreparedImage:
+    """Decodes, applies EXIF orientation, flattens transparency onto white and re-encodes as a small JPEG."""
+    _require_pillow()
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("RGB", (max_side, max_side))  # JPEG: decode at reduced scale directly
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=quality, optimize=True)
+        return PreparedImage(thumbnail=out.getvalue(), dhash=dhash(image), original_bytes=len(image_bytes),
+                             colour=colour_signature(image))
+
+
+class PerceptualIndex:
+    """
+    Finds a previously seen hash within `max_distance` bits. Hashes are split into
+    max_distance + 1 bands; by pigeonhole, any match shares at least one band exactly,
+    so only hashes in the same band buckets are compared.
+    """
+
+    def __init__(self, max_distance: int = 4, hash_bits: int = 64):
+        self.max_distance = max_distance
+        self.n_bands = max_distance + 1
+        self.band_bits = hash_bits // self.n_bands
+        self._buckets: Dict[Tuple[int, int], List[Tuple[int, str]]] = {}
+
+    def _bands(self, value: int):
+        mask = (1 << self.band_bits) - 1
+        # The last band takes any leftover high bits.
+        for band in range(self.n_bands):
+            shift = band * self.band_bits
+            width_mask = mask if band < self.n_bands - 1 else ~0
+            yield band, (value >> shift) & width_mask
+
+    def find(self, value: int, accept: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """The first item within `max_distance` bits for which `accept` (if given) is true."""
+        for key in self._bands(value):
+            for other, item_id in self._buckets.get(key, ()):
+                if hamming(value, other) <= self.max_distance and (accept is None or accept(item_id)):
+                    return item_id
+        return None
+
+    def add(self, value: int, item_id: str):
+        for key in self._bands(value):
+            self._buckets.setdefault(key, []).append((value, item_id))
+
+
+class ImagePipeline:
+    """
+    Prepares, deduplicates, captions and embeds a batch of product images.
+    Embeddings of thumbnails already seen are served from the embedding cache.
+    """
+
+    def __init__(self, client: ImageModelClient, max_concurrency: int = 8, max_side: int = 512,
+                 max_distance: int = 4, cache: Optional[EmbeddingCacheBackend] = None, caption: bool = True,
+                 colour_tolerance: int = 24):
+        _require_pillow()
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.max_side = max_side
+        self.max_distance = max_distance
+        self.colour_tolerance = colour_tolerance
+        self.cache = cache
+        self.caption_enabled = caption
+        self.stats = {"images": 0, "unique": 0, "embedded": 0, "cache_hits": 0,
+                      "original_bytes": 0, "thumbnail_bytes": 0}
+
+    async def _describe(self, image: PreparedImage, semaphore: asyncio.Semaphore) -> Tuple[str, List[float]]:
+        key = image_key(self.client.model_id, image.thumbnail)
+        cached = await asyncio.to_thread(self.cache.get_many, [key]) if self.cache is not None else {}
+        async with semaphore:
+            caption_call = self.client.caption(image.thumbnail) if self.caption_enabled else _no_caption()
+            if key in cached:
+                self.stats["cache_hits"] += 1
+                return await caption_call, cached[key].tolist()
+            caption, embedding = await asyncio.gather(caption_call, self.client.embed(image.thumbnail))
+        self.stats["embedded"] += 1
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put_many, [(key, np.asarray(embedding, dtype=np.float32))])
+        return caption, embedding
+
+    async def process(self, images: Sequence[Tuple[str, bytes]]) -> Dict[str, ImageResult]:
+        """Maps each image ID to its caption and embedding; undecodable images are logged and left out."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # Decoding and resizing release the GIL inside Pillow, so threads overlap well.
+        prepared = await asyncio.gather(*[
+            asyncio.to_thread(prepare_image, data, self.max_side) for _, data in images
+        ], return_exceptions=True)
+
+        exact: Dict[str, str] = {}
+        near = PerceptualIndex(self.max_distance)
+        representative_of: Dict[str, str] = {}
+        unique: Dict[str, PreparedImage] = {}
+        for (image_id, data), image in zip(images, prepared):
+            if isinstance(image, Exception):
+                logger.warning(f"Skipping image {image_id}: {image}")
+                continue
+            self.stats["images"] += 1
+            self.stats["original_bytes"] += image.original_bytes
+            digest = hashlib.sha256(data).hexdigest()
+            representative = exact.get(digest) or near.find(
+                image.dhash, lambda other: colours_match(image.colour, unique[other].colour, self.colour_tolerance))
+            if representative is None:
+                representative = image_id
+                exact[digest] = image_id
+                near.add(image.dhash, image_id)
+                unique[image_id] = image
+                self.stats["thumbnail_bytes"] += len(image.thumbnail)
+            representative_of[image_id] = representative
+        self.stats["unique"] += len(unique)
+
+        described = await asyncio.gather(*[self._describe(image, semaphore) for image in unique.values()])
+        outputs = dict(zip(unique.keys(), described))
+        logger.info(f"Image stage: {len(representative_of)} images, {len(unique)} unique after dedup.")
+        return {
+            image_id: ImageResult(caption=outputs[rep][0], embedding=outputs[rep][1], representative_id=rep)
+            for image_id, rep in representative_of.items()
+        }
+
+    def process_sync(self, images: Sequence[Tuple[str, bytes]]) -> Dict[str, ImageResult]:
+        """Blocking entry point for Lambda handlers."""
+        return asyncio.run(self.process(images))
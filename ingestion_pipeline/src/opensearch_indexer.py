@@ -1,27 +1,80 @@
 import logging
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-from opensearchpy.helpers import bulk
+import os
+from typing import List, Optional
+import numpy as np
+from opensearchpy import OpenSearch
+
+from . import clients
+from .bulk_indexer import AsyncBulkIndexer, BulkIndexer
+from .delta_indexer import LocalManifestStore, ManifestStore, S3ManifestStore, sync_product
+from .embedding_store import decode_payload
 
 logger = logging.getLogger(__name__)
 
+clients.warm_up_in_lambda(services=("s3",), opensearch_host=os.environ.get("OPENSEARCH_HOST"))
+
 def get_opensearch_client(host: str, region: str):
-    """Initializes and returns an OpenSearch client."""
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, 'aoss')
-    client = OpenSearch(
-        hosts=[{'host': host, 'port': 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20
-    )
-    return client
+    """Returns the shared OpenSearch client for `host`, created on first use."""
+    return clients.get_opensearch_client(host, region)
 
 def index_documents(client: OpenSearch, index_name: str, documents: List[dict]):
-    """Bulk indexes documents into OpenSearch."""
+    """Bulk indexes documents into OpenSearch, in parallel requests, retrying rejected items."""
+    logger.info(f"Indexing {len(documents)} documents into index '{index_name}'.")
+    result = BulkIndexer(client, index_name).index(documents)
+    if result.failed:
+        logger.error(f"Failed to index {len(result.failed)} documents.")
+    return result.succeeded, result.failed
+
+async def index_documents_async(client, index_name: str, documents: List[dict]):
+    """index_documents for an AsyncOpenSearch client (see clients.get_async_opensearch_client)."""
     logger.info(f"Indexing {len(documents)} documents into index '{index_name}'.")
-    success, failed = bulk(client, documents, index=index_name)
-    if failed:
-        logger.error(f"Failed to index {len(failed)} documents.")
-    return success, failed
\ No newline at end of file
+    result = await AsyncBulkIndexer(client, index_name).index(documents)
+    if result.failed:
+        logger.error(f"Failed to index {len(result.failed)} documents.")
+    return result.succeeded, result.failed
+
+def _manifest_store() -> ManifestStore:
+    if os.environ.get("MANIFEST_BUCKET"):
+        return S3ManifestStore(clients.get_s3_client(), os.environ["MANIFEST_BUCKET"],
+                               os.environ.get("MANIFEST_PREFIX", "manifests/"))
+    return LocalManifestStore(os.environ.get("MANIFEST_DIR", "/tmp/manifests"))
+
+def _chunk_embeddings(payload, count: int) -> Optional[np.ndarray]:
+    """
+    One row per chunk from the GenerateEmbeddings output: a .remb payload
+    (embedding_store.encode_payload) or JSON float lists, one per chunk.
+    """
+    if not payload:
+        return None
+    if isinstance(payload, dict):
+        vectors = decode_payload(payload).vectors()
+    elif isinstance(payload, list):
+        vectors = np.asarray(payload, dtype=np.float32)
+        if vectors.ndim == 1 and count == 1:
+            vectors = vectors[np.newaxis, :]  # a single chunk's vector
+    else:
+        raise ValueError(f"Unsupported embeddings payload of type {type(payload).__name__}.")
+    if vectors.ndim != 2 or vectors.shape[0] != count:
+        raise ValueError(f"Expected one embedding per chunk ({count} chunks), got an array of shape {vectors.shape}.")
+    return vectors
+
+def handler(event, context):
+    """
+    Step Functions index task: incrementally reindexes one product (see
+    delta_indexer.sync_product). Expects `product_id`, `chunks` and `metadata`;
+    `embeddings`, the GenerateEmbeddings output with one row per chunk, is used
+    for the new chunks when present, otherwise only those chunks are embedded here.
+    """
+    chunks = event["chunks"]
+    chunk_embeddings = _chunk_embeddings(event.get("embeddings"), len(chunks))
+    embed_fn = None
+    if chunk_embeddings is None:
+        from .embedding_generator import generate_text_embedding_array
+        embed_fn = generate_text_embedding_array
+
+    client = get_opensearch_client(os.environ["OPENSEARCH_HOST"], os.environ.get("AWS_REGION", "us-east-1"))
+    plan = sync_product(client, os.environ.get("OPENSEARCH_INDEX", "products"), str(event["product_id"]),
+                        chunks, event.get("metadata") or {}, _manifest_store(), embed_fn,
+                        chunk_embeddings=chunk_embeddings)
+    return {"product_id": plan.product_id, "upserts": len(plan.upserts), "deletes": len(plan.deletes),
+            "metadata_updates": len(plan.metadata_updates)}
@@ -1,35 +1,32 @@
 import logging
 from typing import List, Dict
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.chat_models import BedrockChat
 from langchain_core.messages import HumanMessage
 
-# Assume Bedrock client is initialized globally or passed in
-bedrock_client = boto3.client('bedrock-runtime')
+from . import chunking, clients
+
 logger = logging.getLogger(__name__)
 
+def get_bedrock_client():
+    """Shared client from the registry, created on first use."""
+    return clients.get_bedrock_runtime_client()
+
 def clean_text(text: str) -> str:
     """Basic text cleaning (e.g., remove HTML tags)."""
     # In a real implementation, use BeautifulSoup or a similar library.
-    # For brevity, we'll use a simple placeholder.
-    import re
-    return re.sub(r'<[^>]+>', '', text)
+    return chunking.clean_text(text)
 
 def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
     """Splits text into semantically coherent chunks."""
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-    )
-    return text_splitter.split_text(text)
+    return chunking.get_chunker(chunk_size, chunk_overlap).split(text)
 
 def get_image_caption(image_bytes: bytes, bedrock_model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0") -> str:
     """Generates a descriptive caption for an image using a VLM."""
     # This would be a more complex implementation involving base64 encoding and
     # constructing the correct payload for the multimodal Bedrock model.
-    # For brevity, this is a conceptual placeholder.
-    # llm = BedrockChat(model_id=bedrock_model_id, client=bedrock_client)
+    # For brevity, this is a conceptual placeholder; batch ingestion uses
+    # image_pipeline.ImagePipeline (thumbnails, dedup, bounded concurrency) instead.
+    # llm = BedrockChat(model_id=bedrock_model_id, client=get_bedrock_client())
     # message = HumanMessage(content=[...]) # construct multimodal message
     # response = llm.invoke([message])
     # return response.content
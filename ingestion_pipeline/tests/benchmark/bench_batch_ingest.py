@@ -0,0 +1,55 @@
+"""
+Products per minute from a single BatchIngestor worker over a synthetic catalogue
+on local disk, with a fake embedding provider (with latency) and a fake index call.
+
+Run from ingestion_pipeline/:
+    python -m tests.benchmark.bench_batch_ingest --products 5000 --latency-ms 30 --index-latency-ms 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from src.batch_ingest import BatchIngestor, Checkpoint, LocalDirectorySource
+from src.embedding_engine import EmbeddingEngine
+from src.fakes import FakeEmbeddingProvider
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="per embedding request")
+    parser.add_argument("--index-latency-ms", type=float, default=50.0, help="per bulk request")
+    parser.add_argument("--load-concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        catalogue = os.path.join(root, "catalogue")
+        os.makedirs(catalogue)
+        for i in range(args.products):
+            with open(os.path.join(catalogue, f"{i:07d}.json"), "w") as f:
+                json.dump({"product_id": str(i), "description": f"Product {i}. A waterproof trail shoe. " * 60}, f)
+
+        provider = FakeEmbeddingProvider(max_batch_size=96, latency_s=args.latency_ms / 1000)
+        engine = EmbeddingEngine(provider, max_concurrency=16)
+        bulk_requests = []
+
+        def index_fn(documents):
+            time.sleep(args.index_latency_ms / 1000)
+            bulk_requests.append(len(documents))
+
+        checkpoint = Checkpoint(os.path.join(root, "run.ckpt"))
+        ingestor = BatchIngestor(LocalDirectorySource(catalogue), engine.embed, index_fn, checkpoint,
+                                 load_concurrency=args.load_concurrency, embed_batch_chunks=1024)
+        stats = asyncio.run(ingestor.run())
+        checkpoint.close()
+
+    print(f"{stats.products} products, {stats.chunks} chunks in {stats.elapsed_s:.2f}s")
+    print(f"{stats.products_per_minute:,.0f} products/min  "
+          f"({engine.stats['requests']} embedding requests, {len(bulk_requests)} bulk requests)")
+
+
+if __name__ == "__main__":
+    main()
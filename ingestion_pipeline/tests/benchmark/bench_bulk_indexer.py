@@ -0,0 +1,76 @@
+"""
+docs/sec of the old single `helpers.bulk` call against BulkIndexer, both against
+the local FakeOpenSearch server with per-request and per-document latency and a
+limit on concurrent bulk requests (beyond it, whole requests are rejected with 429).
+The fake runs in a child process so its JSON parsing does not share our GIL.
+
+Run from ingestion_pipeline/:
+    python -m tests.benchmark.bench_bulk_indexer --docs 20000 --dim 64
+"""
+import argparse
+import multiprocessing
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from opensearchpy import OpenSearch
+from opensearchpy.helpers import bulk
+
+from src.bulk_indexer import BulkIndexer
+from src.fakes import FakeOpenSearch
+
+
+def _serve(ports, fake_kwargs):
+    with FakeOpenSearch(**fake_kwargs) as fake:
+        ports.put(fake.port)
+        while True:
+            time.sleep(3600)
+
+
+@contextmanager
+def fake_cluster(**fake_kwargs):
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(ports, fake_kwargs), daemon=True)
+    process.start()
+    try:
+        yield ports.get(timeout=10)
+    finally:
+        process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="per bulk request")
+    parser.add_argument("--per-doc-us", type=float, default=200.0, help="per document in a bulk request")
+    parser.add_argument("--cluster-concurrency", type=int, default=6, help="bulk requests the fake accepts at once")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--chunk-docs", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.docs, args.dim)).astype(np.float32).round(5).tolist()
+    docs = [{"_id": f"p{i}#chunk", "text": f"chunk {i} " * 40, "embedding": vectors[i],
+             "metadata": {"product_id": f"p{i}"}} for i in range(args.docs)]
+
+    fake_kwargs = dict(latency_s=args.latency_ms / 1000, per_doc_latency_s=args.per_doc_us / 1e6,
+                       max_concurrent_bulk=args.cluster_concurrency)
+    with fake_cluster(**fake_kwargs) as port:
+        client = OpenSearch(hosts=[{"host": "127.0.0.1", "port": port}])
+        started = time.perf_counter()
+        success, _ = bulk(client, docs, index="products")
+        elapsed = time.perf_counter() - started
+        print(f"helpers.bulk : {elapsed:6.2f}s  {success / elapsed:8.0f} docs/s")
+
+    with fake_cluster(**fake_kwargs) as port:
+        client = OpenSearch(hosts=[{"host": "127.0.0.1", "port": port}], pool_maxsize=args.concurrency)
+        indexer = BulkIndexer(client, "products", max_chunk_docs=args.chunk_docs,
+                              max_concurrency=args.concurrency, base_backoff_s=0.05)
+        result = indexer.index(docs)
+        print(f"BulkIndexer  : {result.elapsed_s:6.2f}s  {result.docs_per_second:8.0f} docs/s  "
+              f"({result.requests} requests, {result.retried_items} items retried, {len(result.failed)} failed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Documents/sec for chunking a synthetic catalogue: a new RecursiveCharacterTextSplitter
+per document (the old chunk_text), the shared Chunker, and chunk_documents over a
+process pool.
+
+Run from ingestion_pipeline/:
+    python -m tests.benchmark.bench_chunking --docs 20000
+"""
+import argparse
+import os
+import random
+import time
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from src.chunking import ChunkerConfig, chunk_documents, get_chunker
+
+WORDS = ["waterproof", "lightweight", "trail", "shoe", "Vibram", "outsole", "lugs", "cushioned", "midsole",
+         "breathable", "mesh", "upper", "sizes", "run", "small", "hand", "wash", "only."]
+
+
+def make_description(rng: random.Random) -> str:
+    paragraphs = []
+    for _ in range(rng.randint(2, 8)):
+        lines = [" ".join(rng.choices(WORDS, k=rng.randint(8, 40))) for _ in range(rng.randint(1, 4))]
+        paragraphs.append("\n".join(lines))
+    return "\n\n".join(paragraphs)
+
+
+def report(name: str, n_docs: int, elapsed: float, n_chunks: int):
+    print(f"{name:<28}: {elapsed:6.2f}s  {n_docs / elapsed:9.0f} docs/s  ({n_chunks} chunks)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--chunk-size", type=int, default=400)
+    parser.add_argument("--chunk-overlap", type=int, default=80)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    texts = [make_description(rng) for _ in range(args.docs)]
+
+    started = time.perf_counter()
+    n_chunks = 0
+    for text in texts:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+                                                  length_function=len)
+        n_chunks += len(splitter.split_text(text))
+    report("splitter per document", args.docs, time.perf_counter() - started, n_chunks)
+
+    chunker = get_chunker(args.chunk_size, args.chunk_overlap)
+    started = time.perf_counter()
+    n_chunks = sum(len(chunker.split(text)) for text in texts)
+    report("shared Chunker", args.docs, time.perf_counter() - started, n_chunks)
+
+    config = ChunkerConfig(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    started = time.perf_counter()
+    n_chunks = sum(len(chunks) for chunks in chunk_documents(texts, config, processes=args.processes))
+    report(f"chunk_documents ({args.processes} procs)", args.docs, time.perf_counter() - started, n_chunks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Compares per-product sequential embedding (the old generate_text_embeddings loop)
+with the batched, concurrent EmbeddingEngine against a fake provider with latency.
+
+Run from ingestion_pipeline/:
+    python -m tests.benchmark.bench_embedding_engine --products 500 --latency-ms 20
+"""
+import argparse
+import asyncio
+import time
+
+from src.embedding_engine import EmbeddingEngine
+from src.fakes import FakeEmbeddingProvider
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--chunks-per-product", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--quota", type=int, default=12, help="provider's concurrent request quota")
+    args = parser.parse_args()
+
+    chunks = {f"p{i}": [f"product {i} chunk {j} " * 20 for j in range(args.chunks_per_product)]
+              for i in range(args.products)}
+    total = args.products * args.chunks_per_product
+
+    provider = FakeEmbeddingProvider(max_batch_size=args.batch_size, latency_s=args.latency_ms / 1000)
+    started = time.perf_counter()
+    for product_chunks in chunks.values():
+        await provider.embed_batch(product_chunks[:args.batch_size])
+    sequential_s = time.perf_counter() - started
+    print(f"sequential per product : {sequential_s:6.2f}s  {total / sequential_s:8.0f} chunks/s")
+
+    provider = FakeEmbeddingProvider(max_batch_size=args.batch_size, latency_s=args.latency_ms / 1000,
+                                     max_concurrent_requests=args.quota)
+    engine = EmbeddingEngine(provider, max_concurrency=args.concurrency, base_backoff_s=args.latency_ms / 1000)
+    started = time.perf_counter()
+    await engine.embed_products(chunks)
+    engine_s = time.perf_counter() - started
+    print(f"EmbeddingEngine        : {engine_s:6.2f}s  {total / engine_s:8.0f} chunks/s  "
+          f"({engine.stats['requests']} requests, {engine.stats['throttled']} throttled)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
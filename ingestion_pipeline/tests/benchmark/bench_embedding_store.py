@@ -0,0 +1,42 @@
+"""
+Compares embedding storage formats: bytes per million chunks, Step Functions payload
+size against the current JSON float lists, and recall@10 against float32 search.
+
+Run from ingestion_pipeline/:
+    python -m tests.benchmark.bench_embedding_store --dim 1024
+"""
+import argparse
+import json
+
+import numpy as np
+
+from src import embedding_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=20000, help="chunks used for the recall measurement")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--payload-chunks", type=int, default=20, help="chunks in one product's payload")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.n, args.dim)).astype(np.float32)
+    queries = vectors[:200] + 0.3 * rng.normal(size=(200, args.dim)).astype(np.float32)
+    product = vectors[:args.payload_chunks]
+    ids = [f"product-{i}#chunk" for i in range(args.payload_chunks)]
+
+    json_payload = len(json.dumps(product.tolist()))
+    python_lists_per_million = args.dim * 1_000_000 * (24 + 8)  # boxed float + list slot
+    print(f"{'format':8} {'MiB / 1M chunks':>16} {'payload bytes':>14} {'vs JSON':>8} {'recall@10':>10}")
+    print(f"{'lists':8} {python_lists_per_million / 2**20:16.0f} {json_payload:14d} {1.0:8.1f} {1.0:10.3f}")
+    for dtype in embedding_store.DTYPES:
+        rows, _ = embedding_store.quantize(product, dtype)
+        per_million = rows.itemsize * rows.shape[1] * 1_000_000
+        payload = len(json.dumps(embedding_store.encode_payload(ids, product, dtype)))
+        recall = embedding_store.quantization_recall(vectors, queries, dtype, k=10)
+        print(f"{dtype:8} {per_million / 2**20:16.0f} {payload:14d} {json_payload / payload:8.1f} {recall:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import json
+import pytest
+from src.batch_ingest import BatchIngestor, Checkpoint, IndexSnapshot, LocalDirectorySource
+from src.delta_indexer import LocalManifestStore
+from src.embedding_engine import EmbeddingEngine
+from src.embedding_store import open_embedding_file
+from src.fakes import FakeEmbeddingProvider
+
+def write_catalogue(root, n):
+    for i in range(n):
+        (root / f"p{i:03d}.json").write_text(json.dumps({
+            "product_id": f"p{i}", "price": i, "description": f"<b>Product {i}</b> is a sturdy trail shoe. " * 5,
+        }))
+
+def make_ingestor(tmp_path, index_fn, **kwargs):
+    engine = EmbeddingEngine(FakeEmbeddingProvider(dim=8))
+    return BatchIngestor(LocalDirectorySource(str(tmp_path / "catalogue")), engine.embed, index_fn,
+                         Checkpoint(str(tmp_path / "run.ckpt")), load_concurrency=4, queue_size=4,
+                         embed_batch_chunks=8, index_batch_docs=10, **kwargs)
+
+@pytest.mark.asyncio
+async def test_batch_ingest_indexes_every_product(tmp_path):
+    (tmp_path / "catalogue").mkdir()
+    write_catalogue(tmp_path / "catalogue", 25)
+    indexed = []
+    ingestor = make_ingestor(tmp_path, indexed.extend, manifest_store=LocalManifestStore(str(tmp_path / "manifests")))
+
+    stats = await ingestor.run()
+
+    assert stats.products == 25 and stats.failed == []
+    assert {doc["metadata"]["product_id"] for doc in indexed} == {f"p{i}" for i in range(25)}
+    assert all("<b>" not in doc["text"] and len(doc["embedding"]) == 8 for doc in indexed)
+    assert len({doc["_id"] for doc in indexed}) == len(indexed)
+    assert LocalManifestStore(str(tmp_path / "manifests")).get("p3") is not None
+
+@pytest.mark.asyncio
+async def test_snapshot_holds_every_indexed_chunk_for_the_local_retriever(tmp_path):
+    (tmp_path / "catalogue").mkdir()
+    write_catalogue(tmp_path / "catalogue", 5)
+    indexed = []
+    snapshot = IndexSnapshot(str(tmp_path / "snapshot"))
+
+    await make_ingestor(tmp_path, indexed.extend, snapshot=snapshot).run()
+    snapshot.close()
+
+    embeddings = open_embedding_file(str(tmp_path / "snapshot" / "embeddings.remb"))
+    with open(tmp_path / "snapshot" / "documents.jsonl") as f:
+        documents = [json.loads(line) for line in f]
+    by_id = {doc["_id"]: doc for doc in indexed}
+    assert sorted(embeddings.ids) == sorted(by_id) == sorted(doc["id"] for doc in documents)
+    for chunk_id, vector in zip(embeddings.ids, embeddings.vectors()):
+        assert vector.tolist() == pytest.approx(by_id[chunk_id]["embedding"])
+
+@pytest.mark.asyncio
+async def test_reingest_deletes_stale_chunks_and_skips_unchanged_ones(tmp_path):
+    """With manifests, a later run embeds only new chunks and deletes the ones that disappeared."""
+    (tmp_path / "catalogue").mkdir()
+    write_catalogue(tmp_path / "catalogue", 3)
+    store = LocalManifestStore(str(tmp_path / "manifests"))
+    first = []
+    await make_ingestor(tmp_path, first.extend, manifest_store=store).run()
+    old_ids = {doc["_id"] for doc in first if doc["metadata"]["product_id"] == "p1"}
+
+    (tmp_path / "catalogue" / "p001.json").write_text(json.dumps({
+        "product_id": "p1", "price": 1, "description": "Now a waterproof hiking boot.",
+    }))
+    (tmp_path / "run.ckpt").unlink()
+    second = []
+    stats = await make_ingestor(tmp_path, second.extend, manifest_store=store).run()
+
+    assert stats.products == 3
+    assert [doc["_op_type"] for doc in second if doc["_op_type"] != "delete"] == ["index"]
+    assert "waterproof" in second[0]["text"]
+    assert {doc["_id"] for doc in second if doc["_op_type"] == "delete"} == old_ids
+    assert stats.chunks == 1 and stats.deleted == len(old_ids)
+    assert set(store.get("p1")["chunks"]) == {second[0]["_id"]}
+
+@pytest.mark.asyncio
+async def test_failed_index_batch_is_recorded_and_retried(tmp_path):
+    """A failed index batch does not abort the run; its products are checkpointed as failed and retried."""
+    (tmp_path / "catalogue").mkdir()
+    write_catalogue(tmp_path / "catalogue", 30)
+    (tmp_path / "catalogue" / "broken.json").write_text("{not json")
+    indexed = []
+    calls = 0
+
+    def flaky_index(documents):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise ConnectionError("OpenSearch went away")
+        indexed.extend(documents)
+
+    first = await make_ingestor(tmp_path, flaky_index).run()
+    failed_keys = set(first.failed) - {"broken.json"}
+    first_run_products = {doc["metadata"]["product_id"] for doc in indexed}
+
+    assert failed_keys and "broken.json" in first.failed
+    assert first.products == 30 - len(failed_keys)
+    assert Checkpoint(str(tmp_path / "run.ckpt")).failed == failed_keys
+
+    resumed = []
+    stats = await make_ingestor(tmp_path, resumed.extend).run()
+
+    assert stats.skipped == 30 - len(failed_keys) and stats.products == len(failed_keys)
+    assert stats.failed == ["broken.json"]
+    assert first_run_products | {doc["metadata"]["product_id"] for doc in resumed} == {f"p{i}" for i in range(30)}
+    assert Checkpoint(str(tmp_path / "run.ckpt")).failed == set()
@@ -0,0 +1,74 @@
+import pytest
+from opensearchpy import AsyncOpenSearch, OpenSearch
+from src.bulk_indexer import AsyncBulkIndexer, BulkIndexer, bulk_load_mode
+from src.fakes import FakeOpenSearch
+
+def make_docs(n):
+    return ({"_id": f"doc-{i}", "text": f"chunk {i}", "metadata": {"product_id": f"p{i % 7}"}} for i in range(n))
+
+def test_parallel_bulk_indexes_everything():
+    with FakeOpenSearch(latency_s=0.01) as fake:
+        client = OpenSearch(hosts=[{"host": fake.host, "port": fake.port}])
+        result = BulkIndexer(client, "products", max_chunk_docs=50, max_concurrency=4).index(make_docs(1000))
+
+    assert result.succeeded == 1000 and result.failed == []
+    assert len(fake.documents["products"]) == 1000
+    assert fake.peak_concurrent_bulk > 1
+
+def test_requests_are_cut_by_bytes():
+    with FakeOpenSearch() as fake:
+        client = OpenSearch(hosts=[{"host": fake.host, "port": fake.port}])
+        result = BulkIndexer(client, "products", max_chunk_bytes=2000).index(make_docs(100))
+    assert result.succeeded == 100
+    assert fake.bulk_requests >= 5
+
+def test_only_rejected_items_are_retried():
+    """Items rejected with 429 are resent after backoff; accepted items are not sent twice."""
+    with FakeOpenSearch(reject_first_items=30) as fake:
+        client = OpenSearch(hosts=[{"host": fake.host, "port": fake.port}])
+        indexer = BulkIndexer(client, "products", max_chunk_docs=100, max_concurrency=1, base_backoff_s=0.001)
+        result = indexer.index(make_docs(100))
+
+    assert result.succeeded == 100 and result.failed == []
+    assert result.retried_items == 30
+    assert indexer.chunk_docs < 100  # shrank after the rejection
+
+def test_whole_request_rejections_back_off_and_recover():
+    with FakeOpenSearch(latency_s=0.02, max_concurrent_bulk=2) as fake:
+        client = OpenSearch(hosts=[{"host": fake.host, "port": fake.port}], max_retries=0)
+        result = BulkIndexer(client, "products", max_chunk_docs=20, max_concurrency=6,
+                             base_backoff_s=0.01, max_retries=10).index(make_docs(400))
+    assert result.succeeded == 400
+    assert fake.rejected_requests > 0
+
+def test_non_retryable_item_errors_are_reported():
+    with FakeOpenSearch() as fake:
+        client = OpenSearch(hosts=[{"host": fake.host, "port": fake.port}])
+        result = BulkIndexer(client, "products").index(
+            [{"_op_type": "update", "_id": "missing", "doc": {"metadata": {}}}, {"_id": "a", "text": "x"}])
+    assert result.succeeded == 1
+    assert result.failed[0]["update"]["status"] == 404
+
+@pytest.mark.asyncio
+async def test_async_indexer_retries_rejections_on_the_event_loop():
+    with FakeOpenSearch(latency_s=0.01, reject_first_items=30) as fake:
+        client = AsyncOpenSearch(hosts=[{"host": fake.host, "port": fake.port}])
+        try:
+            indexer = AsyncBulkIndexer(client, "products", max_chunk_docs=50, max_concurrency=4, base_backoff_s=0.001)
+            result = await indexer.index(make_docs(500))
+        finally:
+            await client.close()
+
+    assert result.succeeded == 500 and result.failed == []
+    assert result.retried_items == 30
+    assert len(fake.documents["products"]) == 500
+    assert fake.peak_concurrent_bulk > 1
+
+def test_bulk_load_mode_restores_settings():
+    with FakeOpenSearch() as fake:
+        client = OpenSearch(hosts=[{"host": fake.host, "port": fake.port}])
+        with bulk_load_mode(client, "products"):
+            assert fake.settings["products"]["refresh_interval"] == "-1"
+            assert fake.settings["products"]["number_of_replicas"] == "0"
+    assert fake.settings["products"] == {"refresh_interval": "1s", "number_of_replicas": "1"}
+    assert fake.refreshes == 1
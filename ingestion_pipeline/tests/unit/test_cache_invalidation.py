@@ -0,0 +1,13 @@
+from unittest.mock import MagicMock
+from src import cache_invalidation
+
+def test_invalidate_cached_answers_deletes_keys_citing_products():
+    """Answer keys indexed under a reindexed product are deleted together with the index set."""
+    redis_client = MagicMock()
+    redis_client.smembers.side_effect = lambda key: {b"answer-cache:q:abc"} if key.endswith(":p1") else set()
+
+    invalidated = cache_invalidation.invalidate_cached_answers(redis_client, ["p1", "p2"])
+
+    assert invalidated == 1
+    redis_client.smembers.assert_any_call("answer-cache:product:p1")
+    redis_client.delete.assert_any_call(b"answer-cache:q:abc")
@@ -0,0 +1,33 @@
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from src.chunking import Chunker, ChunkerConfig, approximate_token_count, chunk_documents, get_chunker
+
+DESCRIPTION = ("Trail Runner 2\n\nA lightweight, waterproof trail shoe.\nVibram outsole with 5mm lugs. "
+               "Runs half a size small; order up.\n\n\nCare: hand wash only. " * 20)
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(1000, 200), (100, 20), (37, 0), (12, 11)])
+def test_chunks_match_recursive_character_splitter(chunk_size, chunk_overlap):
+    expected = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_text(DESCRIPTION)
+    assert get_chunker(chunk_size, chunk_overlap).split(DESCRIPTION) == expected
+
+def test_chunk_offsets_point_into_the_source():
+    chunks = list(get_chunker(100, 20).iter_chunks(DESCRIPTION))
+    assert all(DESCRIPTION[c.start:c.end] == c.text for c in chunks)
+    assert chunks == sorted(chunks, key=lambda c: c.start)
+
+def test_token_sized_chunks_stay_under_the_limit():
+    chunker = Chunker(ChunkerConfig(chunk_size=40, chunk_overlap=5, length_unit="tokens"))
+    chunks = chunker.split(DESCRIPTION)
+    assert len(chunks) > 1
+    assert max(approximate_token_count(c) for c in chunks) <= 40
+
+def test_chunk_documents_keeps_input_order_across_processes():
+    texts = [f"product {i}. " * (i + 1) for i in range(50)]
+    config = ChunkerConfig(chunk_size=60, chunk_overlap=10)
+    parallel = list(chunk_documents(iter(texts), config, processes=2, batch_size=4))
+    assert parallel == list(chunk_documents(texts, config, processes=1))
+    assert [c.text for c in parallel[7]] == get_chunker(60, 10).split(texts[7])
+
+def test_overlap_larger_than_size_is_rejected():
+    with pytest.raises(ValueError):
+        Chunker(ChunkerConfig(chunk_size=10, chunk_overlap=20))
@@ -0,0 +1,40 @@
+import threading
+from src import clients
+
+def test_clients_are_created_once_across_threads(mocker):
+    clients.reset()
+    session = mocker.patch.object(clients.boto3, "Session").return_value
+    session.client.side_effect = lambda service, **kwargs: object()
+    barrier = threading.Barrier(8)
+    seen = []
+
+    def get():
+        barrier.wait()
+        seen.append(clients.get_s3_client())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(client) for client in seen}) == 1
+    assert session.client.call_count == 1
+    clients.reset()
+
+def test_config_overrides_get_their_own_client(mocker):
+    clients.reset()
+    session = mocker.patch.object(clients.boto3, "Session").return_value
+    session.client.side_effect = lambda service, **kwargs: object()
+
+    assert clients.get_bedrock_runtime_client() is clients.get_bedrock_runtime_client()
+    assert clients.get_s3_client() is not clients.get_s3_client(max_pool_connections=8)
+    config = session.client.call_args.kwargs["config"]
+    assert config.max_pool_connections == 8 and config.tcp_keepalive
+    clients.reset()
+
+def test_warm_up_never_raises(mocker):
+    clients.reset()
+    mocker.patch.object(clients.boto3, "Session", side_effect=RuntimeError("no credentials"))
+    clients.warm_up()
+    clients.reset()
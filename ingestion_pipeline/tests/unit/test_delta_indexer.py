@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from src import delta_indexer
+from src.bulk_indexer import BulkResult
+from src.delta_indexer import LocalManifestStore, assign_chunk_ids, plan_product_update
+
+def fake_embed(texts):
+    return np.ones((len(texts), 4), dtype=np.float32)
+
+class RecordingIndexer:
+    """Stands in for BulkIndexer: records each call's actions and fails the ones given."""
+
+    def __init__(self, failed=()):
+        self.calls = []
+        self.failed = list(failed)
+
+    def index(self, actions):
+        actions = list(actions)
+        self.calls.append(actions)
+        return BulkResult(succeeded=len(actions) - len(self.failed), failed=self.failed)
+
+def search_hits(*ids):
+    return {"hits": {"hits": [{"_id": doc_id} for doc_id in ids]}}
+
+def test_chunk_ids_are_stable_and_content_addressed():
+    first = assign_chunk_ids("p1", ["intro", "sizing", "care"])
+    second = assign_chunk_ids("p1", ["new intro", "sizing", "care"])
+    assert first[1:] == second[1:]
+    assert first[0] != second[0]
+    # Repeated text within a product still gets distinct IDs.
+    repeated = assign_chunk_ids("p1", ["same", "same"])
+    assert repeated[0][0] != repeated[1][0]
+
+def test_shrunk_description_deletes_orphaned_chunks():
+    previous = plan_product_update("p1", ["a", "b", "c"], {"price": 10}, None).manifest
+    plan = plan_product_update("p1", ["a", "b"], {"price": 10}, previous)
+    assert plan.upserts == []
+    assert plan.deletes == [assign_chunk_ids("p1", ["c"])[0][0]]
+    assert plan.metadata_updates == []
+
+def test_sync_product_only_touches_changed_chunks(tmp_path):
+    """Second sync embeds and indexes only the edited chunk; the stale one is deleted."""
+    store = LocalManifestStore(str(tmp_path))
+    client = MagicMock()
+    client.search.return_value = search_hits("legacy-random-id")
+    indexer = RecordingIndexer()
+    embed = MagicMock(side_effect=fake_embed)
+
+    delta_indexer.sync_product(client, "products", "p1", ["intro", "sizing"], {"price": 10}, store, embed,
+                               indexer=indexer)
+    # The first sync deletes documents from the old pipeline by ID (no delete-by-query on Serverless).
+    assert indexer.calls[0][-1] == {"_op_type": "delete", "_id": "legacy-random-id"}
+    plan = delta_indexer.sync_product(client, "products", "p1", ["intro", "sizing (runs small)"],
+                                      {"price": 10}, store, embed, indexer=indexer)
+
+    assert embed.call_args.args[0] == ["sizing (runs small)"]
+    actions = indexer.calls[-1]
+    assert [a["_op_type"] for a in actions] == ["index", "delete"]
+    assert actions[0]["_id"] == plan.upserts[0][0]
+    assert client.search.call_count == 1
+    client.delete_by_query.assert_not_called()
+    assert store.get("p1") == plan.manifest
+
+def test_metadata_change_is_a_partial_update_without_embedding(tmp_path):
+    store = LocalManifestStore(str(tmp_path))
+    indexer = RecordingIndexer()
+    embed = MagicMock(side_effect=fake_embed)
+    delta_indexer.sync_product(MagicMock(), "products", "p1", ["intro"], {"price": 10}, store, embed,
+                               indexer=indexer)
+    embed.reset_mock()
+
+    delta_indexer.sync_product(MagicMock(), "products", "p1", ["intro"], {"price": 8}, store, embed,
+                               indexer=indexer)
+
+    embed.assert_not_called()
+    (action,) = indexer.calls[-1]
+    assert action["_op_type"] == "update" and action["doc"]["metadata"]["price"] == 8
+
+def test_failed_bulk_keeps_previous_manifest(tmp_path):
+    store = LocalManifestStore(str(tmp_path))
+    indexer = RecordingIndexer(failed=[{"index": {"status": 500}}])
+    with pytest.raises(RuntimeError):
+        delta_indexer.sync_product(MagicMock(), "products", "p1", ["intro"], {}, store, fake_embed, indexer=indexer)
+    assert store.get("p1") is None
+
+def test_index_step_handler_reindexes_incrementally(tmp_path, monkeypatch, mocker):
+    """The Step Functions index task goes through sync_product, using the embeddings payload it is given."""
+    from src import opensearch_indexer
+    from src.embedding_store import encode_payload
+
+    monkeypatch.setenv("OPENSEARCH_HOST", "search.example")
+    monkeypatch.setenv("MANIFEST_DIR", str(tmp_path))
+    monkeypatch.delenv("MANIFEST_BUCKET", raising=False)
+    mocker.patch.object(opensearch_indexer, "get_opensearch_client", return_value=MagicMock())
+    indexer = RecordingIndexer()
+    mocker.patch.object(delta_indexer, "BulkIndexer", return_value=indexer)
+
+    def event(chunks, price):
+        vectors = np.arange(len(chunks) * 4, dtype=np.float32).reshape(len(chunks), 4)
+        return {"product_id": "p1", "chunks": chunks, "metadata": {"price": price},
+                "embeddings": encode_payload([f"c{i}" for i in range(len(chunks))], vectors, dtype="float32")}
+
+    first = opensearch_indexer.handler(event(["intro", "sizing"], 10), None)
+    second = opensearch_indexer.handler(event(["intro", "care"], 10), None)
+
+    assert first == {"product_id": "p1", "upserts": 2, "deletes": 0, "metadata_updates": 0}
+    assert second == {"product_id": "p1", "upserts": 1, "deletes": 1, "metadata_updates": 0}
+    index_action, delete_action = indexer.calls[-1]
+    assert index_action["text"] == "care" and index_action["embedding"] == [4.0, 5.0, 6.0, 7.0]
+    assert delete_action["_op_type"] == "delete"
+    assert LocalManifestStore(str(tmp_path)).get("p1")["chunks"].keys() == {index_action["_id"], *[
+        chunk_id for chunk_id, _ in assign_chunk_ids("p1", ["intro"])]}
+
+def test_index_step_accepts_float_lists_and_keeps_repeated_chunks_apart(tmp_path, monkeypatch, mocker):
+    """The JSON float lists GenerateEmbeddings returns work too; rows are matched by position, not text."""
+    from src import opensearch_indexer
+
+    monkeypatch.setenv("OPENSEARCH_HOST", "search.example")
+    monkeypatch.setenv("MANIFEST_DIR", str(tmp_path))
+    monkeypatch.delenv("MANIFEST_BUCKET", raising=False)
+    mocker.patch.object(opensearch_indexer, "get_opensearch_client", return_value=MagicMock())
+    indexer = RecordingIndexer()
+    mocker.patch.object(delta_indexer, "BulkIndexer", return_value=indexer)
+
+    event = {"product_id": "p1", "chunks": ["same", "other", "same"], "metadata": {},
+             "embeddings": [[1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]}
+    opensearch_indexer.handler(event, None)
+
+    assert [a["embedding"] for a in indexer.calls[0] if a["_op_type"] == "index"] == [[1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]
+    with pytest.raises(ValueError):
+        opensearch_indexer.handler({**event, "embeddings": [[1.0, 0.0]]}, None)
@@ -0,0 +1,78 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from src.embedding_cache import CachedEmbeddingEngine, SQLiteEmbeddingCache, text_key
+from src.embedding_engine import EmbeddingEngine
+from src.fakes import FakeEmbeddingProvider
+
+def test_text_key_ignores_whitespace_but_not_model():
+    assert text_key("m1", "Waterproof  shoes\n") == text_key("m1", "Waterproof shoes")
+    assert text_key("m1", "Waterproof shoes") != text_key("m2", "Waterproof shoes")
+
+@pytest.mark.asyncio
+async def test_only_new_or_changed_chunks_reach_the_model(tmp_path):
+    """A second sync of the same product only embeds the chunk whose text changed."""
+    provider = FakeEmbeddingProvider()
+    cache = SQLiteEmbeddingCache(str(tmp_path / "cache.sqlite"))
+    engine = CachedEmbeddingEngine(EmbeddingEngine(provider), cache)
+
+    first = await engine.embed(["chunk one", "chunk two", "chunk two"])
+    provider.embedded_texts.clear()
+    second = await engine.embed(["chunk one", "chunk two (now on sale)"])
+
+    assert provider.embedded_texts == ["chunk two (now on sale)"]
+    assert np.allclose(second[0], first[0])
+    assert (engine.hits, engine.misses) == (1, 4)
+
+def test_sqlite_cache_evicts_least_recently_used(tmp_path):
+    cache = SQLiteEmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.put_many([("a", np.ones(4)), ("b", np.ones(4))])
+    cache.get_many(["a"])
+    cache.put_many([("c", np.ones(4))])
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+
+def test_sqlite_cache_count_survives_rewrites_and_reopening(tmp_path):
+    """Overwriting a key does not count as a new entry, and a reopened cache picks up the stored rows."""
+    path = str(tmp_path / "cache.sqlite")
+    cache = SQLiteEmbeddingCache(path, max_entries=3)
+    cache.put_many([("a", np.ones(4)), ("b", np.ones(4)), ("b", np.zeros(4))])
+    cache.put_many([("a", np.zeros(4)), ("c", np.ones(4))])
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "b", "c"}
+
+    reopened = SQLiteEmbeddingCache(path, max_entries=3)
+    reopened.get_many(["b", "c"])
+    reopened.put_many([("d", np.ones(4))])
+    assert set(reopened.get_many(["a", "b", "c", "d"])) == {"b", "c", "d"}
+
+@pytest.mark.asyncio
+async def test_hit_rate_is_emitted_once_per_invocation(tmp_path, capsys):
+    engine = CachedEmbeddingEngine(EmbeddingEngine(FakeEmbeddingProvider()),
+                                   SQLiteEmbeddingCache(str(tmp_path / "cache.sqlite")))
+    await engine.embed(["a", "b"])
+    await engine.embed(["a", "c"])
+    assert capsys.readouterr().out == ""
+
+    engine.emit_hit_rate()
+    engine.emit_hit_rate()  # nothing new to report
+
+    [line] = capsys.readouterr().out.splitlines()
+    record = json.loads(line)
+    assert (record["EmbeddingCacheHits"], record["EmbeddingCacheLookups"]) == (1, 4)
+    assert record["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "RAGIngestion"
+
+def test_sqlite_cache_is_safe_to_share_between_threads(tmp_path):
+    cache = SQLiteEmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=50)
+
+    def work(worker):
+        for i in range(50):
+            cache.put_many([(f"{worker}-{i}", np.full(4, i))])
+            cache.get_many([f"{worker}-{i}", f"{worker}-{i - 1}"])
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(work, range(8)))
+    # Whichever entries survived eviction are intact, and eviction kept the bound.
+    found = cache.get_many([f"{worker}-{i}" for worker in range(8) for i in range(50)])
+    assert 0 < len(found) <= 50
+    assert all(np.array_equal(vector, np.full(4, int(key.split("-")[1]))) for key, vector in found.items())
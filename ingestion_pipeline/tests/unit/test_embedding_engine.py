@@ -0,0 +1,48 @@
+import asyncio
+import numpy as np
+import pytest
+from src.embedding_engine import EmbeddingEngine, TokenBucket, pack_batches
+from src.fakes import FakeEmbeddingProvider
+
+def test_pack_batches_respects_count_and_size_limits():
+    texts = ["a" * 10, "b" * 10, "c" * 30, "d" * 5, "e" * 5, "f" * 5]
+    assert pack_batches(texts, max_batch_size=3, max_batch_chars=40) == [[0, 1], [2, 3, 4], [5]]
+
+@pytest.mark.asyncio
+async def test_engine_batches_products_together_and_recovers_from_throttling():
+    """Chunks from many products share batches, results come back in order, and throttled batches are retried."""
+    provider = FakeEmbeddingProvider(max_batch_size=4, throttle_first=3, latency_s=0.001)
+    engine = EmbeddingEngine(provider, max_concurrency=4, base_backoff_s=0.001)
+    chunks_by_product = {f"p{i}": [f"product {i} chunk {j}" for j in range(3)] for i in range(5)}
+
+    result = await engine.embed_products(chunks_by_product)
+
+    assert set(result) == set(chunks_by_product)
+    assert np.allclose(result["p2"][1], provider.vector("product 2 chunk 1"))
+    assert provider.throttled == 3
+    assert engine.stats["requests"] == 4 + 3  # ceil(15 / 4) batches plus the retries
+    assert engine._concurrency_limit < 4
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_request_rate():
+    bucket = TokenBucket(rate=100, capacity=1)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for _ in range(6):
+        await bucket.acquire()
+    assert loop.time() - started >= 0.045
+
+@pytest.mark.asyncio
+async def test_failed_batch_cancels_the_remaining_batches():
+    """A non-throttling error fails the call without leaving sibling requests running."""
+    class FailingProvider(FakeEmbeddingProvider):
+        async def embed_batch(self, texts):
+            if texts == ["bad"]:
+                raise ValueError("malformed input")
+            return await super().embed_batch(texts)
+
+    provider = FailingProvider(dim=8, max_batch_size=1, latency_s=0.05)
+    with pytest.raises(ValueError):
+        await EmbeddingEngine(provider).embed(["bad"] + [f"text {i}" for i in range(20)])
+    await asyncio.sleep(0.2)
+    assert provider.embedded_texts == []
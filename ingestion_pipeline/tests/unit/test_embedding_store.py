@@ -0,0 +1,49 @@
+import json
+import numpy as np
+import pytest
+from src import embedding_store
+
+@pytest.mark.parametrize("dtype", embedding_store.DTYPES)
+def test_embedding_file_round_trips_through_mmap(tmp_path, dtype):
+    """Every dtype writes a file that memory-maps back to the same IDs and (approximately) the same vectors."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(64, 40)).astype(np.float32)
+    ids = [f"prod-{i}#chunk-0" for i in range(64)]
+    path = str(tmp_path / f"embeddings.{dtype}.remb")
+
+    embedding_store.write_embedding_file(path, ids, vectors, dtype=dtype)
+    loaded = embedding_store.open_embedding_file(path)
+
+    assert loaded.ids == ids
+    assert loaded.header["data_offset"] % embedding_store.ALIGNMENT == 0
+    decoded = loaded.vectors()
+    assert decoded.shape == vectors.shape
+    if dtype == "binary":
+        assert np.array_equal(decoded > 0, vectors > 0)
+    else:
+        assert np.allclose(decoded, vectors, atol=0.05)
+
+@pytest.mark.parametrize("dtype", embedding_store.DTYPES)
+def test_empty_embedding_file_round_trips(tmp_path, dtype):
+    path = str(tmp_path / "empty.remb")
+    embedding_store.write_embedding_file(path, [], np.empty((0, 40), dtype=np.float32), dtype=dtype)
+    loaded = embedding_store.open_embedding_file(path)
+    assert loaded.ids == [] and len(loaded) == 0
+    assert loaded.vectors().shape == (0, 40)
+
+def test_int8_payload_is_much_smaller_than_json_with_high_recall():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(200, 256)).astype(np.float32)
+    ids = [f"p{i}" for i in range(200)]
+
+    payload = embedding_store.encode_payload(ids, vectors, dtype="int8")
+
+    assert len(json.dumps(payload)) * 4 < len(json.dumps(vectors.tolist()))
+    assert np.allclose(embedding_store.decode_payload(payload).vectors(), vectors, atol=0.05)
+    assert embedding_store.quantization_recall(vectors, vectors[:20] + 0.1, "int8", k=10) >= 0.9
+
+def test_payloads_are_lossless_by_default():
+    """Payloads feed the index, so only an explicit dtype quantizes them."""
+    vectors = np.random.default_rng(2).normal(size=(5, 16)).astype(np.float32)
+    payload = embedding_store.encode_payload([f"p{i}" for i in range(5)], vectors)
+    assert np.array_equal(embedding_store.decode_payload(payload).vectors(), vectors)
@@ -0,0 +1,87 @@
+import io
+import numpy as np
+import pytest
+from src.embedding_cache import InMemoryEmbeddingCache
+from src.fakes import FakeImageModelClient
+from src.image_pipeline import PerceptualIndex
+
+Image = pytest.importorskip("PIL.Image")
+from src.image_pipeline import ImagePipeline, prepare_image
+
+def photo(seed, size=(1600, 1200), quality=95, brightness=0):
+    rng = np.random.default_rng(seed)
+    # Smooth gradients plus a few blocks, like a product shot, rather than pure noise.
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    base = (x * rng.uniform(0.05, 0.2) + y * rng.uniform(0.05, 0.2)) % 255
+    pixels = np.stack([base, np.roll(base, 200, axis=1), base[::-1]], axis=-1)
+    for _ in range(5):
+        x0, y0 = rng.integers(0, size[0] - 300), rng.integers(0, size[1] - 300)
+        pixels[y0:y0 + 300, x0:x0 + 300] = rng.integers(0, 255, 3)
+    image = Image.fromarray(np.clip(pixels + brightness, 0, 255).astype(np.uint8))
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+def product_shot(colour, size=(1200, 1200)):
+    # A flat-colour shirt on a studio background: colour variants differ only in hue.
+    from PIL import ImageDraw
+    image = Image.new("RGB", size, (245, 245, 245))
+    ImageDraw.Draw(image).polygon([(300, 200), (900, 200), (1050, 450), (900, 500), (900, 1050),
+                                   (300, 1050), (300, 500), (150, 450)], fill=colour)
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+def test_thumbnail_is_small_jpeg():
+    prepared = prepare_image(photo(1), max_side=256)
+    thumbnail = Image.open(io.BytesIO(prepared.thumbnail))
+    assert max(thumbnail.size) == 256 and thumbnail.format == "JPEG"
+    assert len(prepared.thumbnail) < prepared.original_bytes / 5
+
+def test_perceptual_index_finds_near_hashes_only():
+    index = PerceptualIndex(max_distance=4)
+    index.add(0b1011 << 60, "a")
+    assert index.find((0b1011 << 60) ^ 0b111) == "a"
+    assert index.find((0b1011 << 60) ^ 0b11111) is None
+
+@pytest.mark.asyncio
+async def test_near_duplicate_photos_share_one_model_call():
+    client = FakeImageModelClient(latency_s=0.01)
+    pipeline = ImagePipeline(client, max_concurrency=2, max_side=256)
+    images = [
+        ("red-s", photo(1)), ("red-m", photo(1)),                   # identical bytes
+        ("red-l", photo(1, quality=70, brightness=3)),              # re-encoded, slightly brighter
+        ("blue-s", photo(2)), ("green-s", photo(3)), ("broken", b"not an image"),
+    ]
+
+    results = await pipeline.process(images)
+
+    assert set(results) == {"red-s", "red-m", "red-l", "blue-s", "green-s"}
+    assert results["red-m"].representative_id == results["red-l"].representative_id == "red-s"
+    assert results["red-l"].embedding == results["red-s"].embedding
+    assert client.embed_calls == client.caption_calls == 3
+    assert client.peak_concurrency <= 4  # 2 images in flight, caption + embed each
+    assert max(client.payload_bytes) < min(len(data) for _, data in images[:5]) / 5
+
+@pytest.mark.asyncio
+async def test_colour_variants_are_not_merged():
+    client = FakeImageModelClient()
+    pipeline = ImagePipeline(client, caption=False)
+    images = [("red", product_shot((200, 30, 30))), ("blue", product_shot((30, 40, 160))),
+              ("navy", product_shot((20, 30, 70)))]
+    prepared = [prepare_image(data) for _, data in images]
+    assert len({p.dhash for p in prepared}) < 3  # greyscale hashes alone would group them
+
+    results = await pipeline.process(images)
+
+    assert [results[name].representative_id for name, _ in images] == ["red", "blue", "navy"]
+    assert client.embed_calls == 3
+
+@pytest.mark.asyncio
+async def test_cached_embeddings_skip_the_model():
+    client = FakeImageModelClient()
+    pipeline = ImagePipeline(client, cache=InMemoryEmbeddingCache(), caption=False)
+    await pipeline.process([("a", photo(4))])
+    await pipeline.process([("a", photo(4))])
+    assert client.embed_calls == 1 and client.caption_calls == 0
+    assert pipeline.stats["cache_hits"] == 1
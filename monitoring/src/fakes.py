@@ -0,0 +1,31 @@
+import asyncio
+import re
+from typing import List
+
+
+class FakeJudge:
+    """
+    Local stand-in for the LLM judge: groundedness is the fraction of the
+    answer's content words found in the context. Records concurrency for tests.
+    """
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.calls: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def judge(self, query: str, answer: str, context: str) -> float:
+        self.calls.append(query)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency_s:
+                await asyncio.sleep(self.latency_s)
+            words = [w for w in re.findall(r"\w+", answer.lower()) if len(w) > 3]
+            if not words:
+                return 1.0
+            context_words = set(re.findall(r"\w+", context.lower()))
+            return sum(w in context_words for w in words) / len(words)
+        finally:
+            self.in_flight -= 1
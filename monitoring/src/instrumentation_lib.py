@@ -1,58 +1,500 @@
+import atexit
+import copy
 import logging
+import logging.handlers
 import json
+import math
 import os
+import queue
+import sys
+import threading
+import time
 import boto3
+from botocore.config import Config
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
 from uuid import uuid4
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:  # stdlib json fallback
+    HAS_ORJSON = False
+
+def _json_dumps(obj) -> str:
+    if HAS_ORJSON:
+        return orjson.dumps(obj, default=str).decode('utf-8')
+    return json.dumps(obj, default=str)
+
+# Fields passed with `extra=` that are written out, e.g. the per-response record
+# the log processor computes latency and groundedness signals from.
+EXTRA_FIELDS = ("query", "answer", "context", "variant", "user_id", "total_ms", "answer_source")
+
 # Use a custom JSON formatter for structured logging
 class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record, plus any EXTRA_FIELDS the record carries. The
+    timestamp prefix is cached per second, and orjson is used when installed.
+    With the async handler this runs on the listener thread, not the request path.
+    """
+
+    def __init__(self, service: str = "RAGInferenceService", datefmt: Optional[str] = None):
+        super().__init__(datefmt=datefmt)
+        self.service = service
+        self._cached_second = None
+        self._cached_prefix = ""
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt is not None:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_prefix = time.strftime(self.default_time_format, self.converter(record.created))
+            self._cached_second = second
+        return f"{self._cached_prefix},{int(record.msecs):03d}"
+
     def format(self, record):
         log_record = {
             "timestamp": self.formatTime(record, self.datefmt),
             "level": record.levelname,
             "message": record.getMessage(),
             "trace_id": getattr(record, "trace_id", "N/A"),
-            "service": "RAGInferenceService"
+            "service": self.service
         }
-        # Add exception info if it exists
+        for name in EXTRA_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                log_record[name] = value
+        # Add exception info if it exists (already rendered to exc_text when queued)
         if record.exc_info:
             log_record['exception'] = self.formatException(record.exc_info)
-        return json.dumps(log_record)
+        elif record.exc_text:
+            log_record['exception'] = record.exc_text
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            log_record['suppressed'] = suppressed
+        return _json_dumps(log_record)
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of records below `max_level` from loggers matching a prefix
+    in `rates` (longest prefix wins), e.g. {"src.answer_cache": 0.01}.
+    Warnings and errors always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float], max_level: int = logging.INFO):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.max_level = max_level
+        self._counters: Dict[str, float] = {}
+        self._rate_cache: Dict[str, Optional[float]] = {}
+
+    def _rate(self, name: str) -> Optional[float]:
+        if name not in self._rate_cache:
+            self._rate_cache[name] = next((rate for prefix, rate in self.rates
+                                           if name == prefix or name.startswith(prefix + ".")), None)
+        return self._rate_cache[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        rate = self._rate(record.name)
+        if rate is None or rate >= 1.0:
+            return True
+        # Deterministic 1-in-(1/rate) sampling: no random() call per record.
+        credit = self._counters.get(record.name, 0.0) + rate
+        if credit >= 1.0:
+            self._counters[record.name] = credit - 1.0
+            return True
+        self._counters[record.name] = credit
+        return False
+
+class RateLimitFilter(logging.Filter):
+    """
+    At most `max_per_interval` records per call site (logger and message
+    template) every `interval_s`; the next record let through carries the
+    number dropped in between as `suppressed`. Errors always pass.
+    """
+
+    def __init__(self, max_per_interval: int = 10, interval_s: float = 1.0, max_level: int = logging.WARNING):
+        super().__init__()
+        self.max_per_interval = max_per_interval
+        self.interval_s = interval_s
+        self.max_level = max_level
+        self._windows: Dict[Tuple[str, object], List] = {}  # key -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, record.msg)
+        now = record.created
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval_s:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.max_per_interval:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records without blocking; when the queue is full the record is
+    dropped and counted instead. Only the message is rendered here, on a copy of
+    the record (so mutable args can't change later and other handlers still see
+    the original); JSON formatting happens on the listener thread.
+    """
 
-def configure_logging():
-    """Configures root logger for structured JSON logging."""
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        record = copy.copy(record)
+        record.message = record.msg = message
+        record.args = None
+        if record.exc_info:
+            # Tracebacks hold frames; render them now and let the frames go.
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # SimpleQueue is much cheaper than Queue; the bound is approximate but never blocks.
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+_traceback_formatter = logging.Formatter()
+_listener: Optional[logging.handlers.QueueListener] = None
+# logging module flags as they were before async mode turned them off.
+_saved_logging_flags: Optional[Tuple[object, bool, bool, bool]] = None
+
+@atexit.register
+def shutdown_logging():
+    """Stops the async log writer, if any, after it has written everything queued."""
+    global _listener, _saved_logging_flags
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _saved_logging_flags is not None:
+        (logging._srcfile, logging.logThreads, logging.logProcesses,
+         logging.logMultiprocessing) = _saved_logging_flags
+        _saved_logging_flags = None
+
+def configure_logging(async_mode: Optional[bool] = None, sample_rates: Optional[Dict[str, float]] = None,
+                      rate_limit_per_s: Optional[int] = None, queue_size: int = 10_000, stream=None):
+    """
+    Configures root logger for structured JSON logging.
+
+    With `async_mode` (default: LOG_ASYNC=1) records are handed to a bounded
+    queue and formatted and written by a background QueueListener, so logging
+    never blocks the event loop; records are dropped if the writer falls
+    `queue_size` behind. `sample_rates` and `rate_limit_per_s` (defaults:
+    LOG_SAMPLE_RATES, LOG_RATE_LIMIT_PER_S) thin out noisy loggers before
+    anything is queued.
+    """
+    global _listener, _saved_logging_flags
+    if async_mode is None:
+        async_mode = os.environ.get("LOG_ASYNC", "0") == "1"
+    if sample_rates is None and os.environ.get("LOG_SAMPLE_RATES"):
+        # e.g. "src.answer_cache=0.01,src.coalescing=0.1"
+        sample_rates = {name.strip(): float(rate) for name, rate in
+                        (item.split("=") for item in os.environ["LOG_SAMPLE_RATES"].split(","))}
+    if rate_limit_per_s is None and os.environ.get("LOG_RATE_LIMIT_PER_S"):
+        rate_limit_per_s = int(os.environ["LOG_RATE_LIMIT_PER_S"])
+    shutdown_logging()
     # Remove any existing handlers
     for handler in logging.root.handlers[:]:
         logging.root.removeHandler(handler)
         
-    handler = logging.StreamHandler()
+    handler = logging.StreamHandler(stream)
     handler.setFormatter(JsonFormatter())
+    if async_mode:
+        # The JSON records carry no caller/thread/process fields, so skip collecting them
+        # (the knobs the logging docs list under "Optimization"); shutdown_logging restores them.
+        _saved_logging_flags = (logging._srcfile, logging.logThreads, logging.logProcesses,
+                                logging.logMultiprocessing)
+        logging._srcfile = None
+        logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+        _listener = logging.handlers.QueueListener(queue.SimpleQueue(), handler, respect_handler_level=True)
+        _listener.start()
+        handler = _NonBlockingQueueHandler(_listener.queue, queue_size)
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+    if rate_limit_per_s:
+        handler.addFilter(RateLimitFilter(rate_limit_per_s))
     logging.basicConfig(level=logging.INFO, handlers=[handler])
+    return handler
 
 def get_trace_id() -> str:
     """Generates a unique trace ID."""
     return str(uuid4())
 
+@lru_cache(maxsize=None)
+def _cloudwatch_client():
+    """One client per process; building one per metric costs more than the call itself."""
+    return boto3.client('cloudwatch', config=Config(tcp_keepalive=True, retries={'max_attempts': 2, 'mode': 'standard'}))
+
+DEFAULT_NAMESPACE = 'RAGApplication'
+DEFAULT_DIMENSIONS = {'Service': 'RAGInferenceService'}
+
+# PutMetricData limits: 1000 datums and 1 MB per call, 150 distinct values per datum.
+MAX_DATUMS_PER_CALL = 1000
+MAX_REQUEST_BYTES = 1_000_000
+MAX_VALUES_PER_DATUM = 150
+# EMF allows at most 100 distinct values per metric per log line.
+MAX_EMF_VALUES = 100
+
+Dimensions = Tuple[Tuple[str, str], ...]
+
+@dataclass
+class MetricSeries:
+    """
+    One metric (name, unit, dimensions) aggregated over a flush interval: a
+    statistic set, plus for distributions a log-bucketed histogram of values.
+    """
+    name: str
+    unit: str
+    dimensions: Dimensions
+    count: int = 0
+    total: float = 0.0
+    minimum: float = math.inf
+    maximum: float = -math.inf
+    histogram: Optional[Dict[float, int]] = None
+
+    def add(self, value: float, bucket: Optional[float] = None):
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        if bucket is not None:
+            if self.histogram is None:
+                self.histogram = {}
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+class MetricsAggregator:
+    """
+    Thread-safe in-process aggregation. Recording a value is a dict update under
+    a lock; `drain` hands back everything recorded since the previous drain.
+    Distribution values are rounded to log-spaced buckets `relative_precision`
+    apart, which keeps percentiles within that error while bounding the number
+    of distinct values sent per flush.
+    """
+
+    def __init__(self, relative_precision: float = 0.02):
+        self._log_base = math.log1p(relative_precision)
+        self._series: Dict[Tuple[str, str, Dimensions], MetricSeries] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, value: float) -> float:
+        if value <= 0:
+            return value
+        return float(f"{math.exp(round(math.log(value) / self._log_base) * self._log_base):.4g}")
+
+    def record(self, name: str, value: float, unit: str, dimensions: Dimensions, distribution: bool = True):
+        bucket = self._bucket(value) if distribution else None
+        key = (name, unit, dimensions)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = MetricSeries(name, unit, dimensions)
+            series.add(value, bucket)
+
+    def drain(self) -> List[MetricSeries]:
+        with self._lock:
+            series, self._series = self._series, {}
+        return list(series.values())
+
+def _chunks(items: list, size: int) -> Iterator[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+class CloudWatchSink:
+    """Publishes aggregated series with PutMetricData, as few calls as the API limits allow."""
+
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, client=None, storage_resolution: int = 60):
+        self.namespace = namespace
+        self.client = client
+        self.storage_resolution = storage_resolution
+
+    def _datums(self, series: MetricSeries, timestamp: float) -> Iterator[dict]:
+        base = {
+            'MetricName': series.name,
+            'Unit': series.unit,
+            'Dimensions': [{'Name': k, 'Value': v} for k, v in series.dimensions],
+            'Timestamp': timestamp,
+            'StorageResolution': self.storage_resolution,
+        }
+        if series.histogram:
+            # Values/Counts keep the distribution, so CloudWatch percentiles stay meaningful.
+            buckets = sorted(series.histogram.items())
+            for part in _chunks(buckets, MAX_VALUES_PER_DATUM):
+                yield {**base, 'Values': [v for v, _ in part], 'Counts': [float(c) for _, c in part]}
+        else:
+            yield {**base, 'StatisticValues': {'SampleCount': float(series.count), 'Sum': series.total,
+                                               'Minimum': series.minimum, 'Maximum': series.maximum}}
+
+    def publish(self, series: List[MetricSeries], timestamp: float):
+        client = self.client or _cloudwatch_client()
+        batch, batch_bytes = [], 0
+        for datum in (d for s in series for d in self._datums(s, timestamp)):
+            size = len(json.dumps(datum, default=str))
+            if batch and (len(batch) >= MAX_DATUMS_PER_CALL or batch_bytes + size > MAX_REQUEST_BYTES // 2):
+                # Half the byte limit: the query-protocol encoding is larger than JSON.
+                client.put_metric_data(Namespace=self.namespace, MetricData=batch)
+                batch, batch_bytes = [], 0
+            batch.append(datum)
+            batch_bytes += size
+        if batch:
+            client.put_metric_data(Namespace=self.namespace, MetricData=batch)
+
+class EmfSink:
+    """
+    Writes series as CloudWatch Embedded Metric Format log lines; the CloudWatch
+    agent, Lambda or awslogs turns them into metrics, so no API calls are made.
+    """
+
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, stream=None, storage_resolution: int = 60):
+        self.namespace = namespace
+        self.stream = stream
+        self.storage_resolution = storage_resolution
+
+    def _values(self, series: MetricSeries) -> Iterator[object]:
+        """One metric value per log line: Values/Counts for distributions, a plain sum for counters."""
+        if not series.histogram:
+            # Counters and other statistic-set series are summed into one value.
+            yield series.total
+            return
+        parts = list(_chunks(sorted(series.histogram.items()), MAX_EMF_VALUES))
+        for part in parts:
+            value = {'Values': [v for v, _ in part], 'Counts': [float(c) for _, c in part]}
+            if len(parts) == 1:
+                value.update(Max=series.maximum, Min=series.minimum, Count=float(series.count), Sum=series.total)
+            else:
+                # Each line covers only its buckets, so its statistics come from them.
+                value.update(Max=part[-1][0], Min=part[0][0], Count=float(sum(c for _, c in part)),
+                             Sum=sum(v * c for v, c in part))
+            yield value
+
+    def _line(self, series: MetricSeries, value: object, timestamp: float) -> str:
+        metric = {'Name': series.name, 'Unit': series.unit}
+        if self.storage_resolution == 1:
+            metric['StorageResolution'] = 1
+        record = {
+            '_aws': {
+                'Timestamp': int(timestamp * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [[k for k, _ in series.dimensions]],
+                    'Metrics': [metric],
+                }],
+            },
+            **dict(series.dimensions),
+            series.name: value,
+        }
+        return json.dumps(record)
+
+    def publish(self, series: List[MetricSeries], timestamp: float):
+        stream = self.stream or sys.stdout
+        lines = [self._line(s, value, timestamp) for s in series for value in self._values(s)]
+        if lines:
+            stream.write('\n'.join(lines) + '\n')
+            stream.flush()
+
+class MetricsEmitter:
+    """
+    Records metrics in process and publishes them from a background thread every
+    `flush_interval_s` (and on `close`, registered at interpreter exit), so
+    emitting a metric never blocks the request path on I/O.
+    """
+
+    def __init__(self, sink, dimensions: Optional[Dict[str, str]] = None, flush_interval_s: float = 60.0,
+                 relative_precision: float = 0.02):
+        self.sink = sink
+        self.dimensions = dict(DEFAULT_DIMENSIONS if dimensions is None else dimensions)
+        self.flush_interval_s = flush_interval_s
+        self._aggregator = MetricsAggregator(relative_precision)
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _dimensions(self, extra: Optional[Dict[str, str]]) -> Dimensions:
+        merged = {**self.dimensions, **(extra or {})}
+        return tuple(sorted((k, str(v)) for k, v in merged.items()))
+
+    def record(self, name: str, value: float, unit: str = 'Milliseconds', dimensions: Optional[Dict[str, str]] = None):
+        """Adds one value to the metric's distribution (latencies, sizes, scores)."""
+        self._aggregator.record(name, value, unit, self._dimensions(dimensions), distribution=True)
+
+    def increment(self, name: str, value: float = 1, unit: str = 'Count', dimensions: Optional[Dict[str, str]] = None):
+        """Adds to a counter; only its sum, count, min and max are kept."""
+        self._aggregator.record(name, value, unit, self._dimensions(dimensions), distribution=False)
+
+    def flush(self):
+        with self._flush_lock:
+            series = self._aggregator.drain()
+            if not series:
+                return
+            try:
+                self.sink.publish(series, time.time())
+            except Exception as e:
+                # Log error but don't fail the main application path
+                logging.error(f"Failed to publish {len(series)} metric series: {e}")
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval_s):
+            self.flush()
+
+    def start(self) -> 'MetricsEmitter':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+_default_emitter: Optional[MetricsEmitter] = None
+_default_emitter_lock = threading.Lock()
+
+def get_metrics_emitter() -> MetricsEmitter:
+    """
+    The process-wide emitter, started on first use. METRICS_MODE selects the sink
+    ("api" for PutMetricData, the default, or "emf" for log lines) and
+    METRICS_FLUSH_INTERVAL_S the flush interval.
+    """
+    global _default_emitter
+    if _default_emitter is None:
+        with _default_emitter_lock:
+            if _default_emitter is None:
+                namespace = os.environ.get('METRICS_NAMESPACE', DEFAULT_NAMESPACE)
+                if os.environ.get('METRICS_MODE', 'api').lower() == 'emf':
+                    sink = EmfSink(namespace)
+                else:
+                    sink = CloudWatchSink(namespace)
+                interval = float(os.environ.get('METRICS_FLUSH_INTERVAL_S', '60'))
+                _default_emitter = MetricsEmitter(sink, flush_interval_s=interval).start()
+    return _default_emitter
+
 def emit_cloudwatch_metric(metric_name: str, value: float, unit: str = 'Milliseconds'):
-    """Emits a custom metric to CloudWatch."""
+    """Records a custom metric; it reaches CloudWatch with the next background flush."""
     try:
-        cloudwatch = boto3.client('cloudwatch')
-        cloudwatch.put_metric_data(
-            Namespace='RAGApplication',
-            MetricData=[
-                {
-                    'MetricName': metric_name,
-                    'Value': value,
-                    'Unit': unit,
-                    'Dimensions': [
-                        {
-                            'Name': 'Service',
-                            'Value': 'RAGInferenceService'
-                        }
-                    ]
-                },
-            ]
-        )
+        get_metrics_emitter().record(metric_name, value, unit)
     except Exception as e:
         # Log error but don't fail the main application path
-        logging.error(f"Failed to emit CloudWatch metric '{metric_name}': {e}")
\ No newline at end of file
+        logging.error(f"Failed to record CloudWatch metric '{metric_name}': {e}")
@@ -1,47 +1,225 @@
-import json
 import base64
+import binascii
+import gzip
+import json
 import logging
+import os
+import sqlite3
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+from . import quality_signals
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:  # stdlib json fallback
+    HAS_ORJSON = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:  # Parquet copies are disabled without pyarrow
+    HAS_PYARROW = False
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Columns of the Parquet copy; everything else goes into the "extra" JSON column.
+PARQUET_COLUMNS = ("timestamp", "level", "message", "trace_id", "service", "user_id", "processed_by")
+
+def _loads(data):
+    # orjson parses the decoded bytes directly, without an intermediate str.
+    return orjson.loads(data) if HAS_ORJSON else json.loads(data)
+
+def _dumps(obj) -> bytes:
+    return orjson.dumps(obj, default=str) if HAS_ORJSON else json.dumps(obj, default=str).encode('utf-8')
+
+class SqliteUserStore:
+    """
+    Read-only user attributes from a SQLite file shipped with the function (a
+    layer, or downloaded to /tmp), one row per user_id.
+    """
+
+    def __init__(self, path: str, table: str = "users"):
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._query = f"SELECT * FROM {table} WHERE user_id = ?"
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        row = self._conn.execute(self._query, (user_id,)).fetchone()
+        if row is None:
+            return None
+        return {k: row[k] for k in row.keys() if k != "user_id"}
+
+class CachedUserLookup:
+    """LRU in front of a user store; lives as long as the Lambda container, across invocations."""
+
+    def __init__(self, fetch: Callable[[str], Optional[Dict]], maxsize: int = 100_000):
+        # functools' C LRU; unknown users (None) are cached too.
+        self.get = lru_cache(maxsize=maxsize)(fetch)
+
+    def cache_info(self):
+        return self.get.cache_info()
+
+class LogProcessor:
+    """
+    Transforms one Firehose batch. Records are either JSON log lines or, when
+    they come from a CloudWatch Logs subscription, gzipped DATA_MESSAGE
+    envelopes whose logEvents are expanded into one output line each
+    (CONTROL_MESSAGE records are dropped). Static enrichment is computed once;
+    per-user enrichment goes through the cached lookup.
+    """
+
+    def __init__(self, function_name: str, user_lookup: Optional[CachedUserLookup] = None,
+                 output_format: str = "json"):
+        if output_format not in ("json", "ndjson"):
+            raise ValueError(f"Unknown output format '{output_format}'.")
+        self.function_name = function_name
+        self.user_lookup = user_lookup
+        # "json" keeps the original one-object-per-record output; "ndjson" ends every
+        # event with a newline, so archived objects can be queried with Athena/S3 Select.
+        self.separator = b"\n" if output_format == "ndjson" else b""
+
+    def enrich(self, log_data: Dict) -> Dict:
+        log_data['processed_by'] = self.function_name
+        user_id = log_data.get('user_id')
+        if self.user_lookup is not None and user_id:
+            user = self.user_lookup.get(str(user_id))
+            if user:
+                log_data['user'] = user
+        return log_data
+
+    def events(self, payload: bytes) -> Optional[List[Dict]]:
+        """The enriched log events in one decoded record, or None if it should be dropped."""
+        if payload[:2] == GZIP_MAGIC:
+            envelope = _loads(gzip.decompress(payload))
+            if envelope.get('messageType') != 'DATA_MESSAGE':
+                return None
+            events = []
+            for log_event in envelope['logEvents']:
+                try:
+                    log_data = _loads(log_event['message'])
+                    if not isinstance(log_data, dict):
+                        raise ValueError("not a JSON object")
+                except ValueError:
+                    # Plain-text lines (e.g. from the runtime) are kept as messages.
+                    log_data = {'message': log_event['message']}
+                log_data.setdefault('log_event_id', log_event.get('id'))
+                events.append(self.enrich(log_data))
+            return events
+        return [self.enrich(_loads(payload))]
+
+    def process(self, records: List[Dict]):
+        """Returns the Firehose output records and all successfully processed events."""
+        output_records, all_events = [], []
+        separator = self.separator
+        for record in records:
+            try:
+                # Decode the payload from Firehose
+                events = self.events(binascii.a2b_base64(record['data']))
+                if events is None:
+                    output_records.append({'recordId': record['recordId'], 'result': 'Dropped', 'data': record['data']})
+                    continue
+                data = b"\n".join([_dumps(event) for event in events]) + separator
+                output_records.append({
+                    'recordId': record['recordId'],
+                    'result': 'Ok',
+                    'data': base64.b64encode(data).decode('ascii')
+                })
+                all_events.extend(events)
+            except Exception as e:
+                logger.error(f"Failed to process record {record['recordId']}: {e}")
+                output_records.append({
+                    'recordId': record['recordId'],
+                    'result': 'ProcessingFailed',
+                    'data': record['data'] # Return original data on failure
+                })
+        return output_records, all_events
+
+def events_to_parquet(events: List[Dict]) -> bytes:
+    """One Parquet file (zstd) with the common log fields as columns and the rest as JSON."""
+    columns = {name: [] for name in PARQUET_COLUMNS}
+    extra = []
+    for event in events:
+        for name in PARQUET_COLUMNS:
+            value = event.get(name)
+            columns[name].append(None if value is None else str(value))
+        rest = {k: v for k, v in event.items() if k not in columns}
+        extra.append(_dumps(rest).decode('utf-8') if rest else None)
+    table = pa.table({**columns, "extra": extra})
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression="zstd")
+    return sink.getvalue().to_pybytes()
+
+_processor: Optional[LogProcessor] = None
+
+def _get_processor(context) -> LogProcessor:
+    """Built once per container, so the user cache and store connection survive across invocations."""
+    global _processor
+    if _processor is None:
+        function_name = (getattr(context, 'function_name', None)
+                         or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'log-processor'))
+        user_lookup = None
+        if os.environ.get('USER_STORE_PATH'):
+            store = SqliteUserStore(os.environ['USER_STORE_PATH'])
+            user_lookup = CachedUserLookup(store.get, int(os.environ.get('USER_CACHE_SIZE', '100000')))
+        _processor = LogProcessor(function_name, user_lookup, os.environ.get('OUTPUT_FORMAT', 'json'))
+    return _processor
+
+_quality_stage: Optional[quality_signals.QualityStage] = None
+
+def _get_quality_stage() -> Optional[quality_signals.QualityStage]:
+    global _quality_stage
+    if _quality_stage is None and float(os.environ.get('QUALITY_SAMPLE_RATE', '0')) > 0:
+        _quality_stage = quality_signals.QualityStage.from_env()
+    return _quality_stage
+
+def _write_parquet_copy(events: List[Dict], bucket: str):
+    if not HAS_PYARROW:
+        logger.error("PARQUET_BUCKET is set but pyarrow is not installed; skipping the Parquet copy.")
+        return
+    import boto3
+
+    key = time.strftime('%Y/%m/%d/%H/', time.gmtime()) + f"logs-{time.time_ns()}.parquet"
+    boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=events_to_parquet(events))
+
 def handler(event, context):
     """
     Processes logs from Kinesis Firehose, enriches them,
     and returns them for storage in S3.
     """
-    output_records = []
+    processor = _get_processor(context)
+    # 1. PARSE and 2. ENRICH: processed_by, plus user attributes from the
+    #    cached local user store (USER_STORE_PATH) for logs with a user_id.
+    output_records, events = processor.process(event['records'])
 
-    for record in event['records']:
-        try:
-            # Decode the payload from Firehose
-            payload_decoded = base64.b64decode(record['data']).decode('utf-8')
-            log_data = json.loads(payload_decoded)
-
-            # 1. PARSE: The data is already structured JSON.
-            # 2. ENRICH: Add additional metadata.
-            #    (e.g., lookup user details from a DB using log_data['user_id'])
-            log_data['processed_by'] = context.function_name
-            
-            # 3. AGGREGATE/ANALYZE (Example):
-            # In a more complex scenario, you could send a sample of responses
-            # to another service (e.g., an LLM-as-a-judge) here to calculate a
-            # groundedness score before archiving.
-            
-            processed_payload = json.dumps(log_data).encode('utf-8')
-            
-            output_records.append({
-                'recordId': record['recordId'],
-                'result': 'Ok',
-                'data': base64.b64encode(processed_payload).decode('utf-8')
-            })
+    # 3. AGGREGATE/ANALYZE: per-variant latency windows, plus LLM-as-a-judge
+    #    groundedness for a hash-sampled subset of responses, judged concurrently
+    #    within a fixed time budget (QUALITY_SAMPLE_RATE enables it).
+    #    Failures here (including bad configuration) never fail the batch.
+    try:
+        quality_stage = _get_quality_stage()
+        if quality_stage is not None and events:
+            budget_s = float(os.environ.get('QUALITY_BUDGET_S', '5'))
+            if hasattr(context, 'get_remaining_time_in_millis'):
+                # Leave room to return the batch to Firehose.
+                budget_s = min(budget_s, context.get_remaining_time_in_millis() / 1000 - 10)
+            if budget_s > 0:
+                quality_stage.run(events, budget_s)
+    except Exception as e:
+        logger.error(f"Quality evaluation failed for {len(events)} events: {e}")
 
+    # Optional columnar copy of the whole batch for cheaper Athena queries.
+    parquet_bucket = os.environ.get('PARQUET_BUCKET')
+    if parquet_bucket and events:
+        try:
+            _write_parquet_copy(events, parquet_bucket)
         except Exception as e:
-            logger.error(f"Failed to process record {record['recordId']}: {e}")
-            output_records.append({
-                'recordId': record['recordId'],
-                'result': 'ProcessingFailed',
-                'data': record['data'] # Return original data on failure
-            })
-
-    return {'records': output_records}
\ No newline at end of file
+            logger.error(f"Failed to write Parquet copy of {len(events)} events: {e}")
+
+    return {'records': output_records}
@@ -0,0 +1,500 @@
+"""
+Quality signals for the log pipeline: sampled LLM-as-a-judge groundedness and
+per-variant latency, aggregated over time windows.
+
+Responses are sampled by a hash of their trace ID (or query and answer), so a
+given response is either always or never judged, in every Lambda container
+and on retries. Judge calls run concurrently, at most `max_concurrency` at a
+time, and whatever has not finished by the deadline is skipped, so judging
+adds a bounded amount of time to a batch. Scores are cached per (query, answer
+hash). Latencies and scores go into per-variant time windows, each holding
+t-digests. Closed windows are written as Embedded Metric Format lines with
+percentiles (events arriving after that are written as a further line for the
+same window), and the serialized digests can be merged across containers and
+lines, so dashboards never rescan raw logs.
+
+Events are the processed log records, i.e. the inference service's per-response
+"RAG response" lines. Every event with a `total_ms` (or `latency_ms`) counts
+towards latency; those that also have a `query` and an `answer` can be judged
+against their `context` (text or a list of passages). `variant`, `trace_id` and
+`timestamp` are used when present.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Protocol, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAMESPACE = 'RAGApplication'
+
+
+def should_sample(key: str, rate: float) -> bool:
+    """Deterministic sampling: the same key gets the same decision everywhere."""
+    if rate >= 1.0:
+        return True
+    if rate <= 0.0:
+        return False
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64 < rate
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning) with the k1 scale function: tens to a few
+    hundred centroids summarize any number of values, with error smallest at the tails.
+    Digests merge, so windows and containers can be combined.
+    """
+
+    def __init__(self, compression: float = 100.0):
+        self.compression = compression
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self.count = 0.0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer: List[Tuple[float, float]] = []
+
+    def add(self, value: float, weight: float = 1.0):
+        self._buffer.append((value, weight))
+        self.count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        other._compress()
+        self._buffer.extend(zip(other.means, other.weights))
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _q(self, k: float) -> float:
+        return (math.sin(min(k, self.compression / 4) * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in points)
+        means, weights = [], []
+        mean, weight = points[0]
+        weight_before = 0.0
+        q_limit = self._q(self._k(0.0) + 1)
+        for next_mean, next_weight in points[1:]:
+            if (weight_before + weight + next_weight) / total <= q_limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                weight_before += weight
+                q_limit = self._q(self._k(weight_before / total) + 1)
+                mean, weight = next_mean, next_weight
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else math.nan
+
+    def quantile(self, q: float) -> float:
+        self._compress()
+        if not self.means:
+            return math.nan
+        if len(self.means) == 1:
+            return self.means[0]
+        target = q * self.count
+        # Interpolate between centroid centres; the ends interpolate towards min/max.
+        if target < self.weights[0] / 2:
+            return self.min + (self.means[0] - self.min) * target / (self.weights[0] / 2)
+        if target > self.count - self.weights[-1] / 2:
+            tail = self.weights[-1] / 2
+            return self.means[-1] + (self.max - self.means[-1]) * (target - (self.count - tail)) / tail
+        cumulative = self.weights[0] / 2
+        for i in range(len(self.means) - 1):
+            step = (self.weights[i] + self.weights[i + 1]) / 2
+            if target <= cumulative + step:
+                return self.means[i] + (self.means[i + 1] - self.means[i]) * (target - cumulative) / step
+            cumulative += step
+        return self.means[-1]
+
+    def to_dict(self) -> Dict:
+        self._compress()
+        return {"compression": self.compression, "count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+                "centroids": [[round(m, 4), w] for m, w in zip(self.means, self.weights)]}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TDigest":
+        digest = cls(data["compression"])
+        digest.means = [m for m, _ in data["centroids"]]
+        digest.weights = [w for _, w in data["centroids"]]
+        digest.count, digest.sum = data["count"], data["sum"]
+        digest.min, digest.max = data["min"], data["max"]
+        return digest
+
+
+@dataclass
+class WindowStats:
+    """One variant's signals in one window."""
+    start: float
+    latency_ms: TDigest = field(default_factory=TDigest)
+    groundedness: TDigest = field(default_factory=TDigest)
+    responses: int = 0
+
+    def merge(self, other: "WindowStats") -> "WindowStats":
+        self.latency_ms.merge(other.latency_ms)
+        self.groundedness.merge(other.groundedness)
+        self.responses += other.responses
+        return self
+
+    def summary(self) -> Dict:
+        judged = self.groundedness.count
+        return {
+            "responses": self.responses,
+            "latency_ms": {f"p{q}": self.latency_ms.quantile(q / 100) for q in (50, 90, 99)}
+            if self.latency_ms.count else {},
+            "judged": int(judged),
+            "groundedness_mean": self.groundedness.mean() if judged else None,
+            "groundedness_p10": self.groundedness.quantile(0.10) if judged else None,
+        }
+
+
+class WindowedAggregates:
+    """
+    Per-variant tumbling windows of `window_s`, the last `retention` of which
+    are kept for rolling summaries. Firehose delivers events late, so a window
+    that has already been emitted can still receive data; that data is kept
+    apart and emitted with the next flush as a delta for the same window.
+    """
+
+    def __init__(self, window_s: float = 60.0, retention: int = 60):
+        self.window_s = window_s
+        self.retention = retention
+        self._windows: Dict[Tuple[str, float], WindowStats] = {}
+        # What each window received since it was last emitted.
+        self._unemitted: Dict[Tuple[str, float], WindowStats] = {}
+
+    def _window(self, variant: str, timestamp: float) -> Tuple[WindowStats, WindowStats]:
+        start = timestamp - timestamp % self.window_s
+        key = (variant, start)
+        stats = self._windows.get(key)
+        if stats is None:
+            stats = self._windows[key] = WindowStats(start)
+        delta = self._unemitted.get(key)
+        if delta is None:
+            delta = self._unemitted[key] = WindowStats(start)
+        return stats, delta
+
+    def record_latency(self, variant: str, latency_ms: float, timestamp: float):
+        for stats in self._window(variant, timestamp):
+            stats.latency_ms.add(latency_ms)
+            stats.responses += 1
+
+    def record_groundedness(self, variant: str, score: float, timestamp: float):
+        for stats in self._window(variant, timestamp):
+            stats.groundedness.add(score)
+
+    def rolling(self, variant: str, span_s: float, now: Optional[float] = None) -> WindowStats:
+        """All of `variant`'s windows overlapping the last `span_s`, merged."""
+        now = time.time() if now is None else now
+        merged = WindowStats(now - span_s)
+        for (v, start), stats in self._windows.items():
+            if v == variant and start > now - span_s - self.window_s:
+                merged.merge(stats)
+        return merged
+
+    def variants(self) -> List[str]:
+        return sorted({variant for variant, _ in self._windows})
+
+    def closed_windows(self, now: Optional[float] = None) -> List[Tuple[str, WindowStats]]:
+        """
+        For every window that has ended, what it received since it was last
+        returned (the whole window the first time); also drops expired windows.
+        """
+        now = time.time() if now is None else now
+        closed = []
+        for key in sorted(self._unemitted, key=lambda k: k[1]):
+            variant, start = key
+            if start + self.window_s <= now:
+                closed.append((variant, self._unemitted.pop(key)))
+        horizon = now - self.retention * self.window_s
+        for key in [k for k in self._windows if k[1] < horizon]:
+            del self._windows[key]
+        return closed
+
+
+def emf_line(variant: str, stats: WindowStats, window_s: float, namespace: str = DEFAULT_NAMESPACE) -> str:
+    """
+    One Embedded Metric Format record for a closed window (or a late delta of
+    one), with the digests for offline merging.
+    """
+    summary = stats.summary()
+    metrics, values = [], {}
+    for q, value in summary["latency_ms"].items():
+        name = f"LatencyP{q[1:]}"
+        metrics.append({"Name": name, "Unit": "Milliseconds"})
+        values[name] = value
+    if summary["groundedness_mean"] is not None:
+        metrics += [{"Name": "Groundedness", "Unit": "None"}, {"Name": "GroundednessP10", "Unit": "None"}]
+        values["Groundedness"] = summary["groundedness_mean"]
+        values["GroundednessP10"] = summary["groundedness_p10"]
+    metrics += [{"Name": "Responses", "Unit": "Count"}, {"Name": "JudgedResponses", "Unit": "Count"}]
+    values.update({"Responses": summary["responses"], "JudgedResponses": summary["judged"]})
+    return json.dumps({
+        "_aws": {
+            "Timestamp": int((stats.start + window_s) * 1000),
+            "CloudWatchMetrics": [{"Namespace": namespace, "Dimensions": [["Variant"]], "Metrics": metrics}],
+        },
+        "Variant": variant,
+        "window_start": stats.start,
+        "window_s": window_s,
+        **values,
+        "latency_digest": stats.latency_ms.to_dict(),
+        "groundedness_digest": stats.groundedness.to_dict(),
+    })
+
+
+class JudgeClient(Protocol):
+    async def judge(self, query: str, answer: str, context: str) -> float:
+        """Groundedness of `answer` in `context`, from 0 (unsupported) to 1 (fully supported)."""
+        ...
+
+
+JUDGE_PROMPT = """You are grading a product-search assistant. Rate how well the ANSWER is supported by the CONTEXT
+(1 = every claim is supported, 0 = none is). Reply with only a number between 0 and 1.
+
+QUESTION: {query}
+
+CONTEXT:
+{context}
+
+ANSWER: {answer}"""
+
+
+class BedrockJudge:
+    """
+    LLM-as-a-judge through the Bedrock Converse API (any model that supports it).
+    Calls run on the judge's own threads, not the event loop's default executor:
+    `asyncio.run` joins that executor on exit, so a call abandoned at the deadline
+    would still hold up the batch. Abandoned calls end at the client's read timeout.
+    """
+
+    def __init__(self, model_id: str, client=None, timeout_s: float = 10.0, max_workers: int = 8):
+        self.model_id = model_id
+        if client is None:
+            import boto3
+            from botocore.config import Config
+
+            client = boto3.client('bedrock-runtime', config=Config(
+                connect_timeout=min(timeout_s, 2.0), read_timeout=timeout_s,
+                retries={'mode': 'standard', 'total_max_attempts': 1},
+            ))
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='judge')
+
+    def _judge_sync(self, query: str, answer: str, context: str) -> float:
+        prompt = JUDGE_PROMPT.format(query=query, context=context, answer=answer)
+        response = self.client.converse(
+            modelId=self.model_id,
+            messages=[{"role": "user", "content": [{"text": prompt}]}],
+            inferenceConfig={"maxTokens": 8, "temperature": 0.0},
+        )
+        text = response["output"]["message"]["content"][0]["text"]
+        match = re.search(r"\d*\.?\d+", text)
+        if match is None:
+            raise ValueError(f"Judge returned no score: {text!r}")
+        return min(max(float(match.group()), 0.0), 1.0)
+
+    async def judge(self, query: str, answer: str, context: str) -> float:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._judge_sync, query, answer, context)
+
+
+class JudgeCache:
+    """LRU of judge scores keyed by (query, answer hash): repeated answers are judged once."""
+
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+    @staticmethod
+    def key(query: str, answer: str) -> Tuple[str, str]:
+        return query, hashlib.sha256(answer.encode('utf-8')).hexdigest()
+
+    def get(self, query: str, answer: str) -> Optional[float]:
+        key = self.key(query, answer)
+        score = self._entries.get(key)
+        if score is not None:
+            self._entries.move_to_end(key)
+        return score
+
+    def put(self, query: str, answer: str, score: float):
+        self._entries[self.key(query, answer)] = score
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+@lru_cache(maxsize=4096)
+def _parse_second(prefix: str) -> float:
+    return datetime.strptime(prefix, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+
+
+def event_time(event: Dict) -> float:
+    """Epoch seconds of a JsonFormatter record ("YYYY-mm-dd HH:MM:SS,mmm", UTC); now if absent."""
+    timestamp = event.get("timestamp")
+    if isinstance(timestamp, (int, float)):
+        return timestamp / 1000 if timestamp > 1e11 else float(timestamp)
+    if isinstance(timestamp, str) and len(timestamp) >= 19:
+        try:
+            millis = int(timestamp[20:23]) / 1000 if len(timestamp) >= 23 else 0.0
+            return _parse_second(timestamp[:19]) + millis
+        except ValueError:
+            pass
+    return time.time()
+
+
+class QualityEvaluator:
+    """Records every response's latency and judges a deterministic sample of them."""
+
+    def __init__(self, judge: JudgeClient, sample_rate: float = 0.05, max_concurrency: int = 4,
+                 cache: Optional[JudgeCache] = None, aggregates: Optional[WindowedAggregates] = None,
+                 judge_timeout_s: float = 10.0):
+        self.judge = judge
+        self.sample_rate = sample_rate
+        self.max_concurrency = max_concurrency
+        self.cache = cache if cache is not None else JudgeCache()
+        self.aggregates = aggregates if aggregates is not None else WindowedAggregates()
+        self.judge_timeout_s = judge_timeout_s
+        self.stats = {"responses": 0, "sampled": 0, "judged": 0, "cached": 0, "failed": 0, "skipped_deadline": 0}
+
+    async def _judge_one(self, slots: asyncio.Semaphore, query: str, answer: str, context: str) -> Optional[float]:
+        async with slots:
+            try:
+                score = await asyncio.wait_for(self.judge.judge(query, answer, context), self.judge_timeout_s)
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.warning(f"Judge call failed: {e}")
+                return None
+        self.stats["judged"] += 1
+        self.cache.put(query, answer, score)
+        return score
+
+    async def evaluate(self, events: List[Dict], deadline_s: Optional[float] = None) -> List[Dict]:
+        """
+        Aggregates the batch and returns the groundedness results that finished
+        within `deadline_s`; judge calls still running then are cancelled.
+        """
+        slots = asyncio.Semaphore(self.max_concurrency)
+        results, pending = [], {}
+        for event in events:
+            answer, query = event.get("answer"), event.get("query")
+            latency = event.get("total_ms", event.get("latency_ms"))
+            judgeable = bool(answer and query)
+            if latency is None and not judgeable:
+                continue
+            self.stats["responses"] += 1
+            variant = str(event.get("variant") or event.get("variant_version") or "unknown")
+            timestamp = event_time(event)
+            if latency is not None:
+                self.aggregates.record_latency(variant, float(latency), timestamp)
+            if not judgeable:
+                continue
+            if not should_sample(str(event.get("trace_id") or f"{query}\0{answer}"), self.sample_rate):
+                continue
+            self.stats["sampled"] += 1
+            result = {"trace_id": event.get("trace_id"), "variant": variant}
+            cached = self.cache.get(query, answer)
+            if cached is not None:
+                self.stats["cached"] += 1
+                self.aggregates.record_groundedness(variant, cached, timestamp)
+                results.append({**result, "groundedness": cached, "cached": True})
+                continue
+            context = event.get("context") or ""
+            if isinstance(context, list):
+                context = "\n\n".join(str(passage) for passage in context)
+            task = asyncio.create_task(self._judge_one(slots, query, answer, context))
+            pending[task] = (result, variant, timestamp)
+
+        if pending:
+            done, not_done = await asyncio.wait(pending, timeout=deadline_s)
+            for task in not_done:
+                task.cancel()
+            self.stats["skipped_deadline"] += len(not_done)
+            for task in done:
+                score = task.result()
+                if score is None:
+                    continue
+                result, variant, timestamp = pending[task]
+                self.aggregates.record_groundedness(variant, score, timestamp)
+                results.append({**result, "groundedness": score, "cached": False})
+        return results
+
+
+class QualityStage:
+    """
+    The evaluator plus EMF output, kept per Lambda container so windows and the
+    judge cache carry over between invocations.
+    """
+
+    def __init__(self, evaluator: QualityEvaluator, namespace: str = DEFAULT_NAMESPACE, stream=None):
+        self.evaluator = evaluator
+        self.namespace = namespace
+        self.stream = stream
+
+    @classmethod
+    def from_env(cls) -> "QualityStage":
+        max_concurrency = int(os.environ.get('QUALITY_MAX_CONCURRENCY', '4'))
+        if os.environ.get('QUALITY_JUDGE', 'bedrock') == 'fake':
+            from .fakes import FakeJudge
+
+            judge = FakeJudge()
+        else:
+            # Calls abandoned at the deadline keep a thread until they time out,
+            # so there are spare threads for the next batch.
+            judge = BedrockJudge(os.environ['QUALITY_JUDGE_MODEL_ID'],
+                                 timeout_s=float(os.environ.get('QUALITY_BUDGET_S', '5')),
+                                 max_workers=2 * max_concurrency)
+        evaluator = QualityEvaluator(
+            judge,
+            sample_rate=float(os.environ.get('QUALITY_SAMPLE_RATE', '0.05')),
+            max_concurrency=max_concurrency,
+            aggregates=WindowedAggregates(float(os.environ.get('QUALITY_WINDOW_S', '60'))),
+        )
+        return cls(evaluator)
+
+    def run(self, events: List[Dict], budget_s: float) -> List[Dict]:
+        """Judges the batch's sample within `budget_s`, then writes every window that has closed."""
+        results = asyncio.run(self.evaluator.evaluate(events, deadline_s=budget_s))
+        self.flush()
+        return results
+
+    def flush(self, now: Optional[float] = None):
+        aggregates = self.evaluator.aggregates
+        lines = [emf_line(variant, stats, aggregates.window_s, self.namespace)
+                 for variant, stats in aggregates.closed_windows(now)]
+        if lines:
+            stream = self.stream or sys.stdout
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
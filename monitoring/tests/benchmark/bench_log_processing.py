@@ -0,0 +1,126 @@
+"""
+Throughput of the Firehose log-processing Lambda on synthetic batches of
+JSON log records (~5 MB, the size Firehose hands the function), comparing the
+original per-record loop with the current processor in each output mode, with
+and without the cached user lookup, and the Parquet copy when pyarrow is
+installed.
+
+Run from monitoring/:
+    python -m tests.benchmark.bench_log_processing --batch-mb 5 --repeat 5
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from src import log_processing_lambda
+from src.log_processing_lambda import CachedUserLookup, LogProcessor, SqliteUserStore
+
+
+def baseline_handler(event, function_name):
+    """The per-record loop as it was before the rework (stdlib json, decode/encode via str)."""
+    output_records = []
+    for record in event['records']:
+        try:
+            payload_decoded = base64.b64decode(record['data']).decode('utf-8')
+            log_data = json.loads(payload_decoded)
+            log_data['processed_by'] = function_name
+            processed_payload = json.dumps(log_data).encode('utf-8')
+            output_records.append({'recordId': record['recordId'], 'result': 'Ok',
+                                   'data': base64.b64encode(processed_payload).decode('utf-8')})
+        except Exception:
+            output_records.append({'recordId': record['recordId'], 'result': 'ProcessingFailed', 'data': record['data']})
+    return {'records': output_records}
+
+
+def log_line(rng: random.Random, i: int) -> dict:
+    return {
+        "timestamp": "2025-08-08 10:00:00,123",
+        "level": rng.choice(["INFO"] * 9 + ["WARNING"]),
+        "message": f"RAG stage spend: {json.dumps({'total_ms': rng.uniform(300, 4000), 'stages': {'retrieval': {'ms': rng.uniform(20, 900), 'outcome': 'ok'}}})}",
+        "trace_id": f"{rng.getrandbits(128):032x}",
+        "service": "RAGInferenceService",
+        "user_id": f"user-{rng.randrange(5000)}",
+    }
+
+
+def make_batch(batch_bytes: int, cloudwatch: bool, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    records, size, i = [], 0, 0
+    while size < batch_bytes:
+        if cloudwatch:
+            events = [{"id": str(i + j), "timestamp": 0, "message": json.dumps(log_line(rng, i + j))} for j in range(20)]
+            payload = gzip.compress(json.dumps({"messageType": "DATA_MESSAGE", "logEvents": events}).encode('utf-8'))
+            i += 20
+        else:
+            payload = json.dumps(log_line(rng, i)).encode('utf-8')
+            i += 1
+        data = base64.b64encode(payload).decode('ascii')
+        records.append({'recordId': str(len(records)), 'data': data})
+        size += len(data)
+    return {'records': records}, size, i
+
+
+def user_store(path: str, users: int = 5000) -> SqliteUserStore:
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (user_id TEXT PRIMARY KEY, segment TEXT, country TEXT)")
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?)",
+                     [(f"user-{i}", ["outdoor", "fashion", "home"][i % 3], "DE") for i in range(users)])
+    conn.commit()
+    conn.close()
+    return SqliteUserStore(path)
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-mb", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(f"orjson: {log_processing_lambda.HAS_ORJSON}, pyarrow: {log_processing_lambda.HAS_PYARROW}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = user_store(os.path.join(tmp, "users.db"))
+        for cloudwatch in (False, True):
+            event, size, n_events = make_batch(int(args.batch_mb * 1e6), cloudwatch)
+            label = "CloudWatch envelopes" if cloudwatch else "JSON records"
+            print(f"\n{label}: {len(event['records'])} records, {n_events} log events, {size / 1e6:.1f} MB")
+
+            # The LRU lives as long as the container, so after the first batch it is warm (best of --repeat).
+            users = CachedUserLookup(store.get)
+            cases = {
+                "json": lambda: LogProcessor("bench").process(event['records']),
+                "ndjson": lambda: LogProcessor("bench", output_format="ndjson").process(event['records']),
+                "ndjson + user lookup (LRU)": lambda: LogProcessor(
+                    "bench", users, output_format="ndjson").process(event['records']),
+            }
+            if not cloudwatch:
+                # The original loop cannot unpack CloudWatch envelopes.
+                cases = {"baseline loop": lambda: baseline_handler(event, "bench"), **cases}
+            if log_processing_lambda.HAS_PYARROW:
+                _, events = LogProcessor("bench").process(event['records'])
+                cases["parquet copy of the batch"] = lambda: log_processing_lambda.events_to_parquet(events)
+
+            baseline_s = None
+            for name, fn in cases.items():
+                seconds = timed(fn, args.repeat)
+                baseline_s = baseline_s or seconds
+                print(f"  {name:28} {seconds * 1000:8.1f} ms  {n_events / seconds:10,.0f} events/s  "
+                      f"{size / 1e6 / seconds:6.1f} MB/s  x{baseline_s / seconds:4.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Per-call CPU cost of structured logging on the calling (event-loop) thread: the
+original synchronous StreamHandler with stdlib json, the same handler with the
+current JsonFormatter, and the async QueueHandler/QueueListener mode, plus the
+writer's own throughput. Output goes to a temporary file so terminal speed
+doesn't dominate.
+
+Run from monitoring/:
+    python -m tests.benchmark.bench_logging --records 50000
+"""
+import argparse
+import json
+import logging
+import tempfile
+import time
+
+from src import instrumentation_lib
+
+
+class BaselineJsonFormatter(logging.Formatter):
+    """The formatter as it was before the async logging mode."""
+
+    def format(self, record):
+        log_record = {
+            "timestamp": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", "N/A"),
+            "service": "RAGInferenceService"
+        }
+        if record.exc_info:
+            log_record['exception'] = self.formatException(record.exc_info)
+        return json.dumps(log_record)
+
+
+def run(name: str, records: int, configure) -> None:
+    handler = configure()
+    log = logging.getLogger("bench.search")
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    for i in range(records):
+        log.info("Search served for query '%s' in %.1fms", f"red running shoes {i % 100}", 812.4)
+    # CPU time of this thread only: what a log call costs the event loop, whatever the writer thread does.
+    caller_s = time.thread_time() - cpu_started
+    instrumentation_lib.shutdown_logging()  # waits for the writer to drain the queue
+    total_s = time.perf_counter() - started
+    dropped = getattr(handler, "dropped", 0)
+    print(f"{name:34} caller CPU {caller_s / records * 1e6:6.2f} us/record   "
+          f"written {(records - dropped) / total_s:10,.0f} records/s   dropped {dropped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50_000)
+    args = parser.parse_args()
+    print(f"orjson available: {instrumentation_lib.HAS_ORJSON}")
+
+    with tempfile.TemporaryFile("w") as stream:
+        def baseline():
+            for handler in logging.root.handlers[:]:
+                logging.root.removeHandler(handler)
+            handler = logging.StreamHandler(stream)
+            handler.setFormatter(BaselineJsonFormatter())
+            logging.basicConfig(level=logging.INFO, handlers=[handler])
+            return handler
+
+        cases = [
+            ("baseline (sync, stdlib json)", baseline),
+            ("sync, cached time + fast json", lambda: instrumentation_lib.configure_logging(
+                async_mode=False, stream=stream)),
+            ("async queue", lambda: instrumentation_lib.configure_logging(
+                async_mode=True, queue_size=args.records, stream=stream)),
+            ("async queue + 10% sampling", lambda: instrumentation_lib.configure_logging(
+                async_mode=True, queue_size=args.records, sample_rates={"bench.search": 0.1}, stream=stream)),
+        ]
+        for name, configure in cases:
+            run(name, args.records, configure)
+    logging.disable(logging.CRITICAL)
+
+
+if __name__ == "__main__":
+    main()
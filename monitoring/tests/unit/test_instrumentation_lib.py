@@ -0,0 +1,143 @@
+import io
+import json
+import logging
+import queue
+
+from src import instrumentation_lib
+from src.instrumentation_lib import CloudWatchSink, EmfSink, MetricsEmitter
+
+
+class FakeCloudWatch:
+    def __init__(self):
+        self.calls = []
+
+    def put_metric_data(self, Namespace, MetricData):
+        self.calls.append(MetricData)
+
+
+def test_emitter_aggregates_and_batches_put_metric_data():
+    """Many recorded values become a few datums, sent only when the emitter flushes."""
+    client = FakeCloudWatch()
+    emitter = MetricsEmitter(CloudWatchSink(client=client))
+
+    for i in range(1000):
+        emitter.record("SearchLatency", 100 + i % 50, dimensions={"Variant": "control"})
+    emitter.increment("CacheHit")
+    emitter.increment("CacheHit", 2)
+    assert client.calls == []
+
+    emitter.flush()
+    assert len(client.calls) == 1
+    datums = {d["MetricName"]: d for d in client.calls[0]}
+    latency = datums["SearchLatency"]
+    assert sum(latency["Counts"]) == 1000
+    assert len(latency["Values"]) < 50  # bucketed
+    assert {"Name": "Variant", "Value": "control"} in latency["Dimensions"]
+    assert datums["CacheHit"]["StatisticValues"] == {"SampleCount": 2.0, "Sum": 3, "Minimum": 1, "Maximum": 2}
+
+    emitter.flush()
+    assert len(client.calls) == 1  # nothing new to send
+
+
+def test_put_metric_data_respects_api_limits():
+    client = FakeCloudWatch()
+    emitter = MetricsEmitter(CloudWatchSink(client=client))
+    for i in range(2500):
+        emitter.increment(f"Metric{i}")
+    emitter.record("Wide", 1, dimensions=None)
+    for value in range(1, 100_000, 50):
+        emitter.record("Wide", value)
+    emitter.flush()
+
+    assert all(len(call) <= instrumentation_lib.MAX_DATUMS_PER_CALL for call in client.calls)
+    assert sum(len(call) for call in client.calls) > 2500
+    wide = [d for call in client.calls for d in call if d["MetricName"] == "Wide"]
+    assert all(len(d["Values"]) <= instrumentation_lib.MAX_VALUES_PER_DATUM for d in wide)
+    assert sum(sum(d["Counts"]) for d in wide) == 2001
+
+
+def test_emf_mode_writes_log_lines_and_publish_errors_are_swallowed():
+    stream = io.StringIO()
+    emitter = MetricsEmitter(EmfSink(stream=stream))
+    emitter.record("TTFT", 250.0)
+    emitter.record("TTFT", 250.0)
+    emitter.flush()
+
+    record = json.loads(stream.getvalue())
+    directive = record["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "RAGApplication"
+    assert directive["Metrics"] == [{"Name": "TTFT", "Unit": "Milliseconds"}]
+    assert directive["Dimensions"] == [["Service"]]
+    assert record["Service"] == "RAGInferenceService"
+    # Repeated values are sent once, with their count, rather than once per sample.
+    ttft = record["TTFT"]
+    assert ttft["Counts"] == [2.0] and abs(ttft["Values"][0] - 250) / 250 < 0.02
+    assert (ttft["Count"], ttft["Sum"], ttft["Min"], ttft["Max"]) == (2.0, 500.0, 250.0, 250.0)
+
+    class BrokenSink:
+        def publish(self, series, timestamp):
+            raise RuntimeError("throttled")
+
+    broken = MetricsEmitter(BrokenSink())
+    broken.record("TTFT", 1.0)
+    broken.flush()  # logged, not raised
+
+
+def test_background_thread_flushes_on_close():
+    client = FakeCloudWatch()
+    emitter = MetricsEmitter(CloudWatchSink(client=client), flush_interval_s=3600).start()
+    emitter.record("SearchLatency", 12.0)
+    emitter.close()
+    assert len(client.calls) == 1
+
+
+def test_async_logging_writes_json_lines_and_thins_noisy_loggers():
+    stream = io.StringIO()
+    flags = (logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing)
+    try:
+        instrumentation_lib.configure_logging(async_mode=True, sample_rates={"noisy": 0.25}, rate_limit_per_s=3,
+                                              stream=stream)
+        assert logging.logThreads is False
+        for i in range(8):
+            logging.getLogger("noisy.cache").info("hit %d", i)
+        for i in range(5):
+            logging.getLogger("search").info("served")
+        logging.getLogger("noisy.cache").error("redis down")
+        try:
+            raise ValueError("bad")
+        except ValueError:
+            logging.getLogger("search").exception("failed")
+    finally:
+        instrumentation_lib.shutdown_logging()
+        logging.root.handlers.clear()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    messages = [r["message"] for r in records]
+    assert messages == ["hit 3", "hit 7", "served", "served", "served", "redis down", "failed"]
+    assert set(records[0]) == {"timestamp", "level", "message", "trace_id", "service"}
+    assert "ValueError: bad" in records[-1]["exception"]
+    assert (logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing) == flags
+
+
+def test_queued_record_is_a_copy():
+    """Other handlers on the same logger still see the record's original message and args."""
+    handler = instrumentation_lib._NonBlockingQueueHandler(queue.SimpleQueue(), 10)
+    record = logging.LogRecord("search", logging.INFO, __file__, 1, "served %s", ("q1",), None)
+
+    queued = handler.prepare(record)
+
+    assert queued is not record and queued.msg == "served q1" and queued.args is None
+    assert (record.msg, record.args) == ("served %s", ("q1",))
+
+
+def test_rate_limit_reports_suppressed_records():
+    limiter = instrumentation_lib.RateLimitFilter(max_per_interval=2, interval_s=1.0)
+
+    def record(created):
+        r = logging.LogRecord("search", logging.INFO, __file__, 1, "slow query", None, None)
+        r.created = created
+        return r
+
+    assert [limiter.filter(record(100.0 + i * 0.1)) for i in range(5)] == [True, True, False, False, False]
+    later = record(101.5)
+    assert limiter.filter(later) and later.suppressed == 3
@@ -1,4 +1,5 @@
 import base64
+import gzip
 import json
 from src import log_processing_lambda
 
@@ -33,4 +34,41 @@ def test_lambda_handler_processes_records():
     processed_data_json = json.loads(processed_data_decoded)
     
     assert processed_data_json['trace_id'] == "123-abc"
-    assert 'processed_by' in processed_data_json
\ No newline at end of file
+    assert 'processed_by' in processed_data_json
+
+def _firehose_record(record_id, payload: bytes):
+    return {'recordId': record_id, 'data': base64.b64encode(payload).decode('ascii')}
+
+def test_processor_expands_cloudwatch_envelopes_and_enriches_users():
+    """CloudWatch Logs subscription records are gzipped envelopes; each log event becomes one NDJSON line."""
+    envelope = {
+        "messageType": "DATA_MESSAGE",
+        "logEvents": [
+            {"id": "1", "message": json.dumps({"message": "served", "user_id": "u1"})},
+            {"id": "2", "message": json.dumps({"message": "served", "user_id": "u1"})},
+            {"id": "3", "message": "START RequestId: abc"},
+        ],
+    }
+    control = {"messageType": "CONTROL_MESSAGE", "logEvents": []}
+    lookups = []
+
+    def fetch(user_id):
+        lookups.append(user_id)
+        return {"segment": "outdoor"}
+
+    processor = log_processing_lambda.LogProcessor(
+        "LogProcessorLambda-test", log_processing_lambda.CachedUserLookup(fetch, maxsize=10), output_format="ndjson")
+    records, events = processor.process([
+        _firehose_record('a', gzip.compress(json.dumps(envelope).encode('utf-8'))),
+        _firehose_record('b', gzip.compress(json.dumps(control).encode('utf-8'))),
+        _firehose_record('c', b'not json'),
+    ])
+
+    assert [r['result'] for r in records] == ['Ok', 'Dropped', 'ProcessingFailed']
+    lines = base64.b64decode(records[0]['data']).decode('utf-8').splitlines()
+    assert [json.loads(line)['log_event_id'] for line in lines] == ["1", "2", "3"]
+    assert json.loads(lines[0])['user'] == {"segment": "outdoor"}
+    assert json.loads(lines[2])['message'] == "START RequestId: abc"
+    assert all(e['processed_by'] == "LogProcessorLambda-test" for e in events)
+    assert lookups == ["u1"]  # second lookup served from the LRU
+    assert records[2]['data'] == base64.b64encode(b'not json').decode('ascii')
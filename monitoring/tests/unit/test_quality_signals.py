@@ -0,0 +1,162 @@
+import asyncio
+import base64
+import io
+import json
+import logging
+import random
+import time
+
+from src import log_processing_lambda, quality_signals
+from src.instrumentation_lib import JsonFormatter
+from src.fakes import FakeJudge
+from src.quality_signals import BedrockJudge, JudgeCache, QualityEvaluator, QualityStage, TDigest, WindowedAggregates
+
+
+def response(i, variant="control", answer=None):
+    return {"trace_id": f"t{i}", "variant": variant, "query": f"query {i}", "total_ms": 100 + i,
+            "answer": answer or f"The waterproof jacket {i} is lightweight",
+            "context": ["waterproof jacket, lightweight shell"], "timestamp": "2025-08-08 10:00:30,000"}
+
+
+def test_sampling_is_deterministic_and_judging_is_bounded_and_cached():
+    assert [quality_signals.should_sample(f"t{i}", 0.3) for i in range(50)] == \
+           [quality_signals.should_sample(f"t{i}", 0.3) for i in range(50)]
+    assert 2000 < sum(quality_signals.should_sample(f"t{i}", 0.3) for i in range(10_000)) < 4000
+
+    judge = FakeJudge(latency_s=0.01)
+    evaluator = QualityEvaluator(judge, sample_rate=1.0, max_concurrency=3, cache=JudgeCache())
+    events = [response(i) for i in range(12)]
+    results = asyncio.run(evaluator.evaluate(events))
+    assert len(results) == 12 and judge.max_in_flight == 3
+    assert all(r["groundedness"] == 1.0 for r in results)
+
+    # Same (query, answer) again: served from the cache, no new judge calls.
+    asyncio.run(evaluator.evaluate(events))
+    assert len(judge.calls) == 12 and evaluator.stats["cached"] == 12
+
+    # Calls still running at the deadline are skipped, not awaited.
+    slow = QualityEvaluator(FakeJudge(latency_s=1.0), sample_rate=1.0, max_concurrency=2)
+    assert asyncio.run(slow.evaluate([response(i) for i in range(4)], deadline_s=0.05)) == []
+    assert slow.stats["skipped_deadline"] == 4
+
+
+def test_service_response_records_feed_latency_and_groundedness():
+    def log_line(message, **fields):
+        record = logging.LogRecord("src.orchestrator", logging.INFO, __file__, 1, message, None, None)
+        record.__dict__.update(fields)
+        return json.loads(JsonFormatter().format(record))
+
+    events = [
+        log_line("RAG response", query="waterproof jacket", answer="It is waterproof", context=["waterproof shell"],
+                 variant="challenger", total_ms=420.0, answer_source="pipeline"),
+        # Replayed from the cache: timed, but nothing to judge it against.
+        log_line("RAG response", query="waterproof jacket", variant="challenger", total_ms=12.0,
+                 answer_source="answer_cache"),
+        log_line("Application startup complete."),
+    ]
+    evaluator = QualityEvaluator(FakeJudge(), sample_rate=1.0)
+
+    results = asyncio.run(evaluator.evaluate(events))
+
+    assert [r["variant"] for r in results] == ["challenger"]
+    window = evaluator.aggregates.rolling("challenger", span_s=10**10)
+    assert window.responses == 2 and window.groundedness.count == 1
+    assert evaluator.stats["responses"] == 2 and evaluator.stats["sampled"] == 1
+
+
+def test_windows_emit_emf_with_mergeable_digests():
+    rng = random.Random(0)
+    latencies = [rng.lognormvariate(6, 0.5) for _ in range(5000)]
+    aggregates = WindowedAggregates(window_s=60)
+    for i, latency in enumerate(latencies):
+        aggregates.record_latency("challenger", latency, timestamp=1_000_020 + i % 30)
+    aggregates.record_groundedness("challenger", 0.5, timestamp=1_000_020)
+    aggregates.record_groundedness("challenger", 1.0, timestamp=1_000_030)
+
+    stream = io.StringIO()
+    stage = QualityStage(QualityEvaluator(FakeJudge(), aggregates=aggregates), stream=stream)
+    stage.flush(now=1_000_050)
+    assert stream.getvalue() == ""  # window still open
+    stage.flush(now=1_000_100)
+    stage.flush(now=1_000_200)
+    [line] = stream.getvalue().splitlines()
+
+    record = json.loads(line)
+    assert record["Variant"] == "challenger" and record["Responses"] == 5000
+    assert record["Groundedness"] == 0.75 and record["JudgedResponses"] == 2
+    exact_p99 = sorted(latencies)[int(0.99 * len(latencies))]
+    assert abs(record["LatencyP99"] - exact_p99) / exact_p99 < 0.02
+    names = [m["Name"] for m in record["_aws"]["CloudWatchMetrics"][0]["Metrics"]]
+    assert "LatencyP99" in names and "Groundedness" in names
+
+    merged = TDigest.from_dict(record["latency_digest"]).merge(TDigest.from_dict(record["latency_digest"]))
+    assert merged.count == 10_000 and abs(merged.quantile(0.5) - record["LatencyP50"]) / record["LatencyP50"] < 0.01
+
+
+def test_late_events_for_an_emitted_window_are_emitted_as_a_delta():
+    aggregates = WindowedAggregates(window_s=60)
+    stream = io.StringIO()
+    stage = QualityStage(QualityEvaluator(FakeJudge(), aggregates=aggregates), stream=stream)
+
+    aggregates.record_latency("control", 100.0, timestamp=1_000_020)
+    stage.flush(now=1_000_100)
+    # Delivered after the window was written.
+    aggregates.record_latency("control", 300.0, timestamp=1_000_030)
+    stage.flush(now=1_000_110)
+    stage.flush(now=1_000_120)
+
+    first, late = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert first["window_start"] == late["window_start"]
+    assert (first["Responses"], late["Responses"]) == (1, 1)
+    assert late["LatencyP50"] == 300.0
+    assert aggregates.rolling("control", span_s=10**10, now=1_000_120).responses == 2
+
+
+def test_lambda_handler_runs_quality_stage_when_enabled(monkeypatch):
+    monkeypatch.setenv("QUALITY_SAMPLE_RATE", "1.0")
+    monkeypatch.setenv("QUALITY_JUDGE", "fake")
+    monkeypatch.setattr(log_processing_lambda, "_quality_stage", None)
+    # Without a timestamp the events fall into the current window.
+    records = [{k: v for k, v in response(i).items() if k != "timestamp"} for i in range(3)]
+    event = {"records": [{"recordId": str(i), "data": base64.b64encode(json.dumps(r).encode()).decode()}
+                         for i, r in enumerate(records)]}
+
+    result = log_processing_lambda.handler(event, {})
+
+    assert [r["result"] for r in result["records"]] == ["Ok"] * 3
+    stage = log_processing_lambda._quality_stage
+    assert stage.evaluator.stats["judged"] == 3
+    assert stage.evaluator.aggregates.rolling("control", span_s=10**10).responses == 3
+
+
+class BlockingConverseClient:
+    """A boto3-style client whose calls block their thread, like a slow Bedrock response."""
+
+    def __init__(self, latency_s):
+        self.latency_s = latency_s
+
+    def converse(self, **kwargs):
+        time.sleep(self.latency_s)
+        return {"output": {"message": {"content": [{"text": "0.9"}]}}}
+
+
+def test_blocking_judge_calls_do_not_outlast_the_budget():
+    judge = BedrockJudge("judge-model", client=BlockingConverseClient(latency_s=1.0))
+    stage = QualityStage(QualityEvaluator(judge, sample_rate=1.0), stream=io.StringIO())
+
+    started = time.perf_counter()
+    assert stage.run([response(i) for i in range(3)], budget_s=0.1) == []
+    assert time.perf_counter() - started < 0.5
+    assert stage.evaluator.stats["skipped_deadline"] == 3
+
+
+def test_lambda_handler_survives_missing_judge_configuration(monkeypatch):
+    monkeypatch.setenv("QUALITY_SAMPLE_RATE", "1.0")
+    monkeypatch.delenv("QUALITY_JUDGE", raising=False)
+    monkeypatch.delenv("QUALITY_JUDGE_MODEL_ID", raising=False)
+    monkeypatch.setattr(log_processing_lambda, "_quality_stage", None)
+    event = {"records": [{"recordId": "0", "data": base64.b64encode(json.dumps(response(0)).encode()).decode()}]}
+
+    result = log_processing_lambda.handler(event, {})
+
+    assert [r["result"] for r in result["records"]] == ["Ok"]